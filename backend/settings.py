@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     "rest_framework.authtoken",
@@ -51,6 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.TelemetryMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -94,6 +98,28 @@ DATABASES = {
    )
 }
 
+# Read replicas, comma separated URLs in DATABASE_REPLICA_URLS. Safe requests
+# read from them, see core.routers; a caller who wrote or was just given a
+# token reads from the primary for REPLICA_STICKY_SECONDS, which takes a cache
+# shared by the workers (see CACHES, checked as core.E001). A replica is checked every
+# REPLICA_HEALTH_INTERVAL seconds and skipped while it is down or (PostgreSQL)
+# more than REPLICA_MAX_LAG seconds behind. REPLICA_VIEW_ROUTING maps url
+# names to 'primary' or 'replica' to override the method based choice.
+# Tests mirror the replicas onto the test database, and core.test_runner adds
+# a `mirror` alias of it for the router tests. Locally a second database
+# with the same rows stands in for a replica (a copy of the SQLite file, or
+# createdb -T).
+DATABASE_REPLICAS = []
+for url in filter(None, map(str.strip, (os.getenv('DATABASE_REPLICA_URLS') or '').split(','))):
+    DATABASE_REPLICAS.append('replica%d' % (len(DATABASE_REPLICAS) + 1))
+    DATABASES[DATABASE_REPLICAS[-1]] = dict(dj_database_url.parse(url), TEST={'MIRROR': 'default'})
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter'] if DATABASE_REPLICAS else []
+REPLICA_STICKY_SECONDS = 5
+REPLICA_HEALTH_INTERVAL = 5
+REPLICA_MAX_LAG = 10
+REPLICA_VIEW_ROUTING = {}
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -114,6 +140,28 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# The first hasher hashes new passwords; hashes made by the others (or with
+# fewer iterations) are upgraded on the next successful login. argon2 needs
+# argon2-cffi and bcrypt needs bcrypt installed.
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+}
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER') or 'pbkdf2'
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER
+]
+
+# Threads checking passwords at login (default: one per core), logins allowed
+# to wait for one (default: 8 per thread) and seconds a login waits for a slot
+# before it is answered with 429
+LOGIN_HASH_WORKERS = None
+LOGIN_HASH_PENDING = None
+LOGIN_HASH_WAIT = 5
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -147,6 +195,36 @@ AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
 AWS_QUERYSTRING_AUTH = False
 AWS_BASE_URL = os.getenv('AWS_BASE_URL')
+AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME') or None
+# point boto3 at a local S3 stand-in (moto_server, MinIO) instead of AWS
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL') or None
+AWS_S3_MAX_POOL_CONNECTIONS = 50
+
+# Where uploaded images go: 's3', or 'filesystem' (IMAGE_STORAGE_ROOT, served
+# under IMAGE_STORAGE_URL) for local development and tests
+IMAGE_STORAGE_BACKEND = os.getenv('IMAGE_STORAGE_BACKEND') or 's3'
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
+IMAGE_STORAGE_ROOT = MEDIA_ROOT
+IMAGE_STORAGE_URL = os.getenv('IMAGE_STORAGE_URL') or 'http://localhost:8000' + MEDIA_URL
+# Uploads above the threshold are sent to S3 in parts of IMAGE_MULTIPART_CHUNK_SIZE
+IMAGE_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+IMAGE_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+IMAGE_MULTIPART_CONCURRENCY = 4
+# Largest direct upload, and seconds a client has to upload and confirm it
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+IMAGE_PRESIGN_EXPIRES = 900
+# Uploads are hashed while they are received, for content-addressed dedupe
+FILE_UPLOAD_HANDLERS = [
+    'core.api.utils.image.HashingMemoryFileUploadHandler',
+    'core.api.utils.image.HashingTemporaryFileUploadHandler',
+]
+# Resized copies generated in the background for every image (widths above
+# the original's are skipped; the original width is always included)
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 1280)
+IMAGE_DERIVATIVE_FORMATS = ('webp',)
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_PIPELINE_WORKERS = 2
 
 
 # Default primary key field type
@@ -158,11 +236,135 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 AUTH_USER_MODEL = 'core.User'
 
+# 'token' keeps the DRF tokens stored in authtoken_token; 'jwt' issues signed
+# access/refresh tokens verified without a database query. Switching to 'jwt'
+# logs out every client holding a DRF token, so it is opted into once the
+# clients handle access/refresh pairs. Revoked JWTs are remembered in the API
+# cache, which must be shared (file or Redis, see CACHES) for a revocation to
+# reach every worker
+AUTH_TOKEN_MODE = os.getenv('AUTH_TOKEN_MODE') or 'token'
+
+AUTHENTICATION_CLASSES = {
+    'jwt': 'core.api.authentication.StatelessJWTAuthentication',
+    'token': 'rest_framework.authentication.TokenAuthentication',
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        AUTHENTICATION_CLASSES[AUTH_TOKEN_MODE],
     ),
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer'
-    ]
+        'core.api.renderers.ORJSONRenderer',
+        'core.api.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.api.parsers.ORJSONParser',
+        'core.api.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    # clients written against token mode send "Token <key>"
+    'AUTH_HEADER_TYPES': ('Bearer', 'Token'),
+    'USER_ID_FIELD': 'id',
+    'USER_ID_CLAIM': 'user_id',
+}
+
+# Raise instead of logging when a view declared with @query_budget goes over
+QUERY_BUDGET_ENFORCE = DEBUG
+
+# Seconds before a worker reloads its in-memory question index for paper assembly
+PAPER_INDEX_MAX_AGE = 300
+
+# Seconds a pre-encoded examination paper, and a worker's answer key and item
+# bank of it, are kept. A change retires them at once through a counter in the
+# cache; with the per-process LocMemCache the other workers only let go of
+# theirs after this long
+PAPER_SNAPSHOT_TIMEOUT = 300
+
+# Rows fetched per round trip through the server-side cursor of streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Backend of the API response cache: the default in-process LocMemCache, a
+# shared FileBasedCache (CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache,
+# CACHE_LOCATION=/var/tmp/admissione-cache) or Redis through django-redis
+# (CACHE_BACKEND=django_redis.cache.RedisCache, CACHE_LOCATION=redis://host:6379/1).
+# The version counters retiring cached responses and ETags live there too, so
+# more than one worker needs a shared one (warned about as core.W001)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION') or 'admissione',
+    }
+}
+
+# Cache alias and lifetime (seconds) of cached list responses; entries are
+# retired early whenever a subject, topic, question or option changes
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# Cache-Control of the read endpoints that send ETags (core.api.utils.etags),
+# by url name. Every response is per caller, so private; no-cache lets the
+# browser keep it but revalidate each time, which costs a 304 at most.
+API_CACHE_CONTROL = {
+    'default': 'private, no-cache',
+    # rebuilt only when the paper changes
+    'exam_paper': 'private, max-age=60',
+    'image_detail': 'private, max-age=300',
 }
+
+# Key of the per-candidate question and option order of shuffled examinations
+# (core.api.utils.shuffle). Changing it reorders every paper, including those
+# of candidates in the middle of an examination.
+SHUFFLE_SECRET = os.getenv('SHUFFLE_SECRET') or SECRET_KEY
+
+# Adaptive examinations (core.api.utils.adaptive). Questions get a difficulty
+# from their share of correct answers once CAT_MIN_ATTEMPTS attempts are
+# graded, from their difficulty level before; all share CAT_DISCRIMINATION.
+# The next question is drawn among the CAT_RANDOMESQUE most informative ones
+# (1 always asks the best, higher spreads exposure). A test ends when the
+# ability's standard error is down to CAT_STOP_SE (None to only stop at the
+# examination's adaptive_length).
+CAT_DISCRIMINATION = 1.0
+CAT_MIN_ATTEMPTS = 30
+CAT_RANDOMESQUE = 5
+CAT_STOP_SE = 0.3
+
+# Autosaved answers are buffered per worker and written in batches every
+# AUTOSAVE_FLUSH_INTERVAL seconds, or once AUTOSAVE_MAX_PENDING attempts are
+# waiting. Each delta is appended to a log in AUTOSAVE_LOG_DIR first (set it
+# empty to buffer in memory only), fsynced when AUTOSAVE_FSYNC is on. Answers
+# a worker took before a submit still reach the attempt when it flushes, so
+# grading leaves attempts submitted in the last two intervals for later.
+AUTOSAVE_FLUSH_INTERVAL = 2
+AUTOSAVE_MAX_PENDING = 5000
+AUTOSAVE_LOG_DIR = os.getenv('AUTOSAVE_LOG_DIR', str(BASE_DIR / 'autosave'))
+AUTOSAVE_FSYNC = False
+
+# Per-request SQL, serializer, render and total timings, kept as per-view
+# histograms served in the Prometheus text format at v1/api/metrics/ (to
+# admins, or to scrapers sending "Authorization: Metrics <token>"). Under
+# gunicorn every worker writes its numbers to TELEMETRY_DIR at most every
+# TELEMETRY_FLUSH_INTERVAL seconds and the endpoint adds them up; clear the
+# directory when deploying. Without it a scrape only sees the worker serving it.
+TELEMETRY_ENABLED = True
+TELEMETRY_SERVER_TIMING = True
+TELEMETRY_DIR = os.getenv('TELEMETRY_DIR') or None
+TELEMETRY_FLUSH_INTERVAL = 5
+TELEMETRY_METRICS_TOKEN = os.getenv('TELEMETRY_METRICS_TOKEN') or None
+
+# Profile a fraction of requests (PROFILE_SAMPLE_RATE, 0 to 1) and any request
+# a staff user sends with an "X-Profile: 1" header. 'cprofile' writes pstats
+# files, 'sample' records the stack every PROFILE_SAMPLE_INTERVAL seconds into
+# collapsed stacks for flame graphs (no finer than sys.getswitchinterval()
+# while the request holds the GIL). The admin lists the profiles per view,
+# slowest first. An empty PROFILE_ENGINE takes the middleware out.
+PROFILE_ENGINE = os.getenv('PROFILE_ENGINE', 'cprofile')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE') or 0)
+PROFILE_SAMPLE_INTERVAL = 0.001
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_DIR = os.getenv('PROFILE_DIR') or str(BASE_DIR / 'profiles')
@@ -25,6 +25,9 @@ urlpatterns = [
     path('v1/api/file/', include('core.api.urls.file_urls')),
     path('v1/api/subject/', include('core.api.urls.subject_urls')),
     path('v1/api/question/', include('core.api.urls.question_urls')),
+    path('v1/api/exam/', include('core.api.urls.exam_urls')),
+    path('v1/api/cache/', include('core.api.urls.cache_urls')),
+    path('v1/api/metrics/', include('core.api.urls.telemetry_urls')),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import User, Questions, QuestionOptions
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import User, Questions, QuestionOptions, RequestProfile
+from .api.utils.profiling import profile_path, remove_profile
 
 class QuestionOptionsInline(admin.TabularInline):
     model = QuestionOptions
@@ -11,5 +15,56 @@ class QuestionsClassAdmin(admin.ModelAdmin):
     ordering = ['topic', 'difficulty_level']
     inlines = [QuestionOptionsInline]
 
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    The profiled requests, slowest first; filter by view to see where one
+    view spends its time.
+    """
+    list_display = ('view', 'method', 'path', 'status', 'duration_ms', 'queries', 'engine', 'created_at', 'download')
+    list_filter = ('view', 'engine', 'method')
+    ordering = ['-duration']
+    search_fields = ['path']
+
+    def duration_ms(self, obj):
+        return '%.1f' % (obj.duration * 1000)
+    duration_ms.short_description = 'Duration (ms)'
+    duration_ms.admin_order_field = 'duration'
+
+    def download(self, obj):
+        url = reverse('admin:core_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file)
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                 name='core_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = RequestProfile.objects.filter(pk=pk).first()
+        if profile is None or not self.has_view_permission(request, profile):
+            raise Http404
+        try:
+            return FileResponse(open(profile_path(profile.file), 'rb'), as_attachment=True, filename=profile.file)
+        except FileNotFoundError:
+            raise Http404
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def delete_model(self, request, obj):
+        remove_profile(obj.file)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for name in queryset.values_list('file', flat=True):
+            remove_profile(name)
+        super().delete_queryset(request, queryset)
+
 admin.site.register(Questions, QuestionsClassAdmin)
+admin.site.register(RequestProfile, RequestProfileAdmin)
 admin.site.register(User)
@@ -0,0 +1,174 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save
+from django.utils.functional import cached_property
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+
+from core.api.utils.cache import get_cache
+from core.routers import stick
+
+# copied from the user into every token, enough for the permission classes
+# and for the views that only need to know who is calling
+USER_CLAIMS = ('email', 'is_staff', 'is_admin', 'is_superuser')
+
+
+def jwt_enabled():
+    return getattr(settings, 'AUTH_TOKEN_MODE', 'token') == 'jwt'
+
+
+class ClaimsUser(TokenUser):
+    """
+    The caller as described by their access token, built without a query.
+    `instance` loads the User row for the few views that write to it.
+    """
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    @cached_property
+    def is_admin(self):
+        return self.token.get('is_admin', False)
+
+    @cached_property
+    def instance(self):
+        return get_user_model().objects.get(pk=self.id)
+
+    def __str__(self):
+        return self.email
+
+
+def get_request_user(request):
+    user = request.user
+    return user.instance if isinstance(user, ClaimsUser) else user
+
+
+def _revoked_key(jti):
+    return 'jwt:revoked:%s' % jti
+
+
+def _not_before_key(user_id):
+    return 'jwt:not-before:%s' % user_id
+
+
+def revoke_token(token):
+    """
+    Deny a token until it expires. Entries drop out of the cache on their own
+    once the token could not be used anyway, so the denylist only ever holds
+    tokens that are both revoked and still live.
+    """
+    remaining = int(token['exp'] - time.time()) + 1
+    if remaining > 0:
+        get_cache().set(_revoked_key(token[api_settings.JTI_CLAIM]), 1, remaining)
+
+
+def revoke_user(user_id):
+    """
+    Deny every token issued to a user so far, without knowing their ids.
+    """
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    get_cache().set(_not_before_key(user_id), int(time.time()) + 1, int(lifetime) + 1)
+
+
+def is_revoked(token):
+    # one cache round trip for both checks
+    revoked_key = _revoked_key(token.get(api_settings.JTI_CLAIM))
+    not_before_key = _not_before_key(token.get(api_settings.USER_ID_CLAIM))
+    found = get_cache().get_many([revoked_key, not_before_key])
+    if found.get(revoked_key):
+        return True
+    not_before = found.get(not_before_key)
+    return bool(not_before and token.get('iat', 0) < not_before)
+
+
+def refresh_token_for(user):
+    refresh = RefreshToken.for_user(user)
+    for claim in USER_CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    return refresh
+
+
+def issue_tokens(user):
+    """
+    Credentials handed out by login and registration: an access/refresh pair
+    in JWT mode, the user's DRF token otherwise. Their first reads go to the
+    primary, the replicas may not have the new user or token yet.
+    """
+    if not jwt_enabled():
+        try:
+            # usually select_related by the login query
+            tokens = {"token": user.auth_token.key}
+        except Token.DoesNotExist:
+            tokens = {"token": Token.objects.create(user=user).key}
+    else:
+        refresh = refresh_token_for(user)
+        tokens = {
+            "token": str(refresh.access_token),
+            "refresh": str(refresh),
+        }
+    if settings.DATABASE_REPLICAS:
+        # the Authorization headers the token can be sent in
+        keywords = api_settings.AUTH_HEADER_TYPES if jwt_enabled() else (TokenAuthentication.keyword,)
+        stick(*('%s %s' % (keyword, tokens["token"]) for keyword in keywords))
+    return tokens
+
+
+def refresh_tokens(raw_refresh):
+    """
+    Fresh tokens for a valid refresh token. The user is read again so a
+    changed role or a deactivated account is picked up here at the latest.
+    """
+    try:
+        refresh = RefreshToken(raw_refresh)
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+    if is_revoked(refresh):
+        raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+    user = get_user_model().objects.filter(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+    if user is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    # the old refresh token is spent
+    revoke_token(refresh)
+    return issue_tokens(user)
+
+
+def revoke_raw_token(raw_token):
+    try:
+        revoke_token(UntypedToken(raw_token))
+    except TokenError:
+        pass
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Verifies the access token's signature and expiry and checks the cached
+    denylist; the user comes from the token claims, so an authenticated
+    request costs no database query.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken('Token has been revoked')
+        return token
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        return ClaimsUser(validated_token)
+
+
+def revoke_inactive_user(sender, instance=None, **kwargs):
+    if not instance.is_active:
+        revoke_user(instance.pk)
+
+
+post_save.connect(revoke_inactive_user, sender=settings.AUTH_USER_MODEL)
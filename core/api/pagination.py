@@ -1,4 +1,12 @@
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import LimitOffsetPagination, BasePagination, _positive_int
+from rest_framework.exceptions import NotFound
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+import base64
+import hashlib
+import json
 import math
 
 
@@ -20,3 +28,196 @@ class SmallPagination(CustomPagination):
     default_limit = 10
     page_offset = 0
     offset_query_param = 'page_offset'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination with opaque cursors, on the primary key by default or on
+    the view's `keyset_ordering` (which must end with a unique field).
+
+    Pages are fetched with `WHERE pk > last_seen ORDER BY pk LIMIT n + 1`, so
+    their cost does not depend on how deep the client has paged. The total is
+    controlled by `count_mode`, or the view's `keyset_count_mode`:
+
+    - 'exact': a real COUNT(*) on every request (what CustomPagination does)
+    - 'cached': COUNT(*) cached for `count_cache_timeout` seconds
+    - 'estimate': the planner's row estimate from pg_class for unfiltered
+      querysets on PostgreSQL, the cached count otherwise
+    - None: no total at all, `count` and `pages` are returned as null
+
+    Clients still sending `page_offset` get that page through OFFSET once;
+    the cursors in the response let them keep going with seeks.
+    """
+    default_limit = 10
+    max_limit = 100
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    offset_query_param = 'page_offset'
+    ordering = ('pk',)
+    count_mode = 'exact'
+    count_cache_timeout = 60
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view):
+        ordering = getattr(view, 'keyset_ordering', None) or self.ordering
+        return tuple(ordering)
+
+    def get_count_mode(self, view):
+        return getattr(view, 'keyset_count_mode', self.count_mode)
+
+    def seek(self, ordering, key, backwards):
+        # (a, b) > (x, y) spelled out as a > x OR (a = x AND b > y), so mixed
+        # directions such as ('-rank', 'pk') work too
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, key):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != backwards else 'gt'
+            condition |= Q(**equal, **{'%s__%s' % (name, lookup): value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.queryset = queryset
+        self.count_mode = self.get_count_mode(view)
+        ordering = self.get_ordering(view)
+        reversed_ordering = tuple(
+            field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+        cursor = self.decode_cursor(request, queryset, ordering)
+        if cursor is not None:
+            direction, key, self.index = cursor
+            backwards = direction == 'p'
+            queryset = queryset.filter(self.seek(ordering, key, backwards)).order_by(
+                *(reversed_ordering if backwards else ordering))
+            rows = list(queryset[:self.limit + 1])
+        else:
+            direction = 'n'
+            offset = self.get_offset(request)
+            self.index = offset // self.limit
+            queryset = queryset.order_by(*ordering)
+            rows = list(queryset[offset:offset + self.limit + 1])
+
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if direction == 'p':
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            first, last = self.get_key(rows[0], ordering), self.get_key(rows[-1], ordering)
+            if has_more or direction == 'p':
+                self.next_cursor = self.encode_cursor('n', last, self.index + 1)
+            if self.index > 0 and (has_more or direction == 'n'):
+                self.previous_cursor = self.encode_cursor('p', first, self.index - 1)
+        return rows
+
+    def get_key(self, row, ordering):
+        return [getattr(row, field.lstrip('-')) for field in ordering]
+
+    def get_paginated_response(self, data):
+        count = self.get_count(self.queryset)
+        data["data"]["pagination"] = {
+            'index': self.index,
+            'next': self.next_cursor,
+            'previous': self.previous_cursor,
+            'limit': self.limit,
+            'offset': self.index * self.limit,
+            'count': count,
+            'pages': math.ceil(count / self.limit) if count is not None else None
+        }
+        return data
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.limit_query_param],
+                strict=True,
+                cutoff=self.max_limit
+            )
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def get_offset(self, request):
+        try:
+            return _positive_int(request.query_params[self.offset_query_param])
+        except (KeyError, ValueError):
+            return 0
+
+    def encode_cursor(self, direction, key, index):
+        payload = json.dumps({'d': direction, 'k': key, 'i': index}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, key, index = payload['d'], payload['k'], int(payload['i'])
+            if direction not in ('n', 'p') or not isinstance(key, list) or len(key) != len(ordering) or index < 0:
+                raise ValueError
+            key = self.coerce_key(queryset, ordering, key)
+        except (TypeError, ValueError, KeyError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+        return direction, key, index
+
+    def coerce_key(self, queryset, ordering, key):
+        # a cursor is client input, its values must fit the ordering fields
+        # (never null, the seek cannot compare nulls) before they reach the query
+        values = []
+        for field, value in zip(ordering, key):
+            name = field.lstrip('-')
+            if name in queryset.query.annotations:
+                model_field = queryset.query.annotations[name].output_field
+            elif name == 'pk':
+                model_field = queryset.model._meta.pk
+            else:
+                model_field = queryset.model._meta.get_field(name)
+            if value is None or isinstance(value, (list, dict)):
+                raise ValueError
+            values.append(model_field.to_python(value))
+        return values
+
+    def get_count(self, queryset):
+        if self.count_mode is None:
+            return None
+        if self.count_mode == 'exact':
+            return queryset.count()
+        if self.count_mode == 'estimate':
+            estimate = self.get_estimated_count(queryset)
+            if estimate is not None:
+                return estimate
+        return self.get_cached_count(queryset)
+
+    def get_cached_count(self, queryset):
+        sql = str(queryset.order_by().query)
+        key = 'pagination:count:%s' % hashlib.md5(sql.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def get_estimated_count(self, queryset):
+        # reltuples describes the whole table, so only use it when unfiltered
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # -1 (or 0 on old servers) until the table has been analyzed
+        if row is None or row[0] <= 0:
+            return None
+        return row[0]
+
+
+class SmallKeysetPagination(KeysetPagination):
+    default_limit = 10
@@ -0,0 +1,106 @@
+import csv
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Decimal, lazy strings, timedelta, querysets, ... as DRF's own encoder
+# handles them; orjson and msgpack only call this for types they don't know
+_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    return _encoder.default(obj)
+
+
+def encode_ndjson(rows):
+    for row in rows:
+        yield orjson.dumps(row, default=encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME) + b'\n'
+
+
+class _Echo:
+    # csv.writer target that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if isinstance(value, (list, dict)):
+        return orjson.dumps(value, default=encode_default).decode()
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return encode_default(value)
+
+
+def encode_csv(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields).encode()
+    for row in rows:
+        yield writer.writerow([_cell(row[field]) for field in fields]).encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson: the same output as DRF's (compact, UTF-8, with
+    U+2028/U+2029 escaped), several times faster on large pages. An indent
+    requested through the Accept header is honoured as two spaces.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        content = orjson.dumps(data, default=encode_default, option=options)
+        if b'\xe2\x80' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack, for clients sending `Accept: application/msgpack` (or
+    `?format=msgpack`). Smaller than JSON and cheaper to decode.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True, datetime=False)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON, one object per line. Streaming exports write
+    their own lines; this renders everything else (errors, mostly).
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(encode_ndjson(data if isinstance(data, list) else [data]))
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV with a header row, for exports. Nested values are written as JSON.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows else []
+        return b''.join(encode_csv(rows, fields))
@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
-from core.models import User, Subject, Image, Topics, Questions, QuestionOptions
-from django.db.models import Q
+from core.models import User, Subject, Image, ImageDerivative, Topics, Questions, QuestionOptions, Examination, ExaminationResult, DIFFICULTY_LEVEL, EXAM_TYPE
+from django.db import transaction
+from django.db.models import Prefetch
+from core.api.authentication import jwt_enabled
+from core.api.utils.passwords import verify_password
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -45,25 +48,22 @@ class UserLoginSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({'error': 'Database Error'})
 
     def validate(self, data):
-        user_obj = None
         email = data.get('email', None)
         password = data.get('password', None)
         if not email:
             raise serializers.ValidationError({"error": "Need to be filled"})
 
-        user = User.objects.filter(
-            Q(email=email)
-        ).distinct()
-        user = user.exclude(email__isnull=True).exclude(email__iexact='')
-        if user.exists() and user.count() == 1:
-            user_obj = user.first()
-        else:
+        # the user, their password hash and, in token mode, their token in one query
+        users = User.objects.all() if jwt_enabled() else User.objects.select_related('auth_token')
+        user_obj = users.filter(email=email).first()
+        # hashed in the bounded pool, also for unknown emails
+        valid = verify_password(user_obj, password)
+        if user_obj is None or not user_obj.is_active:
             raise serializers.ValidationError({"email": "Not valid"})
-        if user_obj:
-            if not user_obj.check_password(password):
-                raise serializers.ValidationError(
-                    {"password": "Incorrect credentials please try again"})
-                
+        if not valid:
+            raise serializers.ValidationError(
+                {"password": "Incorrect credentials please try again"})
+
         return user_obj
 
 
@@ -103,10 +103,24 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return obj.is_admin
      
 
+class ImageDerivativeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImageDerivative
+        fields = ('format', 'width', 'height', 'size', 'url')
+
+
 class ImageSerializer(serializers.ModelSerializer):
+    derivatives = ImageDerivativeSerializer(many=True, read_only=True)
+
     class Meta:
         model = Image
-        fields = ('_id', 'url', 'name', 'folder', 'created_at', 'updated_at')
+        fields = ('_id', 'url', 'name', 'folder', 'content_hash', 'width', 'height', 'derivatives', 'created_at', 'updated_at')
+
+
+class DirectUploadSerializer(serializers.Serializer):
+    folder = serializers.CharField(max_length=255)
+    file_name = serializers.CharField(max_length=255)
+    content_type = serializers.RegexField(r'^image/[\w.+-]+$', max_length=100)
 
 
 class TopicsSerializer(serializers.ModelSerializer):
@@ -117,9 +131,12 @@ class TopicsSerializer(serializers.ModelSerializer):
         fields = ["_id", "name", "subject"]
         depth = 1
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('subject')
+
     def get_subject(self, obj):
-        subject = Subject.objects.get(pk=obj.subject._id)
-        return subject.name
+        return obj.subject.name
 
 
 class SubjectSerializer(serializers.ModelSerializer):
@@ -130,6 +147,13 @@ class SubjectSerializer(serializers.ModelSerializer):
         fields = ["_id", "name", "topics"]
         depth = 1
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # the reverse prefetch also fills topic.subject, so nested
+        # TopicsSerializer.get_subject needs no extra query
+        return queryset.prefetch_related(
+            Prefetch('topics_set', queryset=Topics.objects.order_by('_id')))
+
     def get_topics(self, obj):
         items = obj.topics_set.all()
         serializer = TopicsSerializer(items, many=True)
@@ -155,15 +179,106 @@ class QuestionsSerializer(serializers.ModelSerializer):
         model = Questions
         fields = ["_id", "description", "options", "attachment", "topic", "difficulty_level", "marks_allotted"]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+            Prefetch('options', queryset=QuestionOptions.objects.order_by('pk')))
+
     def get__id(self, obj):
         return obj.pk if obj else None
 
     
     def create(self, validated_data):
         options_data = validated_data.pop("options")
-        question = Questions.objects.create(**validated_data)
-        for option_data in options_data:
-            QuestionOptions.objects.create(for_question=question, **option_data)
+        with transaction.atomic():
+            question = Questions.objects.create(**validated_data)
+            QuestionOptions.objects.bulk_create([
+                QuestionOptions(for_question=question, **option_data) for option_data in options_data
+            ])
         return question
 
-    
\ No newline at end of file
+
+class ExaminationSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Examination
+        fields = ["id", "exam_name", "exam_date", "difficulty_level", "full_marks", "max_time", "exam_type", "negative_marking", "partial_credit", "shuffle", "adaptive", "adaptive_length", "questions"]
+
+
+class PaperOptionSerializer(QuestionOptionsSerializer):
+    # what a candidate sees, without is_correct
+
+    class Meta:
+        model = QuestionOptions
+        fields = ["_id", "description", "attachment"]
+
+
+class PaperQuestionSerializer(QuestionsSerializer):
+    options = PaperOptionSerializer(read_only=True, many=True)
+
+    class Meta:
+        model = Questions
+        fields = ["_id", "description", "options", "attachment", "topic", "difficulty_level", "marks_allotted"]
+
+
+class PaperSerializer(serializers.ModelSerializer):
+    questions = PaperQuestionSerializer(read_only=True, many=True)
+
+    class Meta:
+        model = Examination
+        fields = ["id", "exam_name", "exam_date", "difficulty_level", "full_marks", "max_time", "exam_type", "negative_marking", "partial_credit", "shuffle", "adaptive", "adaptive_length", "questions"]
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # questions in the same (pk) order as the grading answer keys
+        return queryset.prefetch_related(Prefetch(
+            'questions',
+            queryset=QuestionsSerializer.setup_eager_loading(Questions.objects.order_by('pk'))))
+
+
+class PaperBlueprintSerializer(serializers.Serializer):
+    exam_name = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    exam_date = serializers.DateField(required=False, allow_null=True)
+    max_time = serializers.IntegerField(min_value=0, default=0)
+    exam_type = serializers.ChoiceField(choices=EXAM_TYPE, default='P')
+    difficulty_level = serializers.ChoiceField(choices=DIFFICULTY_LEVEL, required=False)
+    topics = serializers.ListField(child=serializers.CharField(max_length=6), allow_empty=False)
+    difficulty_mix = serializers.DictField(child=serializers.FloatField(min_value=0), allow_empty=False)
+    full_marks = serializers.IntegerField(min_value=1)
+    seed = serializers.IntegerField(required=False, allow_null=True)
+    shuffle = serializers.BooleanField(default=False)
+    adaptive = serializers.BooleanField(default=False)
+    adaptive_length = serializers.IntegerField(min_value=0, default=0)
+
+
+class ExaminationResultSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ExaminationResult
+        fields = ["id", "examination", "candidate", "score", "correct_count", "wrong_count", "unanswered_count", "ability", "ability_se", "submitted_at", "graded_at"]
+
+
+class ExaminationSubmitSerializer(serializers.Serializer):
+    # {"<question id>": [<option id>, ...]}, option positions as displayed
+    # for shuffled examinations; left out, the autosaved answers are submitted
+    answers = serializers.DictField(child=serializers.ListField(child=serializers.IntegerField()), required=False)
+    # the version of the shuffled paper the positions were read on
+    version = serializers.CharField(required=False)
+
+
+class ExaminationAdaptiveAnswerSerializer(serializers.Serializer):
+    # the question being asked and the option ids picked (positions for
+    # shuffled examinations), none to skip it
+    question = serializers.IntegerField()
+    answer = serializers.ListField(child=serializers.IntegerField(), allow_empty=True)
+    # the version the question was given with, for shuffled examinations
+    version = serializers.CharField(required=False)
+
+
+class ExaminationAutosaveSerializer(serializers.Serializer):
+    # only the questions changed since the last autosave
+    answers = serializers.DictField(child=serializers.ListField(child=serializers.IntegerField()))
+    # the version of the shuffled paper the positions were read on
+    version = serializers.CharField(required=False)
+    # increasing per attempt (a counter or a client timestamp), orders the deltas
+    seq = serializers.IntegerField(required=False, min_value=0)
@@ -0,0 +1,7 @@
+from django.urls import path
+from core.api.views import cache_views as views
+
+
+urlpatterns = [
+    path('stats/', views.CacheStatsView.as_view(), name='cache_stats'),
+]
@@ -0,0 +1,12 @@
+from django.urls import path
+from core.api.views import exam_views as views
+
+
+urlpatterns = [
+    path('generate/', views.ExaminationGenerateView.as_view(), name='exam_generate'),
+    path('results/export/', views.ExaminationResultsExportView.as_view(), name='exam_results_export'),
+    path('<int:pk>/paper/', views.ExaminationPaperView.as_view(), name='exam_paper'),
+    path('<int:pk>/autosave/', views.ExaminationAutosaveView.as_view(), name='exam_autosave'),
+    path('<int:pk>/submit/', views.ExaminationSubmitView.as_view(), name='exam_submit'),
+    path('<int:pk>/adaptive/', views.ExaminationAdaptiveView.as_view(), name='exam_adaptive'),
+]
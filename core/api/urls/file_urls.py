@@ -3,4 +3,8 @@ from core.api.views import file_views as views
 
 urlpatterns = [
     path('upload/', views.ImageUploadView.as_view(), name='upload_file'),
+    path('presign/', views.DirectUploadView.as_view(), name='upload_presign'),
+    path('confirm/', views.DirectUploadConfirmView.as_view(), name='upload_confirm'),
+    path('direct/<str:token>/', views.FileSystemUploadView.as_view(), name='upload_direct'),
+    path('<uuid:_id>/', views.ImageDetailView.as_view(), name='image_detail'),
 ]
\ No newline at end of file
@@ -5,6 +5,9 @@ from core.api.views import question_views as views
 urlpatterns = [
 
     path('', views.QuestionsListView.as_view(), name='question_list'),
+    path('search/', views.QuestionSearchView.as_view(), name='question_search'),
+    path('import/', views.QuestionImportView.as_view(), name='question_import'),
+    path('export/', views.QuestionsExportView.as_view(), name='question_export'),
     # path('<str:_id>/create/', views.QuestionsCreateView.as_view(), name='question_create'),
     # path('<str:_id>/update/', views.SubjectUpdateView.as_view(), name='question_update'),
     # path('<str:_id>/delete/', views.SubjectDeleteView.as_view(), name='question_delete'),
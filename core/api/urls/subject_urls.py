@@ -6,6 +6,7 @@ urlpatterns = [
 
     path('', views.SubjectsListView.as_view(), name='subject_list'),
     path('create/', views.SubjectCreateView.as_view(), name='subject_create'),
+    path('stats/', views.TaxonomyStatsView.as_view(), name='taxonomy_stats'),
     path('<str:_id>/update/', views.SubjectUpdateView.as_view(), name='subject_update'),
     path('<str:_id>/delete/', views.SubjectDeleteView.as_view(), name='subject_delete'),
 
@@ -0,0 +1,7 @@
+from django.urls import path
+from core.api.views import telemetry_views as views
+
+
+urlpatterns = [
+    path('', views.MetricsView.as_view(), name='metrics'),
+]
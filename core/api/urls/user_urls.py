@@ -7,9 +7,13 @@ urlpatterns = [
 
     path('register/', views.registerUser, name='register'),
 
+    path('token/refresh/', views.refreshToken, name='token-refresh'),
+    path('logout/', views.logout, name='logout'),
+
     path('me/', views.getUserProfile, name="users_profile"),
     path('profile/update/', views.updateUserProfile, name="user-profile-update"),
     path('', views.getUsers, name="users"),
+    path('export/', views.exportUsers, name="users-export"),
 
     path('<str:pk>/', views.getUserById, name='user'),
 
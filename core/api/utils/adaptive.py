@@ -0,0 +1,225 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from core.models import Examination, Questions, QuestionOptions
+from core.api.utils.grading import answer_keys
+from core.api.utils.shuffle import candidate_seed, mix
+from core.api.utils.snapshots import get_generation
+from core.routers import primary
+
+# abilities the estimates are computed on, with a standard normal prior
+GRID = np.linspace(-4, 4, 81)
+LOG_PRIOR = -GRID ** 2 / 2
+
+# item difficulty of a question nobody has answered yet
+LEVEL_DIFFICULTY = {
+    'LVL1': -2.0,
+    'LVL2': -1.0,
+    'LVL3': 0.0,
+    'LVL4': 1.0,
+    'LVL5': 2.0,
+}
+
+
+def item_parameters(levels, probabilities, attempts):
+    """
+    Discrimination and difficulty of a two-parameter logistic model per
+    question: CAT_DISCRIMINATION for all, the difficulty read from the share
+    of correct answers once a question has CAT_MIN_ATTEMPTS graded attempts
+    (as if those candidates were of average ability), from its difficulty
+    level until then.
+    """
+    a = np.full(len(levels), float(settings.CAT_DISCRIMINATION))
+    b = np.array([LEVEL_DIFFICULTY[level] for level in levels], dtype=np.float64)
+    p = np.clip(np.asarray(probabilities, dtype=np.float64), 0.02, 0.98)
+    observed = np.asarray(attempts) >= settings.CAT_MIN_ATTEMPTS
+    return a, np.where(observed, np.log((1 - p) / p) / a, b)
+
+
+class ItemBank:
+    """
+    The questions of an adaptive examination as item parameter arrays, in
+    the (pk) order of its answer key.
+
+    The next question is the one with the most information at the current
+    ability estimate, drawn among the CAT_RANDOMESQUE best so that no
+    question is shown to nearly every candidate of similar ability. The draw
+    is seeded by the candidate and step; the question picked is stored on
+    the result (pending_question), parameters loaded at another time may
+    pick another one.
+    """
+
+    def __init__(self, examination_id, question_ids, a, b, key=None, adaptive=True, length=0):
+        self.examination_id = examination_id
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.a = np.asarray(a, dtype=np.float64)
+        self.b = np.asarray(b, dtype=np.float64)
+        self.columns = {int(pk): column for column, pk in enumerate(question_ids)}
+        self.key = key
+        self.adaptive = adaptive
+        self.length = min(length, len(question_ids)) if length else len(question_ids)
+        self._information = self.a ** 2
+        self._ab = self.a * self.b
+        # log P(correct) and log P(wrong) of every question at every grid ability
+        p = 1 / (1 + np.exp(self._ab[:, None] - self.a[:, None] * GRID))
+        self.log_right = np.log(p)
+        self.log_wrong = np.log1p(-p)
+
+    @classmethod
+    def load(cls, examination):
+        with primary():
+            key = answer_keys.get(examination)
+            rows = {pk: row for pk, *row in Questions.objects.filter(pk__in=key.question_ids.tolist()).values_list(
+                'pk', 'difficulty_level', 'correct_answer_probability', 'attempt_count')}
+        question_ids = key.question_ids.tolist()
+        levels, probabilities, attempts = zip(*[rows[pk] for pk in question_ids]) if question_ids else ((), (), ())
+        a, b = item_parameters(levels, probabilities, attempts)
+        return cls(examination.pk, question_ids, a, b, key=key,
+                   adaptive=examination.adaptive, length=examination.adaptive_length)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def select(self, ability, administered, seed, step):
+        """
+        Column of the question to ask at `ability`, leaving out the
+        `administered` (boolean mask) ones. None once all were asked.
+        """
+        remaining = len(self) - step
+        if remaining <= 0:
+            return None
+        p = 1 / (1 + np.exp(self._ab - self.a * ability))
+        information = self._information * p * (1 - p)
+        information[administered] = -1
+        k = min(settings.CAT_RANDOMESQUE, remaining)
+        best = np.sort(np.argpartition(information, -k)[-k:])
+        draw = int(mix(seed, np.array([step], dtype=np.uint64))[0] % np.uint64(k))
+        return int(best[draw])
+
+    def estimate(self, columns, correct):
+        """
+        Expected a posteriori ability and its standard error after answering
+        the questions in `columns`, `correct` being a boolean array of them.
+        """
+        columns = np.asarray(columns, dtype=np.intp)
+        correct = np.asarray(correct, dtype=bool)
+        log_posterior = (LOG_PRIOR + self.log_right[columns[correct]].sum(axis=0)
+                         + self.log_wrong[columns[~correct]].sum(axis=0))
+        weights = np.exp(log_posterior - log_posterior.max())
+        weights /= weights.sum()
+        ability = float(weights @ GRID)
+        return ability, float(np.sqrt(weights @ (GRID - ability) ** 2))
+
+    def responses(self, answers):
+        """
+        Columns of the answered questions and whether each answer is right,
+        from {question id: [option ids]}. Partially right counts as wrong,
+        a skipped question too.
+        """
+        option_bits, key_correct = self.key.option_bits, self.key.correct
+        columns, correct = [], []
+        for question_id, selected in answers.items():
+            column = self.columns.get(int(question_id))
+            if column is None:
+                continue
+            bits = 0
+            for option_id in selected:
+                position = option_bits.get(option_id)
+                if position is not None and position[0] == column:
+                    bits |= position[1]
+            columns.append(column)
+            correct.append(bits != 0 and bits == key_correct[column])
+        return columns, correct
+
+    def finished(self, asked, ability_se):
+        stop_se = settings.CAT_STOP_SE
+        return asked >= self.length or (stop_se is not None and ability_se is not None and ability_se <= stop_se)
+
+    def next_question(self, candidate_id, answers, ability, ability_se):
+        """
+        Id of the question to ask a candidate with these answers and
+        estimate, None once the examination is over for them.
+        """
+        administered = np.zeros(len(self), dtype=bool)
+        for question_id in answers:
+            column = self.columns.get(int(question_id))
+            if column is not None:
+                administered[column] = True
+        asked = int(administered.sum())
+        if self.finished(asked, ability_se):
+            return None
+        column = self.select(0.0 if ability is None else ability, administered,
+                             candidate_seed(self.examination_id, candidate_id), asked)
+        return None if column is None else int(self.question_ids[column])
+
+
+class ItemBankCache:
+    """
+    Item banks loaded once per examination and process, dropped by the
+    signals below whenever a paper, question or option changes here, and
+    like answer keys (core.api.utils.grading) by the paper's snapshot
+    generation or after PAPER_SNAPSHOT_TIMEOUT seconds. Counters updated by
+    grading do not reload them, so the parameters stay put while candidates
+    are being tested.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._banks = {}
+
+    def get(self, examination_id):
+        generation = get_generation(examination_id)
+        entry = self._banks.get(examination_id)
+        if entry is not None and entry[0] == generation and time.monotonic() < entry[1]:
+            return entry[2]
+        with primary():
+            examination = Examination.objects.filter(pk=examination_id).first()
+        if examination is None:
+            return None
+        bank = ItemBank.load(examination)
+        expires = time.monotonic() + getattr(settings, 'PAPER_SNAPSHOT_TIMEOUT', 300)
+        with self._lock:
+            self._banks[examination_id] = (generation, expires, bank)
+        return bank
+
+    def discard(self, examination_id):
+        with self._lock:
+            self._banks.pop(examination_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._banks.clear()
+
+
+item_banks = ItemBankCache()
+
+
+def discard_item_bank(sender, instance=None, **kwargs):
+    item_banks.discard(instance.pk)
+
+
+def paper_changed(sender, instance=None, reverse=False, **kwargs):
+    if reverse:
+        for examination_id in kwargs.get('pk_set') or ():
+            item_banks.discard(examination_id)
+        if kwargs.get('action') in ('pre_clear', 'post_clear'):
+            item_banks.clear()
+    else:
+        item_banks.discard(instance.pk)
+
+
+def clear_item_banks(sender, **kwargs):
+    item_banks.clear()
+
+
+m2m_changed.connect(paper_changed, sender=Examination.questions.through)
+post_save.connect(discard_item_bank, sender=Examination)
+post_delete.connect(discard_item_bank, sender=Examination)
+post_save.connect(clear_item_banks, sender=Questions)
+post_delete.connect(clear_item_banks, sender=Questions)
+post_save.connect(clear_item_banks, sender=QuestionOptions)
+post_delete.connect(clear_item_banks, sender=QuestionOptions)
@@ -0,0 +1,313 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Examination, ExaminationResult, User
+
+logger = logging.getLogger(__name__)
+
+# answer_versions key of an attempt submitted together with its answers,
+# which replace everything autosaved before
+SUBMITTED_ANSWERS = '*'
+
+
+def micros(moment):
+    return int(moment.timestamp() * 1000000)
+
+
+def merge_delta(pending, delta):
+    """
+    Fold `delta` ({question id: [seq, option ids, received]}) into `pending`,
+    keeping the newest answer to each question. `received` is when a worker
+    took the answer, in microseconds (missing in logs of older releases).
+    """
+    for question_id, entry in delta.items():
+        current = pending.get(question_id)
+        if current is None or entry[0] >= current[0]:
+            pending[question_id] = entry
+    return pending
+
+
+def apply_delta(result, delta, cutoff=None):
+    """
+    Apply a delta to an attempt; with a `cutoff`, only the answers a worker
+    took before that time.
+    """
+    answers = dict(result.answers or {})
+    versions = dict(result.answer_versions or {})
+    for question_id, (seq, options, *received) in delta.items():
+        if cutoff is not None and (not received or received[0] > cutoff):
+            continue
+        if seq >= versions.get(question_id, -1):
+            answers[question_id] = options
+            versions[question_id] = seq
+    result.answers = answers
+    result.answer_versions = versions
+
+
+def submit_cutoff(result):
+    """
+    Which deltas an attempt still takes: all (None) while it is open. Once
+    submitted with its autosaved answers, those a worker took before the
+    submit, which can still sit in the buffer of another worker; until it is
+    graded, as the question counters must not count an attempt twice. False
+    when it takes none.
+    """
+    if result.submitted_at is None:
+        return None
+    if SUBMITTED_ANSWERS in (result.answer_versions or {}) or result.graded_at is not None:
+        return False
+    return micros(result.submitted_at)
+
+
+def _attempts(keys):
+    by_examination = {}
+    for examination_id, candidate_id in keys:
+        by_examination.setdefault(examination_id, []).append(candidate_id)
+    condition = Q()
+    for examination_id, candidate_ids in by_examination.items():
+        condition |= Q(examination_id=examination_id, candidate_id__in=candidate_ids)
+    return ExaminationResult.objects.select_for_update().filter(condition)
+
+
+def write_deltas(pending):
+    """
+    Upsert buffered deltas ({(examination id, candidate id): delta}) into
+    ExaminationResult in one transaction: one locking read of the existing
+    attempts, one bulk update and one bulk insert. Submitted attempts only
+    take the answers given before the submit, see submit_cutoff(). Applying
+    a delta twice changes nothing, so a replayed log is harmless. Returns the number of attempts written.
+    """
+    if not pending:
+        return 0
+    # attempts of deleted examinations or candidates would fail the whole batch
+    examination_ids = set(Examination.objects.filter(
+        pk__in={key[0] for key in pending}).values_list('pk', flat=True))
+    candidate_ids = set(User.objects.filter(
+        pk__in={key[1] for key in pending}).values_list('pk', flat=True))
+    pending = {key: delta for key, delta in pending.items()
+               if key[0] in examination_ids and key[1] in candidate_ids}
+    if not pending:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {(row.examination_id, row.candidate_id): row for row in _attempts(pending)}
+        updated, created = [], []
+        for key, delta in pending.items():
+            result = existing.get(key)
+            cutoff = None
+            if result is None:
+                result = ExaminationResult(examination_id=key[0], candidate_id=key[1], answers={}, answer_versions={})
+                created.append(result)
+            else:
+                cutoff = submit_cutoff(result)
+                if cutoff is False:
+                    continue
+                updated.append(result)
+            apply_delta(result, delta, cutoff)
+            result.updated_at = now
+
+        if created:
+            # rows another worker inserted meanwhile are skipped here and
+            # updated below, under their row lock
+            ExaminationResult.objects.bulk_create(created, batch_size=1000, ignore_conflicts=True)
+            keys = [(result.examination_id, result.candidate_id) for result in created]
+            for result in _attempts(keys):
+                cutoff = submit_cutoff(result)
+                if cutoff is not False:
+                    apply_delta(result, pending[(result.examination_id, result.candidate_id)], cutoff)
+                    result.updated_at = now
+                    updated.append(result)
+        ExaminationResult.objects.bulk_update(
+            updated, ['answers', 'answer_versions', 'updated_at'], batch_size=1000)
+    return len(pending)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_log(path):
+    pending = {}
+    with open(path) as log:
+        for line in log:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a line cut short by a crash
+                continue
+            key = (entry['e'], entry['c'])
+            merge_delta(pending.setdefault(key, {}), entry['a'])
+    return pending
+
+
+def replay_logs(directory, only_orphans=True):
+    """
+    Write the deltas of append logs left behind by workers that died before
+    flushing. Returns the number of attempts written.
+    """
+    host = socket.gethostname()
+    written = 0
+    for path in sorted(glob.glob(os.path.join(directory, 'autosave-*.log'))):
+        # autosave-<host>-<pid>.<nonce>-<generation>.log, the host may contain
+        # dashes; logs of older releases have no nonce
+        log_host, worker, _ = os.path.basename(path)[len('autosave-'):-len('.log')].rsplit('-', 2)
+        pid = int(worker.split('.')[0])
+        # a log of this pid was left by an earlier worker that had it: this
+        # one replays before its first append, and never under its own name
+        if only_orphans and log_host == host and pid != os.getpid() and _pid_alive(pid):
+            continue
+        written += write_deltas(read_log(path))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # replayed by another worker at the same time; writing twice is harmless
+            pass
+    return written
+
+
+_known_examinations = set()
+
+
+def examination_exists(examination_id):
+    # remembered per worker, so autosaving does not cost a query per click;
+    # deltas of an examination deleted since are dropped by write_deltas()
+    if examination_id not in _known_examinations:
+        if not Examination.objects.filter(pk=examination_id).exists():
+            return False
+        _known_examinations.add(examination_id)
+    return True
+
+
+class AutosaveBuffer:
+    """
+    Write-behind buffer for autosaved answers.
+
+    Deltas are coalesced per attempt and question in memory and, when
+    AUTOSAVE_LOG_DIR is set, appended to a per-process log before they are
+    acknowledged. A background thread writes them with write_deltas() every
+    AUTOSAVE_FLUSH_INTERVAL seconds, or as soon as AUTOSAVE_MAX_PENDING
+    attempts are waiting. The buffer is flushed on submit and when the worker
+    exits cleanly; after a crash the log is replayed by the next worker to
+    start (or `manage.py flush_autosave`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._wake = threading.Event()
+        self._thread = None
+        self._log = None
+        self._log_path = None
+        self._generation = 0
+        self._nonce = None
+        # logs whose deltas are not in the database yet
+        self._unflushed_logs = []
+
+    @property
+    def log_dir(self):
+        return getattr(settings, 'AUTOSAVE_LOG_DIR', None)
+
+    def _start(self):
+        # set in the worker, not at import (which a preloading server does once
+        # for all of them): tells its logs from an earlier worker's with the same pid
+        self._nonce = time.time_ns()
+        self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+            try:
+                replay_logs(self.log_dir)
+            except Exception:
+                logger.exception('Could not replay autosave logs')
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.AUTOSAVE_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Autosave flush failed, retrying')
+            finally:
+                connection.close()
+
+    def _append_log(self, examination_id, candidate_id, delta):
+        if self._log is None:
+            self._generation += 1
+            self._log_path = os.path.join(self.log_dir, 'autosave-%s-%d.%d-%d.log' % (
+                socket.gethostname(), os.getpid(), self._nonce, self._generation))
+            self._log = open(self._log_path, 'a')
+        self._log.write(json.dumps({'e': examination_id, 'c': candidate_id, 'a': delta}) + '\n')
+        self._log.flush()
+        if settings.AUTOSAVE_FSYNC:
+            os.fsync(self._log.fileno())
+
+    def add(self, examination_id, candidate_id, answers, seq=None):
+        received = time.time_ns() // 1000
+        if seq is None:
+            seq = received
+        delta = {str(question_id): [seq, options, received] for question_id, options in answers.items()}
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            if self.log_dir:
+                self._append_log(examination_id, candidate_id, delta)
+            merge_delta(self._pending.setdefault((examination_id, candidate_id), {}), delta)
+            full = len(self._pending) >= settings.AUTOSAVE_MAX_PENDING
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Write everything buffered so far. Deltas that fail to write are put
+        back (newer ones win) and their logs are kept for the next attempt.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                if self._log is not None:
+                    self._log.close()
+                    self._unflushed_logs.append(self._log_path)
+                    self._log = self._log_path = None
+                logs, self._unflushed_logs = self._unflushed_logs, []
+            try:
+                written = write_deltas(pending)
+            except Exception:
+                with self._lock:
+                    for key, delta in pending.items():
+                        newer = self._pending.get(key, {})
+                        self._pending[key] = merge_delta(delta, newer)
+                    self._unflushed_logs = logs + self._unflushed_logs
+                raise
+            for path in logs:
+                os.remove(path)
+            return written
+
+    def close(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not flush autosaved answers on exit')
+
+
+autosave_buffer = AutosaveBuffer()
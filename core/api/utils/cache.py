@@ -0,0 +1,156 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import Subject, Topics, Questions, QuestionOptions
+from core.routers import primary
+
+VERSIONED_MODELS = (Subject, Topics, Questions, QuestionOptions)
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def _version_key(model):
+    return 'api:version:%s' % model._meta.label_lower
+
+
+def _fresh_version():
+    # a restarted or evicted counter must never reuse an old value, or
+    # responses cached under that value would be served again
+    return time.time_ns()
+
+
+def get_counter(key):
+    """
+    A version counter kept in the cache, started at a fresh value if
+    missing. Everything keyed by it is retired by bump_counter.
+    """
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_counter(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), None)
+
+
+def get_versions(models):
+    cache = get_cache()
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _fresh_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*models):
+    """
+    Retire what was cached from `models`, once the transaction commits: a
+    miss before that would store the old rows under the new version.
+    """
+    transaction.on_commit(lambda: [bump_counter(_version_key(model)) for model in models])
+
+
+class CacheMetrics:
+    """
+    Hit/miss counters per cached view. They live in the worker process, so
+    each gunicorn worker reports its own numbers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, name, hit):
+        with self._lock:
+            self._counts[name]['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            views = {name: dict(counts) for name, counts in self._counts.items()}
+        hits = sum(counts['hits'] for counts in views.values())
+        misses = sum(counts['misses'] for counts in views.values())
+        return {
+            'views': views,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        }
+
+
+metrics = CacheMetrics()
+
+
+def user_role(user):
+    if not user or not user.is_authenticated:
+        return 'anonymous'
+    if user.is_staff or getattr(user, 'is_admin', False):
+        return 'admin'
+    return 'candidate'
+
+
+def response_cache_key(name, versions, request, kwargs):
+    params = sorted(request.query_params.lists())
+    raw = repr((versions, sorted(kwargs.items()), params, user_role(request.user)))
+    return 'api:response:%s:%s' % (name, hashlib.md5(raw.encode()).hexdigest())
+
+
+def cached_response(name, models, timeout=None):
+    """
+    Cache the data of a view method's 200 responses.
+
+    The key is made of the current version counters of `models`, the view
+    kwargs, every query parameter (so each page is its own entry) and the
+    caller's role. Saving or deleting any of the models bumps its counter,
+    which retires every entry built from it without having to find them.
+    Misses read from the primary, a lagging replica would otherwise store
+    the old rows under the new counter.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            cache = get_cache()
+            key = response_cache_key(name, get_versions(models), request, kwargs)
+            data = cache.get(key)
+            if data is not None:
+                metrics.record(name, True)
+                return Response(data, status=status.HTTP_200_OK)
+            metrics.record(name, False)
+            # entries outlive replication lag, so build them from the primary
+            with primary():
+                response = func(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, timeout if timeout is not None else
+                          getattr(settings, 'API_CACHE_TIMEOUT', 300))
+            return response
+        return wrapper
+    return decorator
+
+
+def bump_model_version(sender, **kwargs):
+    bump_versions(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_model_version, sender=model)
+    post_delete.connect(bump_model_version, sender=model)
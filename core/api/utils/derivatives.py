@@ -0,0 +1,108 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.models import Image, ImageDerivative
+from core.api.utils.image import get_storage, image_key
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # derivatives are skipped without Pillow
+    PILImage = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+
+def derivative_widths(width):
+    return sorted({w for w in settings.IMAGE_DERIVATIVE_WIDTHS if w < width} | {width})
+
+
+def encode(picture, format):
+    if format == 'jpeg' and picture.mode not in ('RGB', 'L'):
+        picture = picture.convert('RGB')
+    out = io.BytesIO()
+    picture.save(out, format=format.upper(), quality=settings.IMAGE_DERIVATIVE_QUALITY)
+    out.seek(0)
+    return out
+
+
+def generate_derivatives(image):
+    """
+    Record the image's dimensions and store a resized copy for every
+    configured width and format. Returns the derivatives created.
+    """
+    if PILImage is None:
+        logger.warning('Pillow is not installed, no derivatives for image %s', image.pk)
+        return []
+    storage = get_storage()
+    with storage.open(image_key(image.folder, image.name)) as stream:
+        picture = PILImage.open(io.BytesIO(stream.read()))
+        picture.load()
+    width, height = picture.size
+    Image.objects.filter(pk=image.pk).update(width=width, height=height)
+    image.width, image.height = width, height
+
+    stem, _ = os.path.splitext(image.name)
+    created = []
+    for target in derivative_widths(width):
+        target_height = max(1, round(height * target / width))
+        resized = picture if target == width else picture.resize((target, target_height), PILImage.LANCZOS)
+        for format in settings.IMAGE_DERIVATIVE_FORMATS:
+            data = encode(resized, format)
+            key = image_key(image.folder, f'derived/{stem}-{target}.{format}')
+            storage.save(data, key, CONTENT_TYPES.get(format))
+            derivative, _ = ImageDerivative.objects.update_or_create(
+                image=image, format=format, width=target,
+                defaults={
+                    'height': target_height,
+                    'size': data.getbuffer().nbytes,
+                    'url': storage.url(key),
+                })
+            created.append(derivative)
+    return created
+
+
+class ImagePipeline:
+    """
+    Generates derivatives on a small thread pool once the upload's
+    transaction has committed, so the upload request returns right away.
+    `manage.py process_images` picks up anything a restart dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_PIPELINE_WORKERS, thread_name_prefix='image')
+        return self._executor
+
+    def submit(self, image_id):
+        transaction.on_commit(lambda: (self._executor or self._start()).submit(self.run, image_id))
+
+    def run(self, image_id):
+        try:
+            image = Image.objects.filter(pk=image_id).first()
+            if image is not None:
+                generate_derivatives(image)
+        except Exception:
+            logger.exception('Could not generate derivatives for image %s', image_id)
+        finally:
+            connection.close()
+
+
+image_pipeline = ImagePipeline()
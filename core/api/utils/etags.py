@@ -0,0 +1,74 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from core.api.utils.cache import get_versions, user_role
+from core.routers import primary
+
+
+def cache_control(request):
+    """
+    The Cache-Control policy of the requested endpoint, see API_CACHE_CONTROL.
+    """
+    policies = settings.API_CACHE_CONTROL
+    match = request.resolver_match
+    return policies.get(match.view_name if match else None, policies['default'])
+
+
+def compute_etag(name, validator, request, kwargs):
+    # whatever the body depends on besides the data: the view kwargs, query
+    # parameters, caller's role and the negotiated format
+    raw = repr((name, validator, sorted(kwargs.items()), sorted(request.query_params.lists()),
+                user_role(request.user), request.accepted_media_type))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def etag_matches(etag, request):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison
+    etags = parse_etags(header)
+    return '*' in etags or any((candidate[2:] if candidate.startswith('W/') else candidate) == etag
+                               for candidate in etags)
+
+
+def conditional(name, models=None, validator=None):
+    """
+    Strong ETags and conditional GET for a view (method or function).
+
+    The tag is derived from the version counters of `models`, or from
+    `validator(request, **kwargs)` (a cheap query such as a max updated_at;
+    None skips the tag, for instance for a missing object), never from the
+    body. A matching If-None-Match is answered with 304 before the view
+    runs. 200 and 304 responses carry the endpoint's Cache-Control policy.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            value = get_versions(models) if validator is None else validator(request, **kwargs)
+            if value is None:
+                return func(*args, **kwargs)
+            etag = compute_etag(name, value, request, kwargs)
+            if etag_matches(etag, request):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                if validator is None:
+                    # a lagging replica would give an old body the new tag
+                    with primary():
+                        response = func(*args, **kwargs)
+                else:
+                    response = func(*args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            response['ETag'] = etag
+            response['Cache-Control'] = cache_control(request)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,117 @@
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from core.models import User, Questions, QuestionOptions, ExaminationResult
+from core.api.renderers import encode_csv, encode_ndjson
+
+USER_FIELDS = ("id", "first_name", "middle_name", "last_name", "email", "contact", "date_of_birth",
+               "address_line_1", "address_line_2", "state", "city", "zip", "is_admin", "is_active", "date_joined")
+QUESTION_FIELDS = ("_id", "description", "options", "attachment", "topic", "difficulty_level", "marks_allotted")
+OPTION_FIELDS = ("_id", "description", "attachment", "is_correct")
+RESULT_FIELDS = ("id", "examination", "candidate", "score", "correct_count", "wrong_count",
+                 "unanswered_count", "ability", "ability_se", "submitted_at", "graded_at")
+
+def chunk_size():
+    return settings.EXPORT_CHUNK_SIZE
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def user_rows():
+    return User.objects.order_by('pk').values(*USER_FIELDS).iterator(chunk_size=chunk_size())
+
+
+def question_rows(topic=None):
+    """
+    Questions with their options, as QuestionsSerializer lays them out.
+    prefetch_related() is ignored by iterator(), so the options of every
+    chunk of questions are read with one extra query.
+    """
+    questions = Questions.objects.order_by('pk')
+    if topic:
+        questions = questions.filter(topic_id=topic)
+    questions = questions.values_list(
+        'pk', 'description', 'attachment_id', 'topic_id', 'difficulty_level', 'marks_allotted')
+    size = chunk_size()
+    for chunk in chunks(questions.iterator(chunk_size=size), size):
+        options = {}
+        for question_id, *option in QuestionOptions.objects.filter(
+                for_question_id__in=[row[0] for row in chunk]).order_by('pk').values_list(
+                'for_question_id', 'pk', 'description', 'attachment_id', 'is_correct'):
+            options.setdefault(question_id, []).append(dict(zip(OPTION_FIELDS, option)))
+        for pk, description, attachment, topic_id, difficulty_level, marks_allotted in chunk:
+            yield {
+                "_id": pk,
+                "description": description,
+                "options": options.get(pk, []),
+                "attachment": attachment,
+                "topic": topic_id,
+                "difficulty_level": difficulty_level,
+                "marks_allotted": marks_allotted,
+            }
+
+
+def result_rows(examination=None):
+    results = ExaminationResult.objects.order_by('pk')
+    if examination:
+        results = results.filter(examination_id=examination)
+    results = results.values_list(
+        'pk', 'examination_id', 'candidate_id', 'score', 'correct_count', 'wrong_count',
+        'unanswered_count', 'ability', 'ability_se', 'submitted_at', 'graded_at')
+    for row in results.iterator(chunk_size=chunk_size()):
+        yield dict(zip(RESULT_FIELDS, row))
+
+
+EXPORTS = {
+    'users': (user_rows, USER_FIELDS),
+    'questions': (question_rows, QUESTION_FIELDS),
+    'results': (result_rows, RESULT_FIELDS),
+}
+
+
+def export(name, format='ndjson', **filters):
+    """
+    The encoded lines of an export, generated lazily: rows are read through
+    a server-side cursor EXPORT_CHUNK_SIZE at a time and encoded one by one,
+    so memory does not grow with the table.
+    """
+    rows, fields = EXPORTS[name]
+    rows = rows(**filters)
+    if format == 'csv':
+        return _blocks(encode_csv(rows, fields))
+    return _blocks(encode_ndjson(rows))
+
+
+def _blocks(lines, size=64 * 1024):
+    # one write per ~64KB instead of one per row
+    block, length = [], 0
+    for line in lines:
+        block.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(block)
+            block, length = [], 0
+    if block:
+        yield b''.join(block)
+
+
+def export_response(renderer, name, **filters):
+    """
+    Stream an export in the format of the view's negotiated renderer
+    (NDJSONRenderer or CSVRenderer).
+    """
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = '%s; charset=%s' % (content_type, renderer.charset)
+    response = StreamingHttpResponse(export(name, renderer.format, **filters), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (name, renderer.format)
+    return response
@@ -0,0 +1,254 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils import timezone
+
+from core.models import Examination, ExaminationResult, Questions, QuestionOptions
+from core.api.utils.question_stats import record_attempts
+from core.api.utils.snapshots import get_generation
+
+# bits set in every byte value, to count selected options without a Python loop
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+MAX_OPTIONS = 63
+
+RESULT_FIELDS = ['score', 'correct_count', 'wrong_count', 'unanswered_count', 'graded_at']
+
+
+def popcount(values):
+    as_bytes = np.ascontiguousarray(values, dtype='<i8').view(np.uint8)
+    return POPCOUNT[as_bytes].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+class GradedBatch:
+
+    def __init__(self, score, correct, wrong, unanswered, credit, answered, exact):
+        self.score = score
+        self.correct = correct
+        self.wrong = wrong
+        self.unanswered = unanswered
+        # (attempts, questions) matrices
+        self.credit = credit
+        self.answered = answered
+        self.exact = exact
+
+
+class AnswerKey:
+    """
+    An examination's answer key as flat NumPy arrays.
+
+    Each question is a column; a selection is stored as a bitmask of the
+    question's options (ordered by option id), so a whole batch of attempts
+    is one int64 matrix and grading it is a handful of vectorized
+    comparisons plus a matrix-vector product with the marks.
+    """
+
+    def __init__(self, examination_id, question_ids, marks, correct, option_bits,
+                 negative_marking=0.0, partial_credit=False):
+        self.examination_id = examination_id
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.marks = np.asarray(marks, dtype=np.float64)
+        self.correct = np.asarray(correct, dtype=np.int64)
+        self.correct_counts = popcount(self.correct)
+        # option id -> (question column, bit)
+        self.option_bits = option_bits
+        self.negative_marking = negative_marking
+        self.partial_credit = partial_credit
+
+    @classmethod
+    def load(cls, examination):
+        questions = list(
+            examination.questions.order_by('pk').values_list('pk', 'marks_allotted'))
+        columns = {pk: column for column, (pk, _) in enumerate(questions)}
+        correct = np.zeros(len(questions), dtype=np.int64)
+        option_bits = {}
+        positions = {}
+        options = QuestionOptions.objects.filter(
+            for_question__examination=examination
+        ).order_by('for_question_id', 'pk').values_list('for_question_id', 'pk', 'is_correct')
+        for question_id, option_id, is_correct in options:
+            column = columns[question_id]
+            position = positions.get(question_id, 0)
+            if position >= MAX_OPTIONS:
+                raise ValueError("Question %s has more than %d options." % (question_id, MAX_OPTIONS))
+            positions[question_id] = position + 1
+            bit = 1 << position
+            option_bits[option_id] = (column, bit)
+            if is_correct:
+                correct[column] |= bit
+        return cls(
+            examination.pk,
+            [pk for pk, _ in questions],
+            [marks for _, marks in questions],
+            correct,
+            option_bits,
+            negative_marking=examination.negative_marking,
+            partial_credit=examination.partial_credit,
+        )
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def encode_many(self, answer_sets):
+        """
+        Selection matrix for a list of {question id: [option ids]} answers.
+        Options that are not part of this examination are ignored.
+        """
+        # gather flat cell indexes and bits in plain lists and set them with
+        # one ufunc call; element-wise array assignment would dominate the cost
+        width = len(self)
+        lookup = self.option_bits.get
+        cells, bits = [], []
+        for row, answers in enumerate(answer_sets):
+            offset = row * width
+            for selected in (answers or {}).values():
+                if not isinstance(selected, (list, tuple)):
+                    selected = (selected,)
+                for option_id in selected:
+                    position = lookup(option_id)
+                    if position is not None:
+                        cells.append(offset + position[0])
+                        bits.append(position[1])
+        matrix = np.zeros((len(answer_sets), width), dtype=np.int64)
+        np.bitwise_or.at(matrix.reshape(-1), np.array(cells, dtype=np.intp), np.array(bits, dtype=np.int64))
+        return matrix
+
+    def grade(self, matrix):
+        answered = matrix != 0
+        exact = (matrix == self.correct) & answered
+        if self.partial_credit:
+            picked_wrong = (matrix & ~self.correct) != 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fraction = popcount(matrix & self.correct) / self.correct_counts
+            credit = np.where(answered & ~picked_wrong, np.nan_to_num(fraction), 0.0)
+            wrong = answered & picked_wrong
+        else:
+            credit = exact.astype(np.float64)
+            wrong = answered & ~exact
+        score = credit @ self.marks - self.negative_marking * (wrong @ self.marks)
+        return GradedBatch(
+            score=score,
+            correct=exact.sum(axis=1),
+            wrong=wrong.sum(axis=1),
+            unanswered=(~answered).sum(axis=1),
+            credit=credit,
+            answered=answered,
+            exact=exact,
+        )
+
+
+class AnswerKeyCache:
+    """
+    Answer keys loaded once per examination and process, dropped by the
+    signals below whenever a paper, question or option changes here. Changes
+    made by other workers retire them through the paper's snapshot
+    generation (core.api.utils.snapshots), or after PAPER_SNAPSHOT_TIMEOUT
+    seconds where that counter is not shared.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}
+
+    def get(self, examination):
+        # before loading, a change committed meanwhile retires what is loaded
+        generation = get_generation(examination.pk)
+        entry = self._keys.get(examination.pk)
+        if entry is not None and entry[0] == generation and time.monotonic() < entry[1]:
+            return entry[2]
+        key = AnswerKey.load(examination)
+        expires = time.monotonic() + getattr(settings, 'PAPER_SNAPSHOT_TIMEOUT', 300)
+        with self._lock:
+            self._keys[examination.pk] = (generation, expires, key)
+        return key
+
+    def discard(self, examination_id):
+        with self._lock:
+            self._keys.pop(examination_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+answer_keys = AnswerKeyCache()
+
+
+def grade_results(examination, results, key=None):
+    """
+    Grade ExaminationResult rows of one examination in a single vectorized
+    pass and write the scores back with one bulk update.
+    """
+    if not results:
+        return None
+    key = key or answer_keys.get(examination)
+    graded = key.grade(key.encode_many([result.answers for result in results]))
+    # regraded attempts are already part of the question counters
+    first_time = [i for i, result in enumerate(results) if result.graded_at is None]
+    now = timezone.now()
+    for i, result in enumerate(results):
+        result.score = float(graded.score[i])
+        result.correct_count = int(graded.correct[i])
+        result.wrong_count = int(graded.wrong[i])
+        result.unanswered_count = int(graded.unanswered[i])
+        result.graded_at = now
+    with transaction.atomic():
+        ExaminationResult.objects.bulk_update(results, RESULT_FIELDS, batch_size=1000)
+        record_attempts(key, graded, first_time)
+    return graded
+
+
+def grade_examination(examination, batch_size=5000, regrade=False):
+    """
+    Grade every submitted (and, unless `regrade`, not yet graded) attempt of
+    an examination batch by batch. Returns the number of attempts graded.
+    Attempts submitted in the last two AUTOSAVE_FLUSH_INTERVALs wait for the
+    next run, other workers may still hold answers autosaved before the
+    submit (see core.api.utils.autosave.submit_cutoff).
+    """
+    key = answer_keys.get(examination)
+    settled = timezone.now() - timedelta(seconds=2 * settings.AUTOSAVE_FLUSH_INTERVAL)
+    pending = ExaminationResult.objects.filter(
+        examination=examination, submitted_at__lte=settled).order_by('pk')
+    if not regrade:
+        pending = pending.filter(graded_at__isnull=True)
+    graded = 0
+    last_pk = 0
+    while True:
+        batch = list(pending.filter(pk__gt=last_pk).only('pk', 'answers', 'graded_at')[:batch_size])
+        if not batch:
+            return graded
+        grade_results(examination, batch, key)
+        graded += len(batch)
+        last_pk = batch[-1].pk
+
+
+def discard_answer_key(sender, instance=None, **kwargs):
+    answer_keys.discard(instance.pk)
+
+
+def paper_changed(sender, instance=None, reverse=False, **kwargs):
+    if reverse:
+        # question.examination.add(...), the affected papers are in pk_set
+        for examination_id in kwargs.get('pk_set') or ():
+            answer_keys.discard(examination_id)
+        if kwargs.get('action') in ('pre_clear', 'post_clear'):
+            answer_keys.clear()
+    else:
+        answer_keys.discard(instance.pk)
+
+
+def clear_answer_keys(sender, **kwargs):
+    answer_keys.clear()
+
+
+m2m_changed.connect(paper_changed, sender=Examination.questions.through)
+post_save.connect(discard_answer_key, sender=Examination)
+post_save.connect(clear_answer_keys, sender=Questions)
+post_delete.connect(clear_answer_keys, sender=Questions)
+post_save.connect(clear_answer_keys, sender=QuestionOptions)
+post_delete.connect(clear_answer_keys, sender=QuestionOptions)
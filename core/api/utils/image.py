@@ -1,17 +1,265 @@
-import boto3
+import hashlib
 import os
+import re
+import shutil
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from django.conf import settings
+from django.core import signing
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.urls import reverse
+
+# lowercase letters, digits, dashes and underscores, optionally nested
+FOLDER_PATTERN = re.compile(r'^[\w-]+(/[\w-]+)*$')
+UPLOAD_SALT = 'core.image.upload'
+
+
+class ImageStorageError(ValueError):
+    pass
+
+
+def clean_folder(folder):
+    folder = (folder or '').strip('/')
+    if not FOLDER_PATTERN.match(folder):
+        raise ImageStorageError('Invalid folder %r' % folder)
+    return folder
+
+
+def image_key(folder, file_name):
+    return f'image/{folder}/{file_name}'
+
+
+class S3ImageStorage:
+    """
+    Images in the S3 bucket, written through one client per process.
+
+    boto3 clients are thread safe and keep a connection pool, so building
+    one per upload only paid for credential resolution and new TLS
+    connections. Files go up with managed transfers: anything above the
+    multipart threshold is sent in parts read from the (spooled) upload one
+    chunk at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.IMAGE_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.IMAGE_MULTIPART_CHUNK_SIZE,
+            max_concurrency=settings.IMAGE_MULTIPART_CONCURRENCY,
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = boto3.client(
+                        's3',
+                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                        region_name=settings.AWS_S3_REGION_NAME,
+                        # a local stand-in such as moto_server or MinIO
+                        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                        config=Config(max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS),
+                    )
+        return self._client
+
+    @property
+    def bucket(self):
+        return settings.AWS_STORAGE_BUCKET_NAME
+
+    def url(self, key):
+        return f'{settings.AWS_BASE_URL}/{key}'
+
+    def save(self, file, key, content_type=None):
+        extra = {'ContentType': content_type} if content_type else None
+        self.client.upload_fileobj(file, self.bucket, key, ExtraArgs=extra, Config=self.transfer_config)
+
+    def open(self, key):
+        # botocore's StreamingBody, read in chunks straight off the socket
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def presign(self, key, token, content_type):
+        post = self.client.generate_presigned_post(
+            self.bucket, key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, settings.IMAGE_UPLOAD_MAX_SIZE],
+            ],
+            ExpiresIn=settings.IMAGE_PRESIGN_EXPIRES,
+        )
+        return {'method': 'POST', 'url': post['url'], 'fields': post['fields']}
+
+
+class FileSystemImageStorage:
+    """
+    Images under IMAGE_STORAGE_ROOT, for local development and tests. Direct
+    uploads go to this API's own `file/direct/<token>/` endpoint.
+    """
+
+    @property
+    def root(self):
+        return settings.IMAGE_STORAGE_ROOT
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def url(self, key):
+        return f'{settings.IMAGE_STORAGE_URL.rstrip("/")}/{key}'
+
+    def save(self, file, key, content_type=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(file, out, settings.IMAGE_MULTIPART_CHUNK_SIZE)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def presign(self, key, token, content_type):
+        return {
+            'method': 'PUT',
+            'url': reverse('upload_direct', kwargs={'token': token}),
+            'headers': {'Content-Type': content_type},
+        }
+
+
+STORAGES = {
+    's3': S3ImageStorage,
+    'filesystem': FileSystemImageStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = STORAGES[settings.IMAGE_STORAGE_BACKEND]()
+    return _storage
+
 
 def handle_image(file, file_name, folder):
 
     # generate unique file name
     _, file_extension = os.path.splitext(file.name)
     file_name_with_extension = f'{file_name}{file_extension}'
+    key = image_key(clean_folder(folder), file_name_with_extension)
+
+    # stream the upload to storage
+    storage = get_storage()
+    storage.save(file, key, getattr(file, 'content_type', None))
+
+    return (file_name_with_extension, storage.url(key))
+
+
+def start_direct_upload(file_name, folder, original_name, content_type):
+    """
+    Presigned upload for a client to send the file straight to storage. The
+    returned token names the object and is handed back to confirm the upload.
+    """
+    _, file_extension = os.path.splitext(original_name or '')
+    file_name_with_extension = f'{file_name}{file_extension}'
+    folder = clean_folder(folder)
+    token = signing.dumps({
+        'id': file_name,
+        'name': file_name_with_extension,
+        'folder': folder,
+        'content_type': content_type,
+    }, salt=UPLOAD_SALT)
+    key = image_key(folder, file_name_with_extension)
+    return token, get_storage().presign(key, token, content_type)
+
+
+def read_upload_token(token):
+    """
+    (id, name, folder, key, url, content type) of a direct upload; raises
+    ImageStorageError for a forged or expired token.
+    """
+    try:
+        upload = signing.loads(token, salt=UPLOAD_SALT, max_age=settings.IMAGE_PRESIGN_EXPIRES)
+    except signing.BadSignature:
+        raise ImageStorageError('Invalid or expired upload token')
+    key = image_key(upload['folder'], upload['name'])
+    # tokens issued before the content type was signed have none
+    return (upload['id'], upload['name'], upload['folder'], key, get_storage().url(key),
+            upload.get('content_type'))
+
+
+class ContentHashMixin:
+    """
+    Hashes an uploaded file while Django receives it, so dedupe needs no
+    second pass over the file. The digest ends up on `file.content_hash`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            # this handler consumed the chunk
+            self.hasher.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def hash_stream(stream, chunk_size=1024 * 1024):
+    hasher = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
 
-    # Upload image to S3
-    s3 = boto3.client('s3', aws_access_key_id=settings.AWS_ACCESS_KEY_ID, aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
-    
-    # upload image to S3
-    s3.upload_fileobj(file, settings.AWS_STORAGE_BUCKET_NAME, f'image/{folder}/{file_name_with_extension}')
-    
-    return (file_name_with_extension, f'{settings.AWS_BASE_URL}/image/{folder}/{file_name_with_extension}')
\ No newline at end of file
+def content_hash(file):
+    """
+    sha256 of an uploaded file, from the upload handlers when they ran.
+    """
+    digest = getattr(file, 'content_hash', None)
+    if digest is None:
+        digest = hash_stream(file)
+        file.seek(0)
+    return digest
@@ -0,0 +1,269 @@
+import csv
+import io
+import json
+import time
+import uuid
+from itertools import islice
+
+from django.db import connections, transaction
+
+from core.models import Image, Topics, Questions, QuestionOptions, DIFFICULTY_LEVEL
+from core.api.utils.paper import question_index
+from core.api.utils.cache import bump_versions
+
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                # reported against its row instead of aborting the import
+                yield e
+
+
+def read_csv(stream):
+    """
+    One question per row with columns topic, difficulty_level, marks_allotted,
+    description, attachment, option_1 .. option_n (and optionally
+    option_n_attachment) and correct, a comma separated list of the 1-based
+    numbers of the correct options.
+    """
+    for row in csv.DictReader(stream):
+        correct = {part.strip() for part in (row.get('correct') or '').split(',') if part.strip()}
+        options = []
+        number = 1
+        while ('option_%d' % number) in row:
+            description = row['option_%d' % number]
+            attachment = row.get('option_%d_attachment' % number)
+            if description or attachment:
+                options.append({
+                    'description': description,
+                    'attachment': attachment or None,
+                    'is_correct': str(number) in correct,
+                })
+            number += 1
+        yield {
+            'topic': row.get('topic'),
+            'difficulty_level': row.get('difficulty_level'),
+            'marks_allotted': row.get('marks_allotted') or None,
+            'description': row.get('description'),
+            'attachment': row.get('attachment') or None,
+            'options': options,
+        }
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def open_text(file):
+    """
+    Text view over an uploaded (binary) file without reading it into memory.
+    """
+    if isinstance(file, io.TextIOBase):
+        return file
+    return io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+
+
+class ImportReport:
+
+    def __init__(self, skipped=0):
+        self.rows = skipped
+        self.imported = 0
+        self.options = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    def error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'options': self.options,
+            'failed': self.failed,
+            'errors': self.errors,
+            'seconds': round(self.elapsed, 3),
+            'questions_per_second': round(self.throughput, 1),
+            # pass back as `skip` to resume after an interruption
+            'checkpoint': self.rows,
+        }
+
+
+class QuestionImporter:
+    """
+    Streams question rows into the database in batches.
+
+    Every batch is validated as a whole, its topics and attachments are
+    resolved with one query each, and the questions and their options are
+    written with bulk_create inside one transaction per batch. Only the
+    current batch is held in memory, and `report.rows` after a batch is a
+    checkpoint the import can be resumed from with `skip`.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, using='default', on_batch=None):
+        self.batch_size = batch_size
+        self.using = using
+        self.on_batch = on_batch
+        self.difficulty_levels = {level for level, _ in DIFFICULTY_LEVEL}
+
+    def run(self, rows, skip=0):
+        report = ImportReport(skipped=skip)
+        rows = islice(rows, skip, None)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch, report.rows + 1, report)
+            report.rows += len(batch)
+            if self.on_batch:
+                self.on_batch(report)
+        if report.imported:
+            # bulk_create sends no post_save signals
+            question_index.invalidate()
+            bump_versions(Questions, QuestionOptions)
+        return report
+
+    def import_batch(self, batch, first_row, report):
+        topic_ids = set()
+        attachment_ids = set()
+        for row in batch:
+            if not isinstance(row, dict):
+                continue
+            topic_ids.add(str(row.get('topic')))
+            attachment_ids.add(str(row.get('attachment')))
+            for option in row.get('options') or []:
+                if isinstance(option, dict):
+                    attachment_ids.add(str(option.get('attachment')))
+        topics = set(Topics.objects.using(self.using).filter(
+            pk__in=topic_ids).values_list('pk', flat=True))
+        attachments = dict(Image.objects.using(self.using).filter(
+            _id__in=self.valid_uuids(attachment_ids)).values_list('_id', 'pk'))
+        attachments = {str(key): value for key, value in attachments.items()}
+
+        questions = []
+        options = []
+        for number, row in enumerate(batch, first_row):
+            errors, question, row_options = self.build(row, topics, attachments)
+            if errors:
+                report.error(number, errors)
+                continue
+            questions.append(question)
+            options.append(row_options)
+
+        if not questions:
+            return
+        with transaction.atomic(using=self.using):
+            self.create_questions(questions)
+            for question, row_options in zip(questions, options):
+                for option in row_options:
+                    option.for_question_id = question.pk
+            flat_options = [option for row_options in options for option in row_options]
+            QuestionOptions.objects.using(self.using).bulk_create(flat_options, batch_size=self.batch_size)
+        report.imported += len(questions)
+        report.options += len(flat_options)
+
+    def create_questions(self, questions):
+        if connections[self.using].features.can_return_rows_from_bulk_insert:
+            Questions.objects.using(self.using).bulk_create(questions, batch_size=self.batch_size)
+        else:
+            # the backend cannot hand back the new primary keys (SQLite before
+            # Django 4.0), which the options need
+            for question in questions:
+                question.save(using=self.using)
+
+    def valid_uuids(self, values):
+        valid = []
+        for value in values:
+            try:
+                valid.append(uuid.UUID(value))
+            except ValueError:
+                pass
+        return valid
+
+    def normalize_uuid(self, value):
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            return None
+
+    def build(self, row, topics, attachments):
+        if isinstance(row, ValueError):
+            return {'row': 'Invalid JSON: %s' % row}, None, None
+        if not isinstance(row, dict):
+            return {'row': 'Expected an object'}, None, None
+        errors = {}
+
+        topic = row.get('topic')
+        if not isinstance(topic, str) or topic not in topics:
+            errors['topic'] = 'Unknown topic %r' % topic
+        difficulty_level = row.get('difficulty_level')
+        if not isinstance(difficulty_level, str) or difficulty_level not in self.difficulty_levels:
+            errors['difficulty_level'] = 'Must be one of %s' % ', '.join(sorted(self.difficulty_levels))
+        marks = row.get('marks_allotted')
+        try:
+            marks = 4 if marks is None else int(marks)
+            if marks < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors['marks_allotted'] = 'Must be a non-negative integer'
+        attachment = self.attachment(row.get('attachment'), attachments, errors, 'attachment')
+        if not row.get('description') and not attachment:
+            errors['description'] = 'Needs a description or an attachment'
+
+        row_options = []
+        raw_options = row.get('options')
+        if not isinstance(raw_options, list) or not raw_options:
+            errors['options'] = 'Needs at least one option'
+            raw_options = []
+        for index, option in enumerate(raw_options, 1):
+            if not isinstance(option, dict):
+                errors['options'] = 'Option %d must be an object' % index
+                continue
+            row_options.append(QuestionOptions(
+                description=option.get('description'),
+                attachment_id=self.attachment(
+                    option.get('attachment'), attachments, errors, 'option_%d_attachment' % index),
+                is_correct=bool(option.get('is_correct')),
+            ))
+        if raw_options and not any(option.is_correct for option in row_options):
+            errors['correct'] = 'At least one option must be correct'
+
+        if errors:
+            return errors, None, None
+        question = Questions(
+            topic_id=topic,
+            difficulty_level=difficulty_level,
+            marks_allotted=marks,
+            description=row.get('description'),
+            attachment_id=attachment,
+        )
+        return None, question, row_options
+
+    def attachment(self, value, attachments, errors, field):
+        if not value:
+            return None
+        key = self.normalize_uuid(value)
+        if key not in attachments:
+            errors[field] = 'Unknown image %r' % value
+            return None
+        return attachments[key]
@@ -0,0 +1,230 @@
+import copy
+import random
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from core.models import Questions, DIFFICULTY_LEVEL
+from core.routers import primary
+
+
+class PaperAssemblyError(ValueError):
+    pass
+
+
+class QuestionIndex:
+    """
+    Question ids bucketed by (topic, difficulty_level, marks_allotted).
+
+    Buckets are plain lists paired with an id -> position map, so adding,
+    moving and removing a question is O(1) (swap with the last element) and
+    drawing k ids from a bucket is O(k). The index is loaded lazily with a
+    single values_list() query and kept current by the Questions signals
+    below; a full reload after PAPER_INDEX_MAX_AGE seconds picks up writes
+    made by other worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._buckets = defaultdict(list)
+        self._positions = {}
+        self._keys = {}
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'PAPER_INDEX_MAX_AGE', 300)
+
+    def load(self):
+        rows = Questions.objects.values_list(
+            'pk', 'topic_id', 'difficulty_level', 'marks_allotted').iterator()
+        # updated by signals from here on, so it must not start out behind
+        with primary(), self._lock:
+            self._buckets = defaultdict(list)
+            self._positions = {}
+            self._keys = {}
+            for pk, topic_id, difficulty_level, marks in rows:
+                self._insert(pk, (topic_id, difficulty_level, marks))
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _insert(self, pk, key):
+        bucket = self._buckets[key]
+        self._positions[pk] = len(bucket)
+        bucket.append(pk)
+        self._keys[pk] = key
+
+    def _remove(self, pk):
+        key = self._keys.pop(pk)
+        bucket = self._buckets[key]
+        position = self._positions.pop(pk)
+        last = bucket.pop()
+        if last != pk:
+            bucket[position] = last
+            self._positions[last] = position
+        if not bucket:
+            del self._buckets[key]
+
+    def update(self, question):
+        key = (question.topic_id, question.difficulty_level, question.marks_allotted)
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if self._keys.get(question.pk) == key:
+                return
+            if question.pk in self._keys:
+                self._remove(question.pk)
+            self._insert(question.pk, key)
+
+    def discard(self, pk):
+        with self._lock:
+            if self._loaded_at is not None and pk in self._keys:
+                self._remove(pk)
+
+    def size(self, key):
+        return len(self._buckets.get(key, ()))
+
+    def marks_for(self, topics, difficulty_level):
+        """
+        Available question count per marks value for the given topics.
+        """
+        capacity = defaultdict(int)
+        with self._lock:
+            for (topic_id, level, marks), bucket in self._buckets.items():
+                if level == difficulty_level and topic_id in topics:
+                    capacity[marks] += len(bucket)
+        return dict(capacity)
+
+    def sample(self, key, k, rng):
+        with self._lock:
+            bucket = self._buckets.get(key, [])
+            if k > len(bucket):
+                raise PaperAssemblyError(
+                    "Only %d questions available for %s, %d requested." % (len(bucket), key, k))
+            return rng.sample(bucket, k)
+
+
+question_index = QuestionIndex()
+
+
+def _split_marks(target, capacity):
+    """
+    Pick how many questions of each marks value add up to `target`, preferring
+    higher-mark questions. Returns {marks: count} or None if impossible.
+    """
+    values = sorted((marks for marks in capacity if marks > 0), reverse=True)
+
+    @lru_cache(maxsize=None)
+    def solve(i, remaining):
+        if remaining == 0:
+            return ()
+        if i == len(values):
+            return None
+        marks = values[i]
+        for count in range(min(capacity[marks], remaining // marks), -1, -1):
+            rest = solve(i + 1, remaining - count * marks)
+            if rest is not None:
+                return ((marks, count),) + rest
+        return None
+
+    split = solve(0, target)
+    return None if split is None else {marks: count for marks, count in split if count}
+
+
+def _split_target(full_marks, mix):
+    """
+    Turn a difficulty mix of weights into whole marks per level summing to
+    `full_marks` (largest remainder rounding).
+    """
+    total = float(sum(mix.values()))
+    exact = {level: full_marks * weight / total for level, weight in mix.items()}
+    targets = {level: int(value) for level, value in exact.items()}
+    leftover = full_marks - sum(targets.values())
+    for level in sorted(exact, key=lambda level: exact[level] - targets[level], reverse=True)[:leftover]:
+        targets[level] += 1
+    return targets
+
+
+def _spread(count, sizes):
+    """
+    Distribute `count` draws round-robin over buckets with the given sizes.
+    """
+    taken = [0] * len(sizes)
+    while count:
+        progressed = False
+        for i, size in enumerate(sizes):
+            if count and taken[i] < size:
+                taken[i] += 1
+                count -= 1
+                progressed = True
+        if not progressed:
+            raise PaperAssemblyError("Not enough questions to spread across topics.")
+    return taken
+
+
+def assemble_paper(topics, difficulty_mix, full_marks, seed=None):
+    """
+    Draw a question set for a blueprint.
+
+    `topics` is a list of topic ids, `difficulty_mix` maps difficulty levels
+    to relative weights of the marks and `full_marks` is the paper total.
+    Returns the list of question ids.
+    """
+    valid_levels = dict(DIFFICULTY_LEVEL)
+    unknown = [level for level in difficulty_mix if level not in valid_levels]
+    if unknown:
+        raise PaperAssemblyError("Unknown difficulty levels: %s." % ", ".join(unknown))
+    if full_marks <= 0 or not difficulty_mix or sum(difficulty_mix.values()) <= 0:
+        raise PaperAssemblyError("Blueprint needs positive full marks and difficulty weights.")
+
+    question_index.ensure_loaded()
+    rng = random.Random(seed)
+    topics = list(dict.fromkeys(topics))
+    topic_set = set(topics)
+    question_ids = []
+
+    for level, target in _split_target(full_marks, difficulty_mix).items():
+        if target == 0:
+            continue
+        capacity = question_index.marks_for(topic_set, level)
+        split = _split_marks(target, capacity)
+        if split is None:
+            raise PaperAssemblyError(
+                "Cannot make %d marks of %s questions from the selected topics." % (
+                    target, valid_levels[level]))
+        for marks, count in split.items():
+            keys = [(topic, level, marks) for topic in topics]
+            taken = _spread(count, [question_index.size(key) for key in keys])
+            for key, k in zip(keys, taken):
+                if k:
+                    question_ids.extend(question_index.sample(key, k, rng))
+
+    return question_ids
+
+
+def update_question_index(sender, instance=None, **kwargs):
+    # once committed, a rolled back save must not reach the index; a copy,
+    # as the instance may be changed (or deleted) before then
+    question = copy.copy(instance)
+    transaction.on_commit(lambda: question_index.update(question))
+
+
+def discard_question_index(sender, instance=None, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: question_index.discard(pk))
+
+
+post_save.connect(update_question_index, sender=Questions)
+post_delete.connect(discard_question_index, sender=Questions)
@@ -0,0 +1,82 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from rest_framework.exceptions import Throttled
+
+
+def _settings():
+    workers = getattr(settings, 'LOGIN_HASH_WORKERS', None) or os.cpu_count() or 1
+    pending = getattr(settings, 'LOGIN_HASH_PENDING', None) or workers * 8
+    return workers, pending, getattr(settings, 'LOGIN_HASH_WAIT', 5)
+
+
+class HashingPool:
+    """
+    Bounded pool for password hashing.
+
+    PBKDF2, bcrypt and argon2 all release the GIL while hashing, so threads
+    use every core while the request threads only wait on a future. At most
+    `pending` checks are accepted at once; a login that cannot get a slot
+    within `wait` seconds is turned away with 429 instead of piling up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                workers, pending, self.wait = _settings()
+                self._slots = threading.BoundedSemaphore(pending)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        return self._executor
+
+    def run(self, func, *args):
+        executor = self._executor or self._start()
+        if not self._slots.acquire(timeout=self.wait):
+            raise Throttled(wait=1, detail='Too many logins in progress, retry shortly.')
+        try:
+            return executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+
+hashing_pool = HashingPool()
+
+
+def _verify(raw_password, encoded):
+    """
+    (valid, new hash or None). Runs in the pool: CPU only, no database.
+    """
+    if encoded is None:
+        # same cost as a real check, so unknown emails can't be told apart by timing
+        make_password(raw_password)
+        return False, None
+    valid = check_password(raw_password, encoded)
+    if not valid:
+        return False, None
+    preferred = get_hasher('default')
+    try:
+        outdated = identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded)
+    except ValueError:
+        outdated = False
+    return True, make_password(raw_password, hasher=preferred) if outdated else None
+
+
+def verify_password(user, raw_password):
+    """
+    Check a password against a user fetched by the caller (or None) in the
+    hashing pool. When the hash was made by another hasher than the first of
+    PASSWORD_HASHERS, or with fewer iterations, it is replaced right away.
+    """
+    encoded = user.password if user is not None and user.has_usable_password() else None
+    valid, new_encoded = hashing_pool.run(_verify, raw_password or '', encoded)
+    if valid and new_encoded:
+        type(user).objects.filter(pk=user.pk).update(password=new_encoded)
+        user.password = new_encoded
+    return valid
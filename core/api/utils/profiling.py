@@ -0,0 +1,133 @@
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+
+ENGINES = ('cprofile', 'sample')
+EXTENSIONS = {'cprofile': 'pstats', 'sample': 'collapsed'}
+
+
+def requested_by_admin(request):
+    """
+    Whether the request carries the profiling header and credentials of a
+    staff user. Authenticated here with the API's own authentication classes,
+    the view authenticates again later; that only happens with the header.
+    """
+    if not request.META.get(settings.PROFILE_HEADER):
+        return False
+    for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            authenticated = authentication().authenticate(request)
+        except APIException:
+            return False
+        if authenticated is not None:
+            return bool(authenticated[0].is_staff)
+    return False
+
+
+def choose_engine(request):
+    """
+    The profiler to run the request under, or None for most requests.
+    """
+    engine = settings.PROFILE_ENGINE
+    if engine not in ENGINES:
+        return None
+    rate = settings.PROFILE_SAMPLE_RATE
+    if rate and random.random() < rate:
+        return engine
+    return engine if requested_by_admin(request) else None
+
+
+class StackSampler(threading.Thread):
+    """
+    Records the stack of one thread every PROFILE_SAMPLE_INTERVAL seconds,
+    counted per distinct stack in the collapsed format flame graph tools read.
+    Cheaper than cProfile on call heavy code, and the numbers are not skewed
+    by per-call overhead.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append('%s:%s' % (frame.f_globals.get('__name__', '?'), frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, 'w') as out:
+            for stack, count in self.stacks.most_common():
+                out.write('%s %d\n' % (stack, count))
+
+
+class Profile:
+    """
+    Runs the code between start() and stop() under the chosen engine and
+    writes the result to PROFILE_DIR.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._profiler = None
+
+    def start(self):
+        if self.engine == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+            self._profiler.start()
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        if self.engine == 'cprofile':
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def save(self, view):
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        name = '%s-%s-%s.%s' % (
+            time.strftime('%Y%m%d%H%M%S'), re.sub(r'[^\w.-]+', '_', view)[:100], uuid.uuid4().hex[:8],
+            EXTENSIONS[self.engine])
+        path = os.path.join(settings.PROFILE_DIR, name)
+        if self.engine == 'cprofile':
+            self._profiler.dump_stats(path)
+        else:
+            self._profiler.dump(path)
+        return name
+
+
+def profile_path(name):
+    # names come from the database, never let one leave the directory
+    return os.path.join(settings.PROFILE_DIR, os.path.basename(name))
+
+
+def remove_profile(name):
+    try:
+        os.remove(profile_path(name))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,79 @@
+import functools
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting the SQL statements run on a connection.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+
+@contextmanager
+def count_queries(using=DEFAULT_DB_ALIAS):
+    counter = QueryCounter()
+    with connections[using].execute_wrapper(counter):
+        yield counter
+
+
+def _message(label, budget, counter):
+    return "%s ran %d queries, budget is %d:\n%s" % (
+        label, counter.count, budget, "\n".join(counter.queries))
+
+
+def _report(label, budget, counter):
+    message = _message(label, budget, counter)
+    if getattr(settings, 'QUERY_BUDGET_ENFORCE', settings.DEBUG):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextmanager
+def assert_query_budget(budget, using=DEFAULT_DB_ALIAS, label='block'):
+    """
+    Test helper: fail when the wrapped block runs more than `budget` queries.
+    """
+    with count_queries(using) as counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(_message(label, budget, counter))
+
+
+def query_budget(budget, using=DEFAULT_DB_ALIAS):
+    """
+    Declare the maximum number of queries a view (or view method) may run.
+
+    Going over budget raises `QueryBudgetExceeded` when `QUERY_BUDGET_ENFORCE`
+    is set (defaults to DEBUG) and logs a warning otherwise.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with count_queries(using) as counter:
+                response = func(*args, **kwargs)
+            if counter.count > budget:
+                _report(func.__qualname__, budget, counter)
+            return response
+        wrapper.query_budget = budget
+        return wrapper
+    return decorator
@@ -0,0 +1,147 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from django.db.models.functions import Cast
+
+from core.models import Examination, ExaminationResult, Questions
+
+BATCH_SIZE = 1000
+
+
+def _case(question_ids, values):
+    return Case(
+        *[When(pk=pk, then=Value(int(value))) for pk, value in zip(question_ids, values)],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def add_to_counters(question_ids, attempts, correct):
+    """
+    Add a graded batch's per-question attempt and correct totals to the
+    running counters in one UPDATE, recomputing correct_answer_probability
+    from the same (pre-update) row values so it never drifts from them.
+    """
+    touched = [i for i, count in enumerate(attempts) if count]
+    if not touched:
+        return 0
+    question_ids = [int(question_ids[i]) for i in touched]
+    attempts = [attempts[i] for i in touched]
+    correct = [correct[i] for i in touched]
+    attempt_delta = _case(question_ids, attempts)
+    correct_delta = _case(question_ids, correct)
+    return Questions.objects.filter(pk__in=question_ids).update(
+        attempt_count=F('attempt_count') + attempt_delta,
+        correct_count=F('correct_count') + correct_delta,
+        correct_answer_probability=(
+            Cast(F('correct_count') + correct_delta, FloatField()) /
+            Cast(F('attempt_count') + attempt_delta, FloatField())
+        ),
+    )
+
+
+def record_attempts(key, graded, rows=None):
+    """
+    Feed a GradedBatch into the counters; `rows` limits it to some attempts
+    (for instance the ones graded for the first time).
+    """
+    answered, exact = graded.answered, graded.exact
+    if rows is not None:
+        answered, exact = answered[rows], exact[rows]
+    return add_to_counters(key.question_ids, answered.sum(axis=0), exact.sum(axis=0))
+
+
+def count_history(examination_id, first_pk, last_pk):
+    """
+    Per-question attempt and correct totals of the graded attempts of one
+    examination with first_pk <= pk <= last_pk.
+    """
+    from core.api.utils.grading import AnswerKey
+
+    examination = Examination.objects.get(pk=examination_id)
+    key = AnswerKey.load(examination)
+    answers = list(ExaminationResult.objects.filter(
+        examination_id=examination_id, graded_at__isnull=False, pk__gte=first_pk, pk__lte=last_pk
+    ).values_list('answers', flat=True))
+    graded = key.grade(key.encode_many(answers))
+    return key.question_ids, graded.answered.sum(axis=0), graded.exact.sum(axis=0)
+
+
+def history_chunks(chunk_size):
+    """
+    (examination id, first pk, last pk) ranges of at most `chunk_size` graded
+    attempts each, read without loading the attempts themselves.
+    """
+    graded = ExaminationResult.objects.filter(graded_at__isnull=False)
+    for examination_id in graded.values_list('examination_id', flat=True).distinct().order_by():
+        pks = graded.filter(examination_id=examination_id).order_by('pk').values_list('pk', flat=True)
+        first = previous = None
+        size = 0
+        for pk in pks.iterator(chunk_size=10000):
+            if first is None:
+                first = pk
+            previous = pk
+            size += 1
+            if size == chunk_size:
+                yield examination_id, first, previous
+                first, size = None, 0
+        if first is not None:
+            yield examination_id, first, previous
+
+
+def rebuild_counters(workers=1, chunk_size=20000, progress=None):
+    """
+    Recount every question's attempts from the stored results, spreading the
+    chunks over `workers` processes, and overwrite the counters. Returns the
+    number of questions updated.
+
+    The questions are locked from before the count until the overwrite, so
+    an attempt graded meanwhile (grade_results() updates its questions in the
+    same transaction) is either counted here or added on top afterwards.
+    """
+    totals = {}
+
+    def collect(result):
+        question_ids, attempts, correct = result
+        for pk, attempt_total, correct_total in zip(question_ids.tolist(), attempts.tolist(), correct.tolist()):
+            previous = totals.get(pk, (0, 0))
+            totals[pk] = (previous[0] + attempt_total, previous[1] + correct_total)
+        if progress:
+            progress(len(chunks))
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # blocks grading, not reading; only one rebuild at a time
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE core_questions IN SHARE ROW EXCLUSIVE MODE')
+        # plain pks, so no cursor over the table stays open while it is updated
+        pks = list(Questions.objects.select_for_update().order_by('pk').values_list('pk', flat=True))
+        chunks = list(history_chunks(chunk_size))
+
+        if workers > 1 and len(chunks) > 1:
+            # spawned, not forked: a forked worker would share the socket of
+            # the connection holding the lock
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=django.setup) as pool:
+                for result in pool.map(count_history, *zip(*chunks)):
+                    collect(result)
+        else:
+            for chunk in chunks:
+                collect(count_history(*chunk))
+
+        for start in range(0, len(pks), BATCH_SIZE):
+            questions = []
+            for pk in pks[start:start + BATCH_SIZE]:
+                attempts, correct = totals.get(pk, (0, 0))
+                questions.append(Questions(
+                    pk=pk,
+                    attempt_count=attempts,
+                    correct_count=correct,
+                    correct_answer_probability=correct / attempts if attempts else 0,
+                ))
+            Questions.objects.bulk_update(
+                questions, ['attempt_count', 'correct_count', 'correct_answer_probability'])
+    return len(pks)
@@ -0,0 +1,74 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Value, When
+from django.db.models.functions import Cast
+
+from core.models import Questions, QuestionOptions
+
+# must match the configuration used by the triggers in migration 0007
+SEARCH_CONFIG = 'english'
+
+# ordering used for keyset pagination of search results
+SEARCH_ORDERING = ('-rank', 'pk')
+
+
+def _rank(expression):
+    # ts_rank() and similarity() return real; as double precision the value
+    # survives the round trip through a pagination cursor exactly
+    return Cast(expression, FloatField())
+
+
+def filter_questions(queryset, topic=None, subject=None, difficulty_level=None):
+    if topic:
+        queryset = queryset.filter(topic_id=topic)
+    if subject:
+        queryset = queryset.filter(topic__subject_id=subject)
+    if difficulty_level:
+        queryset = queryset.filter(difficulty_level=difficulty_level)
+    return queryset
+
+
+def _full_text(queryset, term):
+    query = SearchQuery(term, config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        rank=_rank(SearchRank(F('search_vector'), query)))
+
+
+def _trigram(queryset, term):
+    return queryset.filter(description__trigram_similar=term).annotate(
+        rank=_rank(TrigramSimilarity('description', term)))
+
+
+def _contains(queryset, term):
+    in_options = QuestionOptions.objects.filter(
+        for_question=OuterRef('pk'), description__icontains=term)
+    return queryset.filter(Q(description__icontains=term) | Exists(in_options)).annotate(
+        rank=Case(
+            When(description__icontains=term, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField()
+        ))
+
+
+def search_questions(term, queryset=None, **filters):
+    """
+    Questions matching `term` in their description or option texts, annotated
+    with a `rank` to order by (see SEARCH_ORDERING).
+
+    On PostgreSQL this uses the trigger-maintained `search_vector` (GIN
+    indexed) and falls back to trigram similarity on the description when
+    the full-text query has no hits, so misspellings still find something.
+    Other databases get a degraded icontains scan, which is only meant for
+    local development and tests.
+    """
+    if queryset is None:
+        queryset = Questions.objects.all()
+    queryset = filter_questions(queryset, **filters)
+
+    if connections[queryset.db].vendor != 'postgresql':
+        return _contains(queryset, term)
+
+    matches = _full_text(queryset, term)
+    if matches.exists():
+        return matches
+    return _trigram(queryset, term)
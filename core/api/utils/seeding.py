@@ -0,0 +1,117 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from rest_framework.authtoken.models import Token
+
+from core.models import User, Subject, Topics, Questions, QuestionOptions, Examination, DIFFICULTY_LEVEL
+from core.api.utils.cache import bump_versions
+from core.api.utils.paper import question_index
+
+BENCH_PASSWORD = 'bench-password'
+LEVELS = [level for level, _ in DIFFICULTY_LEVEL]
+WORDS = ('which', 'of', 'the', 'following', 'is', 'a', 'correct', 'value', 'for', 'given',
+         'reaction', 'equation', 'when', 'angle', 'force', 'energy', 'cell', 'matrix', 'velocity', 'acid')
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def bench_email(prefix, number):
+    return 'bench%d@%s.bench.invalid' % (number, prefix.lower())
+
+
+def bulk_create_with_pks(model, rows, batch_size):
+    # backends without INSERT .. RETURNING (SQLite before Django 4) leave
+    # the pks unset; rows inserted in one transaction get increasing ones
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(rows, batch_size=batch_size)
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    model.objects.bulk_create(rows, batch_size=batch_size)
+    for row, pk in zip(rows, model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)):
+        row.pk = pk
+    return rows
+
+
+def seed(prefix='B', subjects=10, topics=200, questions=10000, options=4, users=100,
+         examinations=20, paper_size=50, seed=0, batch_size=5000):
+    """
+    Bulk insert a synthetic question bank, candidates and examinations. Rows
+    are told apart by `prefix`: subject and topic ids start with it and
+    examinations and user emails carry it, so clear() can remove them again.
+    bulk_create sends no signals, so caches are invalidated here.
+    """
+    rng = random.Random(seed)
+    if len(prefix) != 1 or not prefix.isalpha():
+        raise ValueError('The prefix must be a single letter.')
+    if not 0 < subjects <= 100 or not 0 < topics <= 100000:
+        raise ValueError('Between 1 and 100 subjects and 1 and 100000 topics per prefix.')
+
+    with transaction.atomic():
+        subject_rows = Subject.objects.bulk_create([
+            Subject(_id='%s%02d' % (prefix, s), name='%s subject %d' % (prefix, s)) for s in range(subjects)])
+        topic_rows = Topics.objects.bulk_create([
+            Topics(_id='%s%05d' % (prefix, t), name='%s topic %d' % (prefix, t), subject=subject_rows[t % subjects])
+            for t in range(topics)], batch_size=batch_size)
+        question_rows = bulk_create_with_pks(Questions, [
+            Questions(description=sentence(rng, rng.randint(12, 40)) + '?', topic=rng.choice(topic_rows),
+                      difficulty_level=rng.choice(LEVELS), marks_allotted=rng.choice((1, 2, 4)))
+            for _ in range(questions)], batch_size)
+        QuestionOptions.objects.bulk_create([
+            QuestionOptions(for_question=question, description=sentence(rng, rng.randint(1, 6)), is_correct=o == 0)
+            for question in question_rows for o in range(options)], batch_size=batch_size)
+
+        # one hash for everyone, hashing each password would dominate seeding
+        password = make_password(BENCH_PASSWORD)
+        user_rows = bulk_create_with_pks(User, [
+            User(email=bench_email(prefix, u), first_name='Bench', last_name=str(u), password=password)
+            for u in range(users)], batch_size)
+        # what the post_save signal gives every new user
+        Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in user_rows],
+                                  batch_size=batch_size)
+
+        examination_rows = bulk_create_with_pks(Examination, [
+            Examination(exam_name='%s examination %d' % (prefix, e), full_marks=paper_size * 2)
+            for e in range(examinations)], batch_size)
+        # through the link table, so no snapshot signal fires per examination
+        Link = Examination.questions.through
+        Link.objects.bulk_create([
+            Link(examination=examination, questions=question)
+            for examination in examination_rows
+            for question in rng.sample(question_rows, min(paper_size, len(question_rows)))], batch_size=batch_size)
+
+    question_index.invalidate()
+    bump_versions(Subject, Topics, Questions, QuestionOptions)
+    return {
+        'subjects': subject_rows,
+        'topics': topic_rows,
+        'questions': question_rows,
+        'examinations': examination_rows,
+    }
+
+
+def clear(prefix='B'):
+    """
+    Remove what seed() inserted under `prefix`. Deleted with plain DELETEs
+    (children first) rather than through the collector, which would load
+    every question to send its delete signals.
+    """
+    # only the ids seed() makes, real subjects may start with the same letter
+    subjects = Subject.objects.filter(_id__regex=r'^%s[0-9]{2}$' % prefix)
+    topics = Topics.objects.filter(subject__in=subjects)
+    questions = Questions.objects.filter(topic__in=topics)
+    examinations = Examination.objects.filter(exam_name__startswith='%s examination ' % prefix)
+    Link = Examination.questions.through
+    with transaction.atomic():
+        deleted = Link.objects.filter(examination__in=examinations)._raw_delete(DEFAULT_DB_ALIAS)
+        deleted += Link.objects.filter(questions__in=questions)._raw_delete(DEFAULT_DB_ALIAS)
+        deleted += examinations.delete()[0]
+        deleted += QuestionOptions.objects.filter(for_question__in=questions)._raw_delete(DEFAULT_DB_ALIAS)
+        deleted += questions._raw_delete(DEFAULT_DB_ALIAS)
+        deleted += topics._raw_delete(DEFAULT_DB_ALIAS)
+        deleted += subjects._raw_delete(DEFAULT_DB_ALIAS)
+        deleted += User.objects.filter(email__endswith='@%s.bench.invalid' % prefix.lower()).delete()[0]
+    question_index.invalidate()
+    bump_versions(Subject, Topics, Questions, QuestionOptions)
+    return deleted
@@ -0,0 +1,239 @@
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import orjson
+from django.conf import settings
+
+from core.api.utils.snapshots import get_snapshot, get_snapshot_version
+
+# splitmix64 constants; plain 64-bit integer arithmetic, so an ordering is
+# the same in every process and with every NumPy version
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX2 = np.uint64(0x94D049BB133111EB)
+# questions and options are keyed apart, their ids share one number space
+OPTION_SALT = 0x5851F42D4C957F2D
+
+LAYOUTS_KEPT = 64
+
+
+class PaperChanged(Exception):
+    """
+    Option positions given on another version of a shuffled paper than the
+    current one, so they may point at other options now.
+    """
+
+
+def candidate_seed(examination_id, candidate_id):
+    """
+    64 bits derived from the examination, the candidate and SHUFFLE_SECRET.
+    Without the secret a candidate cannot work out anyone else's order.
+    """
+    message = ('%s:%s' % (examination_id, candidate_id)).encode()
+    digest = hmac.new(settings.SHUFFLE_SECRET.encode(), message, hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def mix(seed, ids):
+    # splitmix64 of id + seed: a sort key per id that looks random
+    z = ids * GOLDEN + np.uint64(seed)
+    z = (z ^ (z >> np.uint64(30))) * MIX1
+    z = (z ^ (z >> np.uint64(27))) * MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+class Ordering:
+    """
+    One candidate's order. `questions` holds canonical question columns in
+    displayed order; `options[offsets[column] + position]` is the flat index
+    of the option shown at `position` of that question.
+    """
+    __slots__ = ('questions', 'options')
+
+    def __init__(self, questions, options):
+        self.questions = questions
+        self.options = options
+
+
+class PaperLayout:
+    """
+    The question and option ids of a paper in canonical (pk) order, as flat
+    arrays. An ordering sorts them by a seeded key, so it is computed on the
+    fly rather than stored: nothing is written per candidate, and removing a
+    question or option leaves the others in the same relative order.
+    """
+
+    def __init__(self, question_ids, option_ids, option_counts):
+        self.question_ids = np.asarray(question_ids, dtype=np.uint64)
+        self.option_ids = np.asarray(option_ids, dtype=np.uint64)
+        counts = np.asarray(option_counts, dtype=np.intp)
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.intp)
+        self.option_columns = np.repeat(np.arange(len(counts)), counts)
+        self.columns = {int(pk): column for column, pk in enumerate(question_ids)}
+        # plain ints for the per-answer lookups
+        self._option_ids = [int(pk) for pk in option_ids]
+        self._offsets = self.offsets.tolist()
+        # changes with any question or option added or removed, which is
+        # what moves positions; edits to their text leave it alone
+        digest = hashlib.blake2b(digest_size=8)
+        for array in (self.question_ids, self.option_ids, self.offsets.astype(np.int64)):
+            digest.update(array.tobytes())
+        self.version = digest.hexdigest()
+
+    @classmethod
+    def from_paper(cls, examination):
+        questions = examination['questions']
+        return cls(
+            [question['_id'] for question in questions],
+            [option['_id'] for question in questions for option in question['options']],
+            [len(question['options']) for question in questions],
+        )
+
+    def order(self, seed):
+        questions = np.argsort(mix(seed, self.question_ids), kind='stable')
+        keys = mix(seed ^ OPTION_SALT, self.option_ids)
+        # grouped by question column, by key within each question
+        options = np.lexsort((keys, self.option_columns))
+        return Ordering(questions, options)
+
+    def option_ids_for(self, ordering, answers):
+        """
+        Translate {question id: [displayed positions]} into
+        {question id: [option ids]}, O(1) per selected option. Raises
+        ValueError for a question that is not on the paper or a position
+        past its options.
+        """
+        options = ordering.options.tolist()
+        translated = {}
+        for question_id, positions in answers.items():
+            column = self.columns.get(int(question_id))
+            if column is None:
+                raise ValueError('Question %s is not part of this examination.' % question_id)
+            start, end = self._offsets[column], self._offsets[column + 1]
+            selected = []
+            for position in positions:
+                if not 0 <= position < end - start:
+                    raise ValueError('Question %s has no option at position %s.' % (question_id, position))
+                selected.append(self._option_ids[options[start + position]])
+            translated[question_id] = selected
+        return translated
+
+    def shuffled(self, examination, ordering):
+        """
+        A copy of the serialized paper in the candidate's order, with each
+        option's id replaced by its displayed position.
+        """
+        questions = examination['questions']
+        return dict(examination, questions=[
+            self.shuffled_question(questions[column], column, ordering) for column in ordering.questions.tolist()
+        ])
+
+    def shuffled_question(self, question, column, ordering):
+        start = self._offsets[column]
+        flat = ordering.options[start:self._offsets[column + 1]].tolist()
+        return dict(question, options=[
+            _displayed(question['options'][index - start], position) for position, index in enumerate(flat)
+        ])
+
+
+def _displayed(option, position):
+    # option ids follow creation order, which could give the answer away
+    option = dict(option, position=position)
+    del option['_id']
+    return option
+
+
+class Paper:
+    __slots__ = ('version', 'envelope', 'layout')
+
+    def __init__(self, version, envelope, layout):
+        self.version = version
+        self.envelope = envelope
+        self.layout = layout
+
+    @property
+    def examination(self):
+        return self.envelope['data']['examination']
+
+    @property
+    def shuffle(self):
+        return self.examination.get('shuffle', False)
+
+    @property
+    def adaptive(self):
+        return self.examination.get('adaptive', False)
+
+    def ordering(self, candidate_id):
+        return self.layout.order(candidate_seed(self.examination['id'], candidate_id))
+
+    def for_candidate(self, candidate_id):
+        """
+        The response data of the paper as this candidate sees it, shuffled
+        ones with the version their answers are given with.
+        """
+        if not self.shuffle:
+            return self.envelope
+        examination = dict(self.layout.shuffled(self.examination, self.ordering(candidate_id)),
+                           version=self.layout.version)
+        return dict(self.envelope, data=dict(self.envelope['data'], examination=examination))
+
+    def question(self, candidate_id, question_id):
+        """
+        One question as this candidate sees it, None if it is not on the paper.
+        """
+        column = self.layout.columns.get(question_id)
+        if column is None:
+            return None
+        question = self.examination['questions'][column]
+        if not self.shuffle:
+            return question
+        return self.layout.shuffled_question(question, column, self.ordering(candidate_id))
+
+    def option_ids_for(self, candidate_id, answers, version=None):
+        """
+        Option ids of the answers to a shuffled paper given as positions on
+        its `version`, see PaperLayout.option_ids_for. Raises PaperChanged
+        if the paper is at another version now.
+        """
+        if not self.shuffle:
+            return answers
+        if version is None:
+            raise ValueError('Answers to a shuffled paper are given with its version.')
+        if version != self.layout.version:
+            raise PaperChanged('The paper changed since it was fetched, fetch it again.')
+        return self.layout.option_ids_for(self.ordering(candidate_id), answers)
+
+
+_papers = OrderedDict()
+_papers_lock = threading.Lock()
+
+
+def load_paper(examination_id):
+    """
+    The decoded paper snapshot and its layout, kept per worker for as long
+    as the snapshot version stays the same. None for an unknown examination.
+    """
+    version = get_snapshot_version(examination_id)
+    if version is not None:
+        with _papers_lock:
+            paper = _papers.get(examination_id)
+            if paper is not None and paper.version == version:
+                _papers.move_to_end(examination_id)
+                return paper
+    # without a version the cache does not keep the snapshot (a dummy cache,
+    # or one too large for it): built for this call only
+    content = get_snapshot(examination_id)
+    if content is None:
+        return None
+    envelope = orjson.loads(content)
+    paper = Paper(version, envelope, PaperLayout.from_paper(envelope['data']['examination']))
+    if version is not None:
+        with _papers_lock:
+            _papers[examination_id] = paper
+            _papers.move_to_end(examination_id)
+            while len(_papers) > LAYOUTS_KEPT:
+                _papers.popitem(last=False)
+    return paper
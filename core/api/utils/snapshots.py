@@ -0,0 +1,144 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+
+from core.models import Examination, Questions, QuestionOptions
+from core.api.renderers import MessagePackRenderer, ORJSONRenderer
+from core.api.utils.cache import bump_counter, get_cache, get_counter
+from core.routers import primary
+
+# every encoding a paper can be negotiated in, built together
+SNAPSHOT_RENDERERS = {
+    'json': ORJSONRenderer(),
+    'msgpack': MessagePackRenderer(),
+}
+
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def generation_key(examination_id):
+    return 'exam:paper:%s:generation' % examination_id
+
+
+def get_generation(examination_id):
+    """
+    The counter the examination's snapshots are stored under, bumped by
+    every change to its paper.
+    """
+    return get_counter(generation_key(examination_id))
+
+
+def snapshot_key(examination_id, generation, format='json'):
+    return 'exam:paper:%s:%s:%s' % (examination_id, generation, format)
+
+
+def _build_lock(examination_id):
+    with _build_locks_lock:
+        return _build_locks.setdefault(examination_id, threading.Lock())
+
+
+def build_snapshot(examination_id, format='json'):
+    """
+    Render an examination's candidate-facing paper once, encode it in every
+    format and store the bytes in the cache. Returns those of `format`, or
+    None for an unknown examination. Read from the primary, the snapshot is
+    kept until the examination changes, PAPER_SNAPSHOT_TIMEOUT at most.
+    """
+    from core.api.serializers import PaperSerializer
+
+    # before reading, a change committed meanwhile retires what is built here
+    generation = get_generation(examination_id)
+    with primary():
+        examination = PaperSerializer.setup_eager_loading(
+            Examination.objects.filter(pk=examination_id)).first()
+        if examination is None:
+            return None
+        data = {}
+        data['data'] = {
+            'examination': PaperSerializer(examination).data,
+        }
+    data['message'] = "Fetched examination paper successfully."
+    encoded = {
+        snapshot_key(examination_id, generation, name): renderer.render(data)
+        for name, renderer in SNAPSHOT_RENDERERS.items()
+    }
+    # what the paper's ETag is made of, see get_snapshot_version
+    encoded[snapshot_key(examination_id, generation, 'version')] = time.time_ns()
+    get_cache().set_many(encoded, getattr(settings, 'PAPER_SNAPSHOT_TIMEOUT', 300))
+    return encoded[snapshot_key(examination_id, generation, format)]
+
+
+def get_snapshot(examination_id, format='json'):
+    """
+    The pre-encoded paper, built on first use. Concurrent misses in a worker
+    wait for one build instead of all rendering the same paper.
+    """
+    key = snapshot_key(examination_id, get_generation(examination_id), format)
+    content = get_cache().get(key)
+    if content is not None:
+        return content
+    with _build_lock(examination_id):
+        content = get_cache().get(key)
+        if content is None:
+            content = build_snapshot(examination_id, format)
+    return content
+
+
+def get_snapshot_version(examination_id):
+    """
+    A value that changes whenever the paper is rebuilt (building it if
+    needed), or None for an unknown examination.
+    """
+    version = get_cache().get(snapshot_key(examination_id, get_generation(examination_id), 'version'))
+    if version is None and get_snapshot(examination_id) is not None:
+        version = get_cache().get(snapshot_key(examination_id, get_generation(examination_id), 'version'))
+    return version
+
+
+def retire_snapshots(examination_ids):
+    """
+    Retire the snapshots of these examinations once the transaction
+    commits, so that the next request rebuilds them from what was written.
+    Any number of changes to a paper cost one rebuild, on its next read.
+    """
+    examination_ids = set(examination_ids)
+    if examination_ids:
+        transaction.on_commit(lambda: [bump_counter(generation_key(pk)) for pk in examination_ids])
+
+
+def examination_changed(sender, instance=None, **kwargs):
+    retire_snapshots([instance.pk])
+
+
+def paper_changed(sender, instance=None, reverse=False, action=None, pk_set=None, **kwargs):
+    if reverse:
+        # question.examination.add/remove/clear(); a clear leaves no pk_set
+        if action == 'pre_clear':
+            retire_snapshots(instance.examination.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            retire_snapshots(pk_set or ())
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        retire_snapshots([instance.pk])
+
+
+def question_changed(sender, instance=None, **kwargs):
+    retire_snapshots(Examination.objects.filter(questions=instance).values_list('pk', flat=True))
+
+
+def option_changed(sender, instance=None, **kwargs):
+    retire_snapshots(Examination.objects.filter(
+        questions=instance.for_question_id).values_list('pk', flat=True))
+
+
+m2m_changed.connect(paper_changed, sender=Examination.questions.through)
+post_save.connect(examination_changed, sender=Examination)
+post_delete.connect(examination_changed, sender=Examination)
+post_save.connect(question_changed, sender=Questions)
+# before the delete cascades through the examination links
+pre_delete.connect(question_changed, sender=Questions)
+post_save.connect(option_changed, sender=QuestionOptions)
+post_delete.connect(option_changed, sender=QuestionOptions)
@@ -0,0 +1,82 @@
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from core.models import Questions, TopicStats
+
+STAT_FIELDS = ('question_count', 'total_marks')
+
+
+def counted_stats():
+    """
+    {(subject, topic, difficulty_level): (question_count, total_marks)}
+    counted over all of Questions, what TopicStats should hold.
+    """
+    rows = Questions.objects.filter(topic__isnull=False).values(
+        'topic__subject_id', 'topic_id', 'difficulty_level'
+    ).annotate(question_count=Count('pk'), total_marks=Sum('marks_allotted')).order_by()
+    return {
+        (row['topic__subject_id'], row['topic_id'], row['difficulty_level']): (row['question_count'], row['total_marks'])
+        for row in rows
+    }
+
+
+def reconcile(dry_run=False):
+    """
+    Compare TopicStats with a full count and repair the rows that drifted.
+    Questions are locked against writes meanwhile on PostgreSQL, so the
+    triggers cannot change rows between the count and the repair. Returns
+    the number of rows inserted, updated and deleted (or that would be).
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE core_questions IN SHARE MODE')
+        expected = counted_stats()
+        stored = {}
+        for stats in TopicStats.objects.select_for_update().order_by():
+            stored[(stats.topic_id, stats.difficulty_level)] = stats
+
+        stale, missing = [], []
+        for (subject, topic, level), (question_count, total_marks) in expected.items():
+            stats = stored.pop((topic, level), None)
+            if stats is None:
+                missing.append(TopicStats(subject_id=subject, topic_id=topic, difficulty_level=level,
+                                          question_count=question_count, total_marks=total_marks))
+            elif (stats.subject_id, stats.question_count, stats.total_marks) != (subject, question_count, total_marks):
+                stats.subject_id, stats.question_count, stats.total_marks = subject, question_count, total_marks
+                stale.append(stats)
+        changes = {'inserted': len(missing), 'updated': len(stale), 'deleted': len(stored)}
+        if not dry_run:
+            TopicStats.objects.bulk_create(missing, batch_size=1000)
+            TopicStats.objects.bulk_update(stale, ('subject',) + STAT_FIELDS, batch_size=1000)
+            TopicStats.objects.filter(pk__in=[stats.pk for stats in stored.values()]).delete()
+    return changes
+
+
+def taxonomy_stats(subject=None):
+    """
+    Question counts and marks per subject, topic and difficulty level, read
+    from TopicStats in one query (a row per topic and level).
+    """
+    rows = TopicStats.objects.values_list(
+        'subject_id', 'subject__name', 'topic_id', 'topic__name', 'difficulty_level', *STAT_FIELDS
+    ).order_by('subject_id', 'topic_id', 'difficulty_level')
+    if subject:
+        rows = rows.filter(subject_id=subject)
+    subjects = []
+    for subject_id, subject_name, topic_id, topic_name, level, question_count, total_marks in rows:
+        if not subjects or subjects[-1]['_id'] != subject_id:
+            subjects.append({'_id': subject_id, 'name': subject_name,
+                             'question_count': 0, 'total_marks': 0, 'topics': []})
+        topics = subjects[-1]['topics']
+        if not topics or topics[-1]['_id'] != topic_id:
+            topics.append({'_id': topic_id, 'name': topic_name,
+                           'question_count': 0, 'total_marks': 0, 'levels': {}})
+        topics[-1]['levels'][level] = {
+            'question_count': question_count,
+            'total_marks': total_marks,
+        }
+        for total in (subjects[-1], topics[-1]):
+            total['question_count'] += question_count
+            total['total_marks'] += total_marks
+    return subjects
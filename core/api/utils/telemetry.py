@@ -0,0 +1,239 @@
+import atexit
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# upper bounds of the histogram buckets, the last one is +Inf
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Total time spent in the request.', SECONDS_BUCKETS),
+    'http_request_db_seconds': ('Time spent executing SQL.', SECONDS_BUCKETS),
+    'http_request_db_queries': ('SQL statements executed.', QUERY_BUCKETS),
+    'http_request_serialize_seconds': ('Time spent in serializer.data, including the queries it ran.', SECONDS_BUCKETS),
+    'http_request_render_seconds': ('Time spent rendering the response body.', SECONDS_BUCKETS),
+}
+COUNTERS = {
+    'http_requests_total': 'Requests handled.',
+}
+
+_current = ContextVar('telemetry_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('started', 'db_queries', 'db_time', 'serialize_time', 'render_time', 'render_started', '_serializing')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self._serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute wrapper, installed on every connection for the request
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+    def server_timing(self, total):
+        return 'db;dur=%.2f;desc="%d queries", serialize;dur=%.2f, render;dur=%.2f, total;dur=%.2f' % (
+            self.db_time * 1000, self.db_queries, self.serialize_time * 1000, self.render_time * 1000, total * 1000)
+
+
+def current_timings():
+    return _current.get()
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def render_started(response):
+    timings = _current.get()
+    if timings is not None:
+        timings.render_started = time.perf_counter()
+
+        def render_finished(response):
+            timings.render_time += time.perf_counter() - timings.render_started
+        response.add_post_render_callback(render_finished)
+    return response
+
+
+def install_serializer_timing():
+    """
+    Time serializer.data. Only the outermost call is counted, the nested
+    serializers a SerializerMethodField builds run inside it.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, 'timed', False):
+        return
+
+    def timed_data(self):
+        timings = _current.get()
+        if timings is None or timings._serializing:
+            return data.fget(self)
+        timings._serializing = True
+        started = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            timings.serialize_time += time.perf_counter() - started
+            timings._serializing = False
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
+
+
+class Telemetry:
+    """
+    Per-view histograms and counters of one worker process. With
+    TELEMETRY_DIR set every worker writes its numbers there at most every
+    TELEMETRY_FLUSH_INTERVAL seconds (and on exit), and the metrics endpoint
+    adds up the files of all workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._flushed_at = time.monotonic()
+        self._path = None
+
+    def _observe(self, name, labels, value):
+        key = (name, labels)
+        entry = self._histograms.get(key)
+        if entry is None:
+            entry = self._histograms[key] = [[0] * (len(HISTOGRAMS[name][1]) + 1), 0.0, 0]
+        entry[0][bisect_left(HISTOGRAMS[name][1], value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def record(self, view, method, status, timings, total):
+        labels = (('view', view), ('method', method))
+        with self._lock:
+            self._observe('http_request_duration_seconds', labels, total)
+            self._observe('http_request_db_seconds', labels, timings.db_time)
+            self._observe('http_request_db_queries', labels, timings.db_queries)
+            self._observe('http_request_serialize_seconds', labels, timings.serialize_time)
+            self._observe('http_request_render_seconds', labels, timings.render_time)
+            key = ('http_requests_total', labels + (('status', str(status)),))
+            self._counters[key] = self._counters.get(key, 0) + 1
+        if settings.TELEMETRY_DIR and time.monotonic() - self._flushed_at > settings.TELEMETRY_FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[name, dict(labels), list(counts), total, count]
+                               for (name, labels), (counts, total, count) in self._histograms.items()],
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        directory = settings.TELEMETRY_DIR
+        if not directory:
+            return
+        with self._flush_lock:
+            if self._path is None:
+                os.makedirs(directory, exist_ok=True)
+                # the start time keeps a restarted worker that gets the same
+                # pid from overwriting its predecessor's counts
+                self._path = os.path.join(directory, 'telemetry-%s-%d-%d.json' % (
+                    socket.gethostname(), os.getpid(), time.time_ns()))
+                atexit.register(self.flush)
+            partial = self._path + '.tmp'
+            with open(partial, 'w') as out:
+                json.dump(self.snapshot(), out)
+            os.replace(partial, self._path)
+
+    def collect(self):
+        """
+        The snapshots of every worker (just this one without TELEMETRY_DIR).
+        """
+        if not settings.TELEMETRY_DIR:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(settings.TELEMETRY_DIR, 'telemetry-*.json')):
+            try:
+                with open(path) as snapshot:
+                    snapshots.append(json.load(snapshot))
+            except (OSError, ValueError):
+                # removed or replaced meanwhile
+                continue
+        return snapshots
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for key, value in sorted(labels.items()))
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(snapshots):
+    """
+    Add up worker snapshots and format them in the Prometheus text format.
+    """
+    histograms, counters = {}, {}
+    for snapshot in snapshots:
+        for name, labels, counts, total, count in snapshot['histograms']:
+            if name not in HISTOGRAMS or len(counts) != len(HISTOGRAMS[name][1]) + 1:
+                continue
+            key = (name, tuple(sorted(labels.items())))
+            entry = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += count
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s histogram' % name)
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append('%s_bucket%s %d' % (name, _labels(labels, le=bound), cumulative))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), _number(total)))
+            lines.append('%s_count%s %d' % (name, _labels(labels), count))
+    for name, description in COUNTERS.items():
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s counter' % name)
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append('%s%s %d' % (name, _labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+telemetry = Telemetry()
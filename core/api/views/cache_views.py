@@ -0,0 +1,17 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.views import APIView
+from core.api.utils.cache import metrics
+
+
+class CacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        data = {}
+        data['data'] = {
+            'cache': metrics.snapshot(),
+        }
+        data['message'] = "Fetched cache statistics successfully."
+        return Response(data, status=status.HTTP_200_OK)
@@ -0,0 +1,383 @@
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.generics import CreateAPIView
+from rest_framework.views import APIView
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from core.models import Examination, ExaminationResult, Questions
+from core.api.renderers import MessagePackRenderer, ORJSONRenderer, NDJSONRenderer, CSVRenderer
+from core.api.serializers import ExaminationSerializer, PaperBlueprintSerializer, ExaminationResultSerializer, ExaminationSubmitSerializer, ExaminationAutosaveSerializer, ExaminationAdaptiveAnswerSerializer
+from core.api.utils.paper import assemble_paper, question_index, PaperAssemblyError
+from core.api.utils.snapshots import get_snapshot, get_snapshot_version
+from core.api.utils.etags import conditional
+from core.api.utils.autosave import SUBMITTED_ANSWERS, autosave_buffer, examination_exists, micros
+from core.api.utils.shuffle import PaperChanged, load_paper
+from core.api.utils.adaptive import item_banks
+from core.api.utils.export import export_response
+
+
+class ExaminationGenerateView(CreateAPIView):
+    queryset = Examination.objects.all()
+    serializer_class = PaperBlueprintSerializer
+    permission_classes = (IsAdminUser,)
+
+    def assemble(self, blueprint):
+        question_ids = assemble_paper(
+            blueprint['topics'], blueprint['difficulty_mix'], blueprint['full_marks'], seed=blueprint.get('seed'))
+        existing = set(Questions.objects.filter(pk__in=question_ids).values_list('pk', flat=True))
+        if len(existing) == len(question_ids):
+            return question_ids
+        # another worker deleted questions since this index was loaded
+        question_index.load()
+        return assemble_paper(
+            blueprint['topics'], blueprint['difficulty_mix'], blueprint['full_marks'], seed=blueprint.get('seed'))
+
+    def create(self, request, *args, **kwargs):
+        blueprint_serializer = self.get_serializer(data=request.data)
+        blueprint_serializer.is_valid(raise_exception=True)
+        blueprint = blueprint_serializer.validated_data
+
+        try:
+            question_ids = self.assemble(blueprint)
+        except PaperAssemblyError as e:
+            data = {
+                "message": "failure",
+                "reason": str(e)
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        mix = blueprint['difficulty_mix']
+        with transaction.atomic():
+            exam = Examination.objects.create(
+                exam_name=blueprint.get('exam_name'),
+                exam_date=blueprint.get('exam_date'),
+                difficulty_level=blueprint.get('difficulty_level') or max(mix, key=mix.get),
+                full_marks=blueprint['full_marks'],
+                max_time=blueprint['max_time'],
+                exam_type=blueprint['exam_type'],
+                shuffle=blueprint['shuffle'],
+                adaptive=blueprint['adaptive'],
+                adaptive_length=blueprint['adaptive_length'],
+            )
+            exam.questions.set(question_ids)
+
+        data = {}
+        data['data'] = {
+            'examination': ExaminationSerializer(exam).data,
+        }
+        data['message'] = "Examination paper generated successfully."
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Http404):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return super().handle_exception(exc)
+
+
+def candidate_answers(examination_id, candidate_id, answers, version=None):
+    # option positions of shuffled papers become option ids, which is what
+    # results store and grading reads
+    paper = load_paper(examination_id)
+    if paper is None:
+        return answers
+    if paper.adaptive:
+        raise ValueError('Adaptive examinations are answered one question at a time.')
+    return paper.option_ids_for(candidate_id, answers, version)
+
+
+def paper_changed(e):
+    data = {
+        "message": "failure",
+        "reason": {"version": str(e)}
+    }
+    return Response(data, status=status.HTTP_409_CONFLICT)
+
+
+def paper_version(request, pk):
+    version = get_snapshot_version(pk)
+    if version is None:
+        return None
+    # shuffled papers differ per candidate
+    return version, request.user.pk
+
+
+class ExaminationSubmitView(CreateAPIView):
+    queryset = Examination.objects.all()
+    serializer_class = ExaminationSubmitSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def create(self, request, *args, **kwargs):
+        examination = get_object_or_404(Examination.objects.only('pk', 'adaptive'), pk=self.kwargs['pk'])
+        if examination.adaptive:
+            data = {
+                "message": "failure",
+                "reason": "Adaptive examinations are submitted with their last answer."
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # answers autosaved through this worker are in before the attempt
+        # closes; those other workers still hold follow once they flush
+        autosave_buffer.flush()
+        defaults = {
+            'submitted_at': timezone.now(),
+            'graded_at': None,
+        }
+        if 'answers' in serializer.validated_data:
+            try:
+                defaults['answers'] = candidate_answers(examination.pk, request.user.pk,
+                                                        serializer.validated_data['answers'],
+                                                        serializer.validated_data.get('version'))
+                defaults['answer_versions'] = {SUBMITTED_ANSWERS: micros(defaults['submitted_at'])}
+            except PaperChanged as e:
+                return paper_changed(e)
+            except ValueError as e:
+                data = {
+                    "message": "failure",
+                    "reason": {"answers": str(e)}
+                }
+                return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        # graded in batches by `manage.py grade_examination`; only once, a
+        # second submit would count the attempt in the question counters again
+        with transaction.atomic():
+            result, _ = ExaminationResult.objects.select_for_update().get_or_create(
+                examination=examination,
+                candidate_id=request.user.pk,
+            )
+            if result.submitted_at is not None:
+                data = {
+                    "message": "failure",
+                    "reason": "Answers to this examination were already submitted."
+                }
+                return Response(data, status=status.HTTP_400_BAD_REQUEST)
+            for field, value in defaults.items():
+                setattr(result, field, value)
+            result.save()
+
+        data = {}
+        data['data'] = {
+            'result': ExaminationResultSerializer(result).data,
+        }
+        data['message'] = "Answers submitted successfully."
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Http404):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return super().handle_exception(exc)
+
+
+class ExaminationAutosaveView(APIView):
+    """
+    Takes the answers changed since the last autosave and acknowledges once
+    they are in the worker's write-behind buffer (and its append log).
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        if not examination_exists(self.kwargs['pk']):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        serializer = ExaminationAutosaveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            answers = candidate_answers(self.kwargs['pk'], request.user.pk, serializer.validated_data['answers'],
+                                        serializer.validated_data.get('version'))
+        except PaperChanged as e:
+            return paper_changed(e)
+        except ValueError as e:
+            data = {
+                "message": "failure",
+                "reason": {"answers": str(e)}
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        autosave_buffer.add(
+            self.kwargs['pk'],
+            request.user.pk,
+            answers,
+            seq=serializer.validated_data.get('seq'),
+        )
+        data = {}
+        data['message'] = "Answers saved."
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class ExaminationPaperView(APIView):
+    """
+    The candidate-facing paper (no is_correct), served as the bytes built
+    once per examination and format by core.api.utils.snapshots. Shuffled
+    papers are reordered for the candidate from the decoded snapshot and
+    encoded per request, see core.api.utils.shuffle.
+    """
+    permission_classes = (IsAuthenticated,)
+    # the formats snapshots are built in
+    renderer_classes = (ORJSONRenderer, MessagePackRenderer)
+
+    @conditional('exam_paper', validator=paper_version)
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        paper = load_paper(self.kwargs['pk'])
+        if paper is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if paper.adaptive and not request.user.is_staff:
+            data = {
+                "message": "failure",
+                "reason": "Adaptive examinations are taken one question at a time."
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        if paper.shuffle:
+            content = renderer.render(paper.for_candidate(request.user.pk))
+        else:
+            content = get_snapshot(self.kwargs['pk'], renderer.format)
+        return HttpResponse(content, content_type=renderer.media_type)
+
+
+class ExaminationAdaptiveView(APIView):
+    """
+    Adaptive examinations, one question at a time: GET the question to
+    answer now with the current ability estimate, POST its answer to get the
+    next one. The question is picked from the stored answers and estimate
+    (core.api.utils.adaptive) and kept on the result until it is answered,
+    so asking again, on any worker, gives the same one. The attempt is submitted with its last answer and graded like any other.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get_bank(self):
+        bank = item_banks.get(self.kwargs['pk'])
+        if bank is None:
+            raise Http404
+        return bank
+
+    def get_paper(self):
+        paper = load_paper(self.kwargs['pk'])
+        if paper is None:
+            raise Http404
+        return paper
+
+    def progress(self, request, question_id, answers, ability, ability_se):
+        paper = self.get_paper()
+        question = None
+        if question_id is not None:
+            question = paper.question(request.user.pk, question_id)
+        return {
+            'ability': ability,
+            'ability_se': ability_se,
+            'answered': len(answers),
+            'finished': question_id is None,
+            'question': question,
+            # answers to shuffled questions are given with it
+            'version': paper.layout.version if paper.shuffle else None,
+        }
+
+    def pending_question(self, request, bank, result):
+        """
+        The question `result` is being asked, picked and stored on it (not
+        saved) unless it already holds one still in the examination.
+        """
+        question_id = result.pending_question
+        if question_id is None or question_id not in bank.columns or str(question_id) in result.answers:
+            question_id = bank.next_question(request.user.pk, result.answers, result.ability, result.ability_se)
+        result.pending_question = question_id
+        return question_id
+
+    def get(self, request, *args, **kwargs):
+        bank = self.get_bank()
+        if not bank.adaptive:
+            return self.not_adaptive()
+        question_id = None
+        with transaction.atomic():
+            result, _ = ExaminationResult.objects.select_for_update().get_or_create(
+                examination_id=self.kwargs['pk'], candidate_id=request.user.pk)
+            if result.submitted_at is None:
+                stored = result.pending_question
+                question_id = self.pending_question(request, bank, result)
+                if question_id != stored:
+                    result.save(update_fields=['pending_question', 'updated_at'])
+
+        data = {}
+        data['data'] = self.progress(request, question_id, result.answers, result.ability, result.ability_se)
+        data['message'] = "Fetched next question successfully."
+        return Response(data, status=status.HTTP_200_OK)
+
+    def post(self, request, *args, **kwargs):
+        bank = self.get_bank()
+        if not bank.adaptive:
+            return self.not_adaptive()
+        serializer = ExaminationAdaptiveAnswerSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        question_id = serializer.validated_data['question']
+
+        with transaction.atomic():
+            result, _ = ExaminationResult.objects.select_for_update().get_or_create(
+                examination_id=self.kwargs['pk'], candidate_id=request.user.pk)
+            if result.submitted_at is not None:
+                data = {
+                    "message": "failure",
+                    "reason": "This examination is over."
+                }
+                return Response(data, status=status.HTTP_400_BAD_REQUEST)
+            if question_id != self.pending_question(request, bank, result):
+                data = {
+                    "message": "failure",
+                    "reason": {"question": "Question %s is not the one being asked." % question_id}
+                }
+                return Response(data, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                answer = self.get_paper().option_ids_for(
+                    request.user.pk, {str(question_id): serializer.validated_data['answer']},
+                    serializer.validated_data.get('version'))
+            except PaperChanged as e:
+                return paper_changed(e)
+            except ValueError as e:
+                data = {
+                    "message": "failure",
+                    "reason": {"answer": str(e)}
+                }
+                return Response(data, status=status.HTTP_400_BAD_REQUEST)
+            result.answers = dict(result.answers, **answer)
+            result.ability, result.ability_se = bank.estimate(*bank.responses(result.answers))
+            next_question = self.pending_question(request, bank, result)
+            if next_question is None:
+                # graded in batches by `manage.py grade_examination`
+                result.submitted_at = timezone.now()
+            result.save(update_fields=['answers', 'ability', 'ability_se', 'pending_question', 'submitted_at',
+                                       'updated_at'])
+
+        data = {}
+        data['data'] = self.progress(request, next_question, result.answers, result.ability, result.ability_se)
+        data['message'] = "Answer saved successfully."
+        return Response(data, status=status.HTTP_200_OK)
+
+    def not_adaptive(self):
+        data = {
+            "message": "failure",
+            "reason": "This examination is not adaptive."
+        }
+        return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Http404):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return super().handle_exception(exc)
+
+
+class ExaminationResultsExportView(APIView):
+    """
+    Examination results, of one examination with ?examination=<id>,
+    streamed as NDJSON or (?format=csv) CSV.
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+
+    def get(self, request, *args, **kwargs):
+        examination = request.query_params.get('examination')
+        if examination is not None and not examination.isdigit():
+            data = {
+                "message": "failure",
+                "reason": {"examination": "A valid integer is required."}
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(request.accepted_renderer, 'results', examination=examination)
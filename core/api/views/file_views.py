@@ -1,8 +1,16 @@
 from rest_framework.parsers import FileUploadParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.generics import CreateAPIView
+from rest_framework.generics import CreateAPIView, RetrieveAPIView
+from rest_framework.views import APIView
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from core.api.utils import image
-from core.api.serializers import ImageSerializer
+from core.api.utils.derivatives import image_pipeline
+from core.api.serializers import ImageSerializer, DirectUploadSerializer
+from core.api.utils.etags import conditional
+from django.db.models import Count, Max
 from core.models import Image
 from rest_framework import status
 import uuid
@@ -15,19 +23,165 @@ class ImageUploadView(CreateAPIView):
     def create(self, request, *args, **kwargs):
         file_obj = request.data['file']
         folder = request.data['folder']
+        content_hash = image.content_hash(file_obj)
+        existing = Image.objects.filter(content_hash=content_hash).first()
+        if existing is not None:
+            return duplicate_response(existing)
+
         file_name = str(uuid.uuid4())
-        (file_name_with_extension, image_url) = image.handle_image(file_obj, file_name, folder)
-        request.data['_id'] = file_name
+        try:
+            (file_name_with_extension, image_url) = image.handle_image(file_obj, file_name, folder)
+        except image.ImageStorageError as e:
+            return Response({"message": "failure", "reason": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         request.data['name'] = file_name_with_extension
         request.data['url'] = image_url
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        try:
+            with transaction.atomic():
+                serializer.save(_id=file_name, content_hash=content_hash)
+        except IntegrityError:
+            # the same file was uploaded concurrently
+            image.get_storage().delete(image.image_key(image.clean_folder(folder), file_name_with_extension))
+            return duplicate_response(Image.objects.get(content_hash=content_hash))
+        image_pipeline.submit(serializer.instance.pk)
 
-        file_obj = request.data['file']
         data = {}
         data['data'] = {
                 'image': serializer.data
             }
         data['message'] = "Fetched questions successfully."
-        return Response(data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+def image_version(request, _id):
+    return Image.objects.filter(_id=_id).annotate(
+        derivative_count=Count('derivatives'), derivatives_at=Max('derivatives__created_at')
+    ).values_list('updated_at', 'derivative_count', 'derivatives_at').first()
+
+
+class ImageDetailView(RetrieveAPIView):
+    queryset = Image.objects.prefetch_related('derivatives')
+    serializer_class = ImageSerializer
+    permission_classes = (IsAuthenticated,)
+    lookup_field = '_id'
+
+    @conditional('image', validator=image_version)
+    def retrieve(self, request, *args, **kwargs):
+        data = {}
+        data['data'] = {
+            'image': self.get_serializer(self.get_object()).data
+        }
+        data['message'] = "Fetched image successfully."
+        return Response(data, status=status.HTTP_200_OK)
+
+
+def duplicate_response(existing):
+    data = {}
+    data['data'] = {
+        'image': ImageSerializer(existing).data,
+        'duplicate': True,
+    }
+    data['message'] = "Image already uploaded."
+    return Response(data, status=status.HTTP_200_OK)
+
+
+class DirectUploadView(APIView):
+    """
+    Presigned upload: the client sends the file straight to the bucket and
+    then posts the token to `confirm/`, so no worker is held during transfer.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = DirectUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            token, upload = image.start_direct_upload(
+                str(uuid.uuid4()),
+                serializer.validated_data['folder'],
+                serializer.validated_data['file_name'],
+                serializer.validated_data['content_type'],
+            )
+        except image.ImageStorageError as e:
+            return Response({"message": "failure", "reason": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = {}
+        data['data'] = {
+            'token': token,
+            'upload': upload,
+            'max_size': settings.IMAGE_UPLOAD_MAX_SIZE,
+            'expires_in': settings.IMAGE_PRESIGN_EXPIRES,
+        }
+        data['message'] = "Upload URL created successfully."
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class DirectUploadConfirmView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            file_name, name, folder, key, url, _ = image.read_upload_token(request.data.get('token', ''))
+        except image.ImageStorageError as e:
+            return Response({"message": "failure", "reason": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        instance = Image.objects.filter(_id=file_name).first()
+        if instance is None:
+            storage = image.get_storage()
+            if not storage.exists(key):
+                return Response({"message": "failure", "reason": "The file has not been uploaded."},
+                                status=status.HTTP_409_CONFLICT)
+            # read back from the bucket, the client's bytes never passed through here
+            with storage.open(key) as stream:
+                content_hash = image.hash_stream(stream)
+            existing = Image.objects.filter(content_hash=content_hash).first()
+            if existing is not None:
+                storage.delete(key)
+                return duplicate_response(existing)
+            try:
+                with transaction.atomic():
+                    instance = Image.objects.create(
+                        _id=file_name, name=name, folder=folder, url=url, content_hash=content_hash)
+            except IntegrityError:
+                # confirmed twice at once, or the same file confirmed concurrently
+                instance = Image.objects.filter(_id=file_name).first()
+                if instance is None:
+                    storage.delete(key)
+                    return duplicate_response(Image.objects.get(content_hash=content_hash))
+            image_pipeline.submit(instance.pk)
+        data = {}
+        data['data'] = {
+            'image': ImageSerializer(instance).data
+        }
+        data['message'] = "Image uploaded successfully."
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class FileSystemUploadView(APIView):
+    """
+    Target of presigned uploads when IMAGE_STORAGE_BACKEND is 'filesystem';
+    the signed token stands in for the bucket's signature.
+    """
+    permission_classes = ()
+    authentication_classes = ()
+
+    def put(self, request, token, *args, **kwargs):
+        if settings.IMAGE_STORAGE_BACKEND != 'filesystem':
+            raise Http404
+        try:
+            file_name, _, _, key, _, content_type = image.read_upload_token(token)
+        except image.ImageStorageError as e:
+            return Response({"message": "failure", "reason": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        # as the bucket's policy conditions would
+        if content_type and request.content_type.split(';')[0].strip() != content_type:
+            return Response({"message": "failure", "reason": "Content-Type must be %s." % content_type},
+                            status=status.HTTP_403_FORBIDDEN)
+        # the file of a confirmed upload is hashed, it must not change anymore
+        if Image.objects.filter(_id=file_name).exists():
+            return Response({"message": "failure", "reason": "The upload is already confirmed."},
+                            status=status.HTTP_409_CONFLICT)
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if not 0 < length <= settings.IMAGE_UPLOAD_MAX_SIZE:
+            return Response({"message": "failure", "reason": "Invalid file size."}, status=status.HTTP_400_BAD_REQUEST)
+        # the raw body, read from the socket in chunks
+        image.get_storage().save(request._request, key)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,22 +1,36 @@
-from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from core.models import Topics, Questions
+from core.models import Topics, Questions, QuestionOptions
 from core.api.utils import image
 from core.api.serializers import SubjectSerializer, QuestionsSerializer, QuestionOptionsSerializer
-from core.api.pagination import SmallPagination
+from core.api.pagination import SmallKeysetPagination
+from core.api.utils.query_budget import query_budget
+from core.api.utils.cache import cached_response
+from core.api.utils.etags import conditional
+from core.api.utils.search import search_questions, SEARCH_ORDERING
+from core.api.utils.importer import QuestionImporter, READERS, open_text, DEFAULT_BATCH_SIZE
+from core.api.utils.export import export_response
+from core.api.renderers import NDJSONRenderer, CSVRenderer
+from rest_framework.parsers import MultiPartParser
+from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, CreateAPIView, UpdateAPIView, DestroyAPIView
 from django.http import Http404
 
 
 class QuestionsListView(ListAPIView):
-    queryset = Questions.objects.all()
+    queryset = QuestionsSerializer.setup_eager_loading(Questions.objects.all())
     serializer_class = QuestionsSerializer
-    pagination_class = SmallPagination
+    pagination_class = SmallKeysetPagination
     permission_classes = (IsAuthenticated,)
     allowed_methods = ('GET',)
+    # the planner's estimate of the (large, unfiltered) question table
+    keyset_count_mode = 'estimate'
 
+    # count, page of questions, prefetched options
+    @conditional('questions', models=(Questions, QuestionOptions))
+    @cached_response('questions', models=(Questions, QuestionOptions))
+    @query_budget(3)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -37,27 +51,104 @@ class QuestionsListView(ListAPIView):
         data['message'] = "Fetched questions successfully."
         return Response(self.get_paginated_response(data), status=status.HTTP_200_OK)
 
-    @action(methods=['get'], detail=False)
-    def advanced_search(self, request):
-        search = request.query_params.get('search', None)
+    def handle_exception(self, exc):
+        if isinstance(exc, Http404):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return super().handle_exception(exc)
 
-        questions = Questions.objects.all()
-        if search is not None:
-            questions = questions.filter(_id__icontains=search, name__icontains=search)
 
-        page = self.paginate_queryset(questions)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+class QuestionSearchView(ListAPIView):
+    serializer_class = QuestionsSerializer
+    pagination_class = SmallKeysetPagination
+    permission_classes = (IsAuthenticated,)
+    allowed_methods = ('GET',)
+    keyset_ordering = SEARCH_ORDERING
+    # matches are counted again only once a minute per query
+    keyset_count_mode = 'cached'
+
+    def get_queryset(self):
+        params = self.request.query_params
+        return QuestionsSerializer.setup_eager_loading(search_questions(
+            params.get('q', '').strip(),
+            topic=params.get('topic'),
+            subject=params.get('subject'),
+            difficulty_level=params.get('difficulty_level'),
+        ))
+
+    # filters by subject go through the topics
+    @conditional('question_search', models=(Questions, QuestionOptions, Topics))
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('q', '').strip():
+            data = {
+                "message": "failure",
+                "reason": {"q": "Please provide a search term"}
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = self.get_serializer(questions, many=True)
-        return Response(serializer.data)
+        queryset = self.filter_queryset(self.get_queryset())
+
+        data = {}
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        data['data'] = {
+            'questions': serializer.data
+        }
+        data['message'] = "Searched questions successfully."
+        return Response(self.get_paginated_response(data), status=status.HTTP_200_OK)
 
     def handle_exception(self, exc):
         if isinstance(exc, Http404):
             return Response(status=status.HTTP_404_NOT_FOUND)
         return super().handle_exception(exc)
-    
+
+
+class QuestionsExportView(APIView):
+    """
+    The whole question bank with options, optionally of one `topic`,
+    streamed as NDJSON or (?format=csv) CSV.
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+
+    def get(self, request, *args, **kwargs):
+        return export_response(request.accepted_renderer, 'questions', topic=request.query_params.get('topic'))
+
+
+class QuestionImportView(APIView):
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request, *args, **kwargs):
+        upload = request.data.get('file')
+        if upload is None:
+            data = {
+                "message": "failure",
+                "reason": {"file": "Please attach a CSV or JSONL file"}
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        try:
+            batch_size = int(request.data.get('batch_size', DEFAULT_BATCH_SIZE))
+            skip = int(request.data.get('skip', 0))
+        except ValueError:
+            batch_size = skip = -1
+        if file_format not in READERS or batch_size < 1 or skip < 0:
+            data = {
+                "message": "failure",
+                "reason": {"format": "Use csv or jsonl", "batch_size": "Positive integer", "skip": "Non-negative integer"}
+            }
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = QuestionImporter(batch_size=batch_size)
+        report = importer.run(READERS[file_format](open_text(upload.file)), skip=skip)
+
+        data = {}
+        data['data'] = {
+            'import': report.as_dict()
+        }
+        data['message'] = "Imported %d questions." % report.imported
+        return Response(data, status=status.HTTP_200_OK)
 
 
 # class SubjectUpdateView(UpdateAPIView):
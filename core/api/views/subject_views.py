@@ -1,21 +1,50 @@
-from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from core.models import Image, Subject, Topics, Questions
+from core.models import Image, Subject, Topics, Questions, QuestionOptions
 from core.api.serializers import SubjectSerializer, TopicsSerializer, QuestionsSerializer, QuestionOptionsSerializer
-from core.api.pagination import SmallPagination
+from core.api.pagination import SmallPagination, SmallKeysetPagination
+from core.api.utils.query_budget import query_budget
+from core.api.utils.cache import cached_response
+from core.api.utils.etags import conditional
+from core.api.utils.taxonomy import taxonomy_stats
 from rest_framework.generics import ListAPIView, CreateAPIView, UpdateAPIView, DestroyAPIView
+from rest_framework.views import APIView
 from django.http import Http404
 
 
+class TaxonomyStatsView(APIView):
+    """
+    Questions and marks available per subject, topic and difficulty level,
+    optionally for one `?subject=`. Read from the trigger-maintained
+    TopicStats table, so the cost follows the number of topics rather than
+    the number of questions.
+    """
+    permission_classes = (IsAdminUser,)
+
+    # stats rows joined with their subject and topic
+    @conditional('taxonomy_stats', models=(Questions, Topics, Subject))
+    @query_budget(1)
+    def get(self, request, *args, **kwargs):
+        data = {}
+        data['data'] = {
+            'subjects': taxonomy_stats(request.query_params.get('subject')),
+        }
+        data['message'] = "Fetched taxonomy stats successfully."
+        return Response(data, status=status.HTTP_200_OK)
+
+
 class SubjectsListView(ListAPIView):
-    queryset = Subject.objects.all()
+    queryset = SubjectSerializer.setup_eager_loading(Subject.objects.all())
     serializer_class = SubjectSerializer
-    pagination_class = SmallPagination
+    pagination_class = SmallKeysetPagination
     permission_classes = (IsAdminUser,)
     allowed_methods = ('GET',)
 
+    # count, page of subjects, prefetched topics
+    @conditional('subjects', models=(Subject, Topics))
+    @cached_response('subjects', models=(Subject, Topics))
+    @query_budget(3)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(
             self.get_queryset()).order_by('_id')
@@ -37,23 +66,6 @@ class SubjectsListView(ListAPIView):
         data['message'] = "Fetched subjects successfully."
         return Response(self.get_paginated_response(data), status=status.HTTP_200_OK)
 
-    @action(methods=['get'], detail=False)
-    def advanced_search(self, request):
-        search = request.query_params.get('search', None)
-
-        subjects = Subject.objects.all()
-        if search is not None:
-            subjects = subjects.filter(
-                _id__icontains=search, name__icontains=search)
-
-        page = self.paginate_queryset(subjects)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(subjects, many=True)
-        return Response(serializer.data)
-
     def handle_exception(self, exc):
         if isinstance(exc, Http404):
             return Response(status=status.HTTP_404_NOT_FOUND)
@@ -61,7 +73,7 @@ class SubjectsListView(ListAPIView):
 
 
 class SubjectCreateView(CreateAPIView):
-    queryset = Subject.objects.all()
+    queryset = SubjectSerializer.setup_eager_loading(Subject.objects.all())
     serializer_class = SubjectSerializer
     permission_classes = (IsAdminUser,)
 
@@ -84,7 +96,7 @@ class SubjectCreateView(CreateAPIView):
 
 
 class SubjectUpdateView(UpdateAPIView):
-    queryset = Subject.objects.all()
+    queryset = SubjectSerializer.setup_eager_loading(Subject.objects.all())
     serializer_class = SubjectSerializer
     permission_classes = (IsAdminUser,)
     lookup_field = '_id'
@@ -110,7 +122,7 @@ class SubjectUpdateView(UpdateAPIView):
 
 
 class SubjectDeleteView(DestroyAPIView):
-    queryset = Subject.objects.all()
+    queryset = SubjectSerializer.setup_eager_loading(Subject.objects.all())
     permission_classes = (IsAdminUser,)
     lookup_field = '_id'
 
@@ -129,14 +141,19 @@ class SubjectDeleteView(DestroyAPIView):
 class TopicsListView(ListAPIView):
     serializer_class = TopicsSerializer
     permission_classes = (IsAuthenticated,)
-    pagination_class = SmallPagination
+    pagination_class = SmallKeysetPagination
     lookup_field = '_id'
     ordering = ['_id']
 
     def get_queryset(self):
         subject_id = self.kwargs['_id']
-        return Topics.objects.filter(subject___id=subject_id)
+        return TopicsSerializer.setup_eager_loading(
+            Topics.objects.filter(subject___id=subject_id))
 
+    # count, page of topics joined with their subject
+    @conditional('topics', models=(Topics, Subject))
+    @cached_response('topics', models=(Topics, Subject))
+    @query_budget(2)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset()).order_by('_id')
 
@@ -144,7 +161,6 @@ class TopicsListView(ListAPIView):
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            print(page)
             data['data'] = {
                 'topics': serializer.data,
             }
@@ -165,7 +181,7 @@ class TopicsListView(ListAPIView):
 
 
 class TopicCreateView(CreateAPIView):
-    queryset = Topics.objects.all()
+    queryset = TopicsSerializer.setup_eager_loading(Topics.objects.all())
     serializer_class = TopicsSerializer
     permission_classes = (IsAdminUser,)
     pagination_class = SmallPagination
@@ -195,7 +211,7 @@ class TopicCreateView(CreateAPIView):
 
 
 class TopicsUpdateView(UpdateAPIView):
-    queryset = Topics.objects.all()
+    queryset = TopicsSerializer.setup_eager_loading(Topics.objects.all())
     serializer_class = TopicsSerializer
     permission_classes = (IsAdminUser,)
     lookup_field = '_id'
@@ -216,7 +232,7 @@ class TopicsUpdateView(UpdateAPIView):
 
 
 class TopicsDeleteView(DestroyAPIView):
-    queryset = Topics.objects.all()
+    queryset = TopicsSerializer.setup_eager_loading(Topics.objects.all())
     serializer_class = TopicsSerializer
     permission_classes = (IsAdminUser,)
     lookup_field = '_id'
@@ -239,12 +255,16 @@ class TopicsDeleteView(DestroyAPIView):
 
 
 class QuestionsListView(ListAPIView):
-    queryset = Questions.objects.all()
+    queryset = QuestionsSerializer.setup_eager_loading(Questions.objects.all())
     serializer_class = QuestionsSerializer
-    pagination_class = SmallPagination
+    pagination_class = SmallKeysetPagination
     permission_classes = (IsAuthenticated,)
     allowed_methods = ('GET',)
 
+    # count, page of questions, prefetched options
+    @conditional('questions', models=(Questions, QuestionOptions))
+    @cached_response('questions', models=(Questions, QuestionOptions))
+    @query_budget(3)
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -265,23 +285,6 @@ class QuestionsListView(ListAPIView):
         data['message'] = "Fetched questions successfully."
         return Response(self.get_paginated_response(data), status=status.HTTP_200_OK)
 
-    @action(methods=['get'], detail=False)
-    def advanced_search(self, request):
-        search = request.query_params.get('search', None)
-
-        questions = Questions.objects.all()
-        if search is not None:
-            questions = questions.filter(
-                _id__icontains=search, name__icontains=search)
-
-        page = self.paginate_queryset(questions)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(questions, many=True)
-        return Response(serializer.data)
-
     def handle_exception(self, exc):
         if isinstance(exc, Http404):
             return Response(status=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,26 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.permissions import BasePermission, IsAdminUser
+from rest_framework.views import APIView
+from core.api.utils.telemetry import prometheus_text, telemetry
+
+
+class HasMetricsToken(BasePermission):
+    """
+    Scrapers send `Authorization: Metrics <TELEMETRY_METRICS_TOKEN>`, which
+    the token and JWT authentication classes leave alone.
+    """
+
+    def has_permission(self, request, view):
+        expected = settings.TELEMETRY_METRICS_TOKEN
+        keyword, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        return bool(expected) and keyword == 'Metrics' and hmac.compare_digest(token.encode(), expected.encode())
+
+
+class MetricsView(APIView):
+    permission_classes = (HasMetricsToken | IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(prometheus_text(telemetry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,17 +1,24 @@
 from django.shortcuts import render
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 
 from core.models import User
 from core.api.serializers import UserSerializer, UserSerializerWithToken, RegistrationSerializer, UserLoginSerializer
+from core.api.authentication import issue_tokens, refresh_tokens, revoke_raw_token, jwt_enabled, get_request_user
+from core.api.renderers import NDJSONRenderer, CSVRenderer
+from core.api.pagination import SmallKeysetPagination
+from core.api.utils.query_budget import query_budget
+from core.api.utils.export import export_response
+from core.api.utils.etags import conditional
+from django.db.models import Count, Max
 # Create your views here.
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 
 from django.contrib.auth.hashers import make_password
 from rest_framework import status
+from rest_framework.exceptions import Throttled
 
 
 @api_view(['POST'])
@@ -22,11 +29,11 @@ def login(request):
             
             if serializer.is_valid():
                 
-                account = serializer.data
+                account = serializer.validated_data
                 
                 data['data'] = {
                     "user": UserSerializer(account).data,
-                    "token": Token.objects.get(user__id=account["id"]).key
+                    **issue_tokens(account)
                 }
                 data['message'] = "Congrats! You are registered!"
 
@@ -40,6 +47,10 @@ def login(request):
                 }
 
                 return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        except Throttled as e:
+
+            return Response({"message": "failure", "reason": e.detail}, status=e.status_code, headers={'Retry-After': str(e.wait)})
             
         except Exception as e:
 
@@ -59,7 +70,7 @@ def registerUser(request):
 
             data['data'] = {
                 "user": UserSerializer(account).data,
-                "token": Token.objects.get(user=account).key
+                **issue_tokens(account)
             }
             data['message'] = "Congrats! You are registered!"
 
@@ -77,10 +88,33 @@ def registerUser(request):
         return Response({"message":  "Failed to register!", "reason": f"Error: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+def refreshToken(request):
+    try:
+        data = {}
+        data['data'] = refresh_tokens(request.data.get('refresh', ''))
+        data['message'] = "Token refreshed successfully."
+        return Response(data, status=status.HTTP_200_OK)
+    except (InvalidToken, AuthenticationFailed) as e:
+        return Response({"message": "failure", "reason": e.detail["detail"]}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    if jwt_enabled():
+        revoke_raw_token(str(request.auth))
+        if request.data.get('refresh'):
+            revoke_raw_token(request.data['refresh'])
+    else:
+        request.auth.delete()
+    return Response({"message": "Logged out successfully."}, status=status.HTTP_200_OK)
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def updateUserProfile(request):
-    user = request.user
+    user = get_request_user(request)
     serializer = UserSerializerWithToken(user, many=False)
 
     data = request.data
@@ -96,16 +130,32 @@ def updateUserProfile(request):
     return Response(serializer.data)
 
 
+# last_login is auto_now, so it moves with every save of the user
+def users_version(request):
+    return tuple(User.objects.aggregate(Max('last_login'), Count('pk')).values())
+
+
+def user_version(request, pk):
+    if not str(pk).isdigit():
+        return None
+    return User.objects.filter(pk=pk).values_list('last_login', flat=True).first()
+
+
+def profile_version(request):
+    # the response echoes the caller's token
+    return (user_version(request, request.user.pk), str(request.auth))
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional('users_profile', validator=profile_version)
 def getUserProfile(request):
     try:
-        user_token = request.auth.key
-        serializer = UserSerializer(Token.objects.get(key=user_token).user, many=False)
+        serializer = UserSerializer(get_request_user(request), many=False)
         data = {}
         data['data'] = {
             "user": serializer.data,
-            "token": Token.objects.get(user__id=serializer.data["id"]).key
+            "token": str(request.auth) if jwt_enabled() else request.auth.key
         }
         data['message'] = "User Details fetched successfully!"
         return Response(data, status=status.HTTP_200_OK)
@@ -117,14 +167,31 @@ def getUserProfile(request):
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@conditional('users', validator=users_version)
+# count and page of users; everyone at once is users/export/
+@query_budget(2)
 def getUsers(request):
-    users = User.objects.all()
-    serializer = UserSerializer(users, many=True)
-    return Response(serializer.data)
+    paginator = SmallKeysetPagination()
+    page = paginator.paginate_queryset(User.objects.all(), request)
+    data = {}
+    data['data'] = {
+        'users': UserSerializer(page, many=True).data
+    }
+    data['message'] = "Fetched users successfully."
+    return Response(paginator.get_paginated_response(data), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@renderer_classes([NDJSONRenderer, CSVRenderer])
+def exportUsers(request):
+    # ?format=csv or Accept: text/csv for CSV, NDJSON otherwise
+    return export_response(request.accepted_renderer, 'users')
 
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@conditional('user', validator=user_version)
 def getUserById(request, pk):
     user = User.objects.get(id=pk)
     serializer = UserSerializer(user, many=False)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # connect the signal handlers kept next to the services they feed
+        from core.api.utils import paper, grading, cache, snapshots  # noqa: F401
+        from core.api import authentication  # noqa: F401
+        from core import checks  # noqa: F401
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+# caches every worker process keeps to itself
+PROCESS_LOCAL_CACHES = (
+    LOCMEM_CACHE,
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def api_cache_backend():
+    alias = getattr(settings, 'API_CACHE_ALIAS', 'default')
+    return alias, settings.CACHES.get(alias, {}).get('BACKEND')
+
+
+@register(Tags.caches)
+def check_replica_stickiness(app_configs, **kwargs):
+    # a caller who just wrote is kept on the primary through a marker in the
+    # API cache (core.routers); in a per-process cache the other workers
+    # never see it and serve the caller replica reads that miss the write
+    alias, backend = api_cache_backend()
+    if settings.DATABASE_REPLICAS and backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            'DATABASE_REPLICAS need a cache shared by every worker.',
+            hint='The %r cache uses %s; set CACHE_BACKEND to a file based or Redis cache.' % (alias, backend),
+            id='core.E001',
+        )]
+    return []
+
+
+@register(Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    # cached responses and ETags are retired by version counters in the API
+    # cache (core.api.utils.cache); in a LocMemCache a write only bumps the
+    # counters of the worker that handled it, the others keep serving the
+    # old lists and 304s
+    alias, backend = api_cache_backend()
+    if backend == LOCMEM_CACHE:
+        return [Warning(
+            'Cached responses and ETags are only retired in the worker that handled the write.',
+            hint='The %r cache uses %s; with more than one worker set CACHE_BACKEND to a file based or '
+                 'Redis cache, otherwise silence core.W001.' % (alias, backend),
+            id='core.W001',
+        )]
+    return []
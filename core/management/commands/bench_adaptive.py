@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core.api.utils.adaptive import ItemBank
+from core.api.utils.shuffle import candidate_seed
+
+
+class Command(BaseCommand):
+    help = 'Benchmark adaptive item selection and ability estimation on simulated candidates (no database access).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=2000)
+        parser.add_argument('--items', type=int, default=2000)
+        parser.add_argument('--length', type=int, default=30)
+        parser.add_argument('--randomesque', type=int, default=settings.CAT_RANDOMESQUE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        items, length, candidates = options['items'], options['length'], options['candidates']
+
+        bank = ItemBank(0, np.arange(items) + 1, rng.uniform(0.8, 2.0, size=items),
+                        rng.normal(0, 1.2, size=items), length=length)
+        abilities = rng.normal(0, 1, size=candidates)
+
+        select_time = estimate_time = 0.0
+        estimates = np.zeros(candidates)
+        exposure = np.zeros(items, dtype=np.int64)
+        with override_settings(CAT_RANDOMESQUE=options['randomesque'], CAT_STOP_SE=None):
+            for candidate, true_ability in enumerate(abilities):
+                seed = candidate_seed(0, candidate)
+                administered = np.zeros(items, dtype=bool)
+                columns, correct = [], []
+                ability = 0.0
+                for step in range(bank.length):
+                    started = time.perf_counter()
+                    column = bank.select(ability, administered, seed, step)
+                    selected = time.perf_counter()
+                    administered[column] = True
+                    columns.append(column)
+                    correct.append(rng.random() < 1 / (1 + np.exp(-bank.a[column] * (true_ability - bank.b[column]))))
+                    estimated = time.perf_counter()
+                    ability, _ = bank.estimate(columns, correct)
+                    select_time += selected - started
+                    estimate_time += time.perf_counter() - estimated
+                estimates[candidate] = ability
+                exposure[administered] += 1
+
+        steps = candidates * bank.length
+        rmse = float(np.sqrt(np.mean((estimates - abilities) ** 2)))
+        self.stdout.write('candidates: %d, items: %d, length: %d, randomesque: %d' % (
+            candidates, items, bank.length, options['randomesque']))
+        self.stdout.write('select:   %.1fus per question' % (select_time / steps * 1e6))
+        self.stdout.write('estimate: %.1fus per answer' % (estimate_time / steps * 1e6))
+        self.stdout.write('exposure: max %.1f%% of candidates, %d items never asked' % (
+            exposure.max() / candidates * 100, int((exposure == 0).sum())))
+        self.stdout.write(self.style.SUCCESS('ability RMSE %.3f, correlation %.3f' % (
+            rmse, float(np.corrcoef(estimates, abilities)[0, 1]))))
@@ -0,0 +1,341 @@
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import platform
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import django
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from core.models import User, Subject, Topics, Questions, QuestionOptions, Image, Examination
+from core.api import urls as api_urls
+from core.api.authentication import issue_tokens, jwt_enabled
+from core.api.utils import image
+from core.api.utils.seeding import BENCH_PASSWORD, bench_email, seed
+
+# a 1x1 PNG; random bytes are appended so every run uploads a new file
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360f8cfc0f01f0005000201e0a1'
+    'e3f20000000049454e44ae426082')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Endpoint:
+    """
+    How to call one named URL: its method, URL kwargs and body (callables of
+    the benchmark context, called before the clock starts) and who calls it.
+    """
+
+    def __init__(self, name, method='get', kwargs=None, data=None, query='', user='admin',
+                 format='json', content_type=None, fresh_token=False):
+        self.name = name
+        self.method = method
+        self.kwargs = kwargs or (lambda ctx: {})
+        self.data = data
+        self.query = query
+        self.user = user
+        self.format = format
+        self.content_type = content_type
+        self.fresh_token = fresh_token
+
+
+def csv_upload(ctx):
+    rows = ['topic,difficulty_level,marks_allotted,description,option_1,option_2,option_3,option_4,correct']
+    rows += ['%s,LVL2,2,Imported question %d?,a,b,c,d,1' % (ctx['topic'], n) for n in range(50)]
+    return {'file': SimpleUploadedFile('questions.csv', '\n'.join(rows).encode(), 'text/csv')}
+
+
+ENDPOINTS = [
+    # users
+    Endpoint('login', 'post', user=None, data=lambda ctx: {'email': ctx['candidate'].email, 'password': BENCH_PASSWORD}),
+    Endpoint('register', 'post', user=None, data=lambda ctx: {
+        'first_name': 'Bench', 'middle_name': '', 'last_name': 'Register', 'contact': '',
+        'email': 'register-%s@bench.invalid' % uuid.uuid4().hex, 'password': BENCH_PASSWORD}),
+    Endpoint('token-refresh', 'post', user=None, data=lambda ctx: {
+        'refresh': issue_tokens(ctx['candidate']).get('refresh', '')}),
+    Endpoint('logout', 'post', user='candidate', fresh_token=True),
+    Endpoint('users_profile', user='candidate'),
+    Endpoint('user-profile-update', 'put', user='candidate', data=lambda ctx: {
+        'name': 'Bench', 'email': ctx['candidate'].email, 'password': ''}),
+    Endpoint('users'),
+    Endpoint('users-export'),
+    Endpoint('user', kwargs=lambda ctx: {'pk': ctx['candidate'].pk}),
+    Endpoint('user-update', 'put', kwargs=lambda ctx: {'pk': ctx['candidate'].pk}, data=lambda ctx: {
+        'name': 'Bench', 'email': ctx['candidate'].email, 'isAdmin': False}),
+    Endpoint('user-delete', 'delete', kwargs=lambda ctx: {'pk': ctx['candidate'].pk}),
+    # files
+    Endpoint('upload_file', 'post', format='multipart', data=lambda ctx: {
+        'folder': 'bench', 'file': SimpleUploadedFile('bench.png', PNG + os.urandom(16), 'image/png')}),
+    Endpoint('upload_presign', 'post', data=lambda ctx: {
+        'folder': 'bench', 'file_name': 'bench.png', 'content_type': 'image/png'}),
+    Endpoint('upload_confirm', 'post', data=lambda ctx: {'token': ctx['upload_token']}),
+    Endpoint('upload_direct', 'put', user=None, kwargs=lambda ctx: {'token': ctx['upload_token']},
+             data=lambda ctx: PNG + os.urandom(16), content_type='image/png'),
+    Endpoint('image_detail', kwargs=lambda ctx: {'_id': ctx['image']._id}),
+    # subjects and topics
+    Endpoint('subject_list'),
+    Endpoint('taxonomy_stats'),
+    Endpoint('subject_create', 'post', data=lambda ctx: {'_id': ctx['free_subject'], 'name': 'Bench subject'}),
+    Endpoint('subject_update', 'patch', kwargs=lambda ctx: {'_id': ctx['subject']}, data=lambda ctx: {'name': 'Renamed'}),
+    Endpoint('subject_delete', 'delete', kwargs=lambda ctx: {'_id': ctx['subject']}),
+    Endpoint('topics_by_subject_id', user='candidate', kwargs=lambda ctx: {'_id': ctx['subject']}),
+    Endpoint('topic_create', 'post', kwargs=lambda ctx: {'_id': ctx['subject']},
+             data=lambda ctx: {'_id': ctx['free_topic'], 'name': 'Bench topic'}),
+    Endpoint('topic_update', 'patch', kwargs=lambda ctx: {'_id': ctx['topic']}, data=lambda ctx: {'name': 'Renamed'}),
+    Endpoint('topic_delete', 'delete', kwargs=lambda ctx: {'_id': ctx['topic']}),
+    Endpoint('question_create', 'post', kwargs=lambda ctx: {'_id': ctx['topic']}, data=lambda ctx: {
+        'description': 'Bench question?', 'difficulty_level': 'LVL2', 'marks_allotted': 2,
+        'options': [{'description': d, 'is_correct': d == 'a'} for d in 'abcd']}),
+    # questions
+    Endpoint('question_list', user='candidate'),
+    Endpoint('question_search', user='candidate', query='q=energy'),
+    Endpoint('question_import', 'post', format='multipart', data=csv_upload),
+    Endpoint('question_export', query='topic={topic}'),
+    # examinations
+    Endpoint('exam_generate', 'post', data=lambda ctx: {
+        'exam_name': 'Bench generated', 'topics': ctx['paper_topics'],
+        'difficulty_mix': {'LVL2': 1, 'LVL3': 1}, 'full_marks': 20, 'seed': 1}),
+    Endpoint('exam_results_export', query='examination={examination}'),
+    Endpoint('exam_paper', user='candidate', kwargs=lambda ctx: {'pk': ctx['examination']}),
+    Endpoint('exam_autosave', 'post', user='candidate', kwargs=lambda ctx: {'pk': ctx['examination']},
+             data=lambda ctx: {'answers': ctx['answers']}),
+    Endpoint('exam_submit', 'post', user='candidate', kwargs=lambda ctx: {'pk': ctx['examination']},
+             data=lambda ctx: {'answers': ctx['answers']}),
+    Endpoint('exam_adaptive', user='candidate', kwargs=lambda ctx: {'pk': ctx['adaptive_examination']}),
+    # cache
+    Endpoint('cache_stats'),
+    # telemetry
+    Endpoint('metrics'),
+]
+
+
+def api_url_names():
+    # every named route of the modules in core/api/urls
+    names = []
+    for module in pkgutil.iter_modules(api_urls.__path__):
+        urlconf = importlib.import_module('%s.%s' % (api_urls.__name__, module.name))
+        names += [pattern.name for pattern in urlconf.urlpatterns if pattern.name]
+    return names
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every URL in core/api/urls through the test client: p50/p95 latency, SQL queries and '
+            'peak memory per endpoint, as JSON to diff between releases. Uses the rows of seed_bench.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='B', help='Prefix of the seed_bench rows, seeded if missing.')
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', help='URL names to benchmark.')
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare with.')
+
+    def context(self, prefix):
+        if not Subject.objects.filter(_id__regex=r'^%s[0-9]{2}$' % prefix).exists():
+            self.stdout.write('No rows seeded under %r, seeding the defaults.' % prefix)
+            seed(prefix=prefix)
+
+        admin, _ = User.objects.get_or_create(email='admin@%s.bench.invalid' % prefix.lower(), defaults={
+            'first_name': 'Bench', 'is_staff': True, 'is_admin': True, 'is_superuser': True})
+        candidate = User.objects.get(email=bench_email(prefix, 0))
+        candidate.set_password(BENCH_PASSWORD)
+        candidate.save(update_fields=['password'])
+
+        examination = Examination.objects.filter(exam_name__startswith='%s examination ' % prefix).order_by('pk').first()
+        question_ids = list(examination.questions.values_list('pk', flat=True))
+        answers = {}
+        for question_id, option_id in QuestionOptions.objects.filter(
+                for_question_id__in=question_ids, is_correct=True).values_list('for_question_id', 'pk'):
+            answers[str(question_id)] = [option_id]
+        question = Questions.objects.filter(pk__in=question_ids).select_related('topic').first()
+        adaptive, created = Examination.objects.get_or_create(
+            exam_name='%s adaptive examination' % prefix, defaults={'adaptive': True, 'full_marks': examination.full_marks})
+        if created:
+            adaptive.questions.set(question_ids)
+
+        folder = image.clean_folder('bench')
+        upload_token, _ = image.start_direct_upload(str(uuid.uuid4()), folder, 'bench.png', 'image/png')
+        _, _, _, key, _, _ = image.read_upload_token(upload_token)
+        image.get_storage().save(SimpleUploadedFile('bench.png', PNG + os.urandom(16)), key, 'image/png')
+        detail, _ = Image.objects.get_or_create(
+            name='bench.png', folder=folder, defaults={'url': 'http://localhost/bench.png'})
+
+        return {
+            'admin': admin,
+            'candidate': candidate,
+            'examination': examination.pk,
+            'adaptive_examination': adaptive.pk,
+            'answers': answers,
+            'subject': question.topic.subject_id,
+            'topic': question.topic_id,
+            'paper_topics': list(Topics.objects.filter(subject_id=question.topic.subject_id).values_list('_id', flat=True)),
+            'free_subject': next(i for i in ('%s%s' % (prefix, c) for c in 'ABCDEFGHIJ')
+                                 if not Subject.objects.filter(pk=i).exists()),
+            'free_topic': next(i for i in ('%s%s' % (prefix, c) for c in ('XBENCH', 'YBENCH', 'ZBENCH'))
+                               if not Topics.objects.filter(pk=i[:6]).exists())[:6],
+            'upload_token': upload_token,
+            'image': detail,
+        }
+
+    def request(self, client, endpoint, ctx):
+        path = reverse(endpoint.name, kwargs=endpoint.kwargs(ctx))
+        if endpoint.query:
+            path += '?' + endpoint.query.format(**{k: v for k, v in ctx.items() if isinstance(v, (str, int))})
+        headers = {}
+        if endpoint.user:
+            user = ctx[endpoint.user]
+            token = issue_tokens(user)['token'] if endpoint.fresh_token else ctx['tokens'][endpoint.user]
+            headers['HTTP_AUTHORIZATION'] = '%s %s' % ('Bearer' if jwt_enabled() else 'Token', token)
+        data = endpoint.data(ctx) if endpoint.data else None
+        method = getattr(client, endpoint.method)
+        if endpoint.content_type:
+            return lambda: method(path, data, content_type=endpoint.content_type, **headers)
+        if endpoint.format == 'multipart':
+            return lambda: method(path, data, **headers)
+        if endpoint.method == 'get':
+            return lambda: method(path, **headers)
+        return lambda: method(path, data or {}, content_type='application/json', **headers)
+
+    def call(self, send):
+        # every call runs in a transaction that is rolled back, so writes
+        # can be repeated and leave the seeded rows as they are
+        result = {}
+        # the log is capped, a call running into the cap would count nothing
+        connection.queries_log.clear()
+        try:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = send()
+                    if response.streaming:
+                        for _ in response.streaming_content:
+                            pass
+                    result['elapsed'] = time.perf_counter() - started
+                result['queries'] = len(queries)
+                result['status'] = response.status_code
+                raise Rollback
+        except Rollback:
+            pass
+        return result
+
+    def bench(self, client, endpoint, ctx, iterations, warmup):
+        for _ in range(warmup):
+            self.call(self.request(client, endpoint, ctx))
+        elapsed, queries, statuses = [], [], set()
+        for _ in range(iterations):
+            result = self.call(self.request(client, endpoint, ctx))
+            elapsed.append(result['elapsed'])
+            queries.append(result['queries'])
+            statuses.add(result['status'])
+
+        send = self.request(client, endpoint, ctx)
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            self.call(send)
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'name': endpoint.name,
+            'method': endpoint.method.upper(),
+            'status': sorted(statuses),
+            'iterations': iterations,
+            'p50_ms': percentile(elapsed, 50),
+            'p95_ms': percentile(elapsed, 95),
+            'mean_ms': round(float(np.mean(elapsed)) * 1000, 3),
+            'queries': int(np.median(queries)),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def handle(self, *args, **options):
+        endpoints = ENDPOINTS
+        if options['only']:
+            endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.name in options['only']]
+            unknown = set(options['only']) - {endpoint.name for endpoint in endpoints}
+            if unknown:
+                raise CommandError('No benchmark for %s.' % ', '.join(sorted(unknown)))
+        covered = {endpoint.name for endpoint in ENDPOINTS}
+        missing = [name for name in api_url_names() if name not in covered]
+        if missing:
+            self.stderr.write('Not benchmarked, add them to ENDPOINTS: %s' % ', '.join(missing))
+
+        # 4xx/5xx responses would each log a warning
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        storage_root = tempfile.mkdtemp(prefix='bench-images-')
+        try:
+            with override_settings(IMAGE_STORAGE_BACKEND='filesystem', IMAGE_STORAGE_ROOT=storage_root):
+                image._storage = None
+                try:
+                    ctx = self.context(options['prefix'])
+                except (IntegrityError, ValueError) as e:
+                    raise CommandError(e)
+                ctx['tokens'] = {role: issue_tokens(ctx[role])['token'] for role in ('admin', 'candidate')}
+                # a view raising is reported as its 500, not a crash of the benchmark
+                client = Client(SERVER_NAME='localhost', raise_request_exception=False)
+                results = []
+                for endpoint in endpoints:
+                    result = self.bench(client, endpoint, ctx, options['iterations'], options['warmup'])
+                    results.append(result)
+                    self.stdout.write('%-22s %-6s %-9s p50 %8.2fms  p95 %8.2fms  %3d queries  %9.1fKB' % (
+                        result['name'], result['method'], ','.join(map(str, result['status'])),
+                        result['p50_ms'], result['p95_ms'], result['queries'], result['peak_kb']))
+        finally:
+            image._storage = None
+            request_logger.setLevel(level)
+
+        report = {
+            'meta': {
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'auth': 'jwt' if jwt_enabled() else 'token',
+                'prefix': options['prefix'],
+                'questions': Questions.objects.count(),
+                'iterations': options['iterations'],
+            },
+            'endpoints': results,
+            'missing': missing,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                json.dump(report, out, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+        self.stdout.write(self.style.SUCCESS('Benchmarked %d endpoints.' % len(results)))
+
+    def compare(self, path, results):
+        with open(path) as baseline_file:
+            baseline = {row['name']: row for row in json.load(baseline_file)['endpoints']}
+        self.stdout.write('Compared with %s:' % path)
+        for result in results:
+            before = baseline.get(result['name'])
+            if before is None:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            line = '%-22s p50 %+6.1f%%  queries %+d  peak %+.1fKB' % (
+                result['name'], change, result['queries'] - before['queries'], result['peak_kb'] - before['peak_kb'])
+            self.stdout.write(self.style.WARNING(line) if change > 20 or result['queries'] > before['queries'] else line)
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from core.api.utils.grading import AnswerKey
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the vectorized grader on synthetic attempts (no database access).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=100000)
+        parser.add_argument('--questions', type=int, default=100)
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--negative-marking', type=float, default=0.25)
+        parser.add_argument('--partial-credit', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        questions, choices = options['questions'], options['options']
+
+        option_ids = np.arange(questions * choices).reshape(questions, choices) + 1
+        correct_choice = rng.integers(0, choices, size=questions)
+        key = AnswerKey(
+            examination_id=0,
+            question_ids=np.arange(questions) + 1,
+            marks=rng.choice([1, 2, 4], size=questions),
+            correct=1 << correct_choice,
+            option_bits={
+                int(option_ids[q, c]): (q, 1 << c) for q in range(questions) for c in range(choices)
+            },
+            negative_marking=options['negative_marking'],
+            partial_credit=options['partial_credit'],
+        )
+
+        # answers as the API stores them; -1 leaves the question unanswered
+        picks = rng.integers(-1, choices, size=(options['attempts'], questions))
+        submissions = [
+            {str(q + 1): [int(option_ids[q, c])] for q, c in enumerate(row) if c >= 0}
+            for row in picks
+        ]
+
+        encode_time = grade_time = 0.0
+        total = 0.0
+        for start in range(0, len(submissions), options['batch_size']):
+            batch = submissions[start:start + options['batch_size']]
+            started = time.perf_counter()
+            matrix = key.encode_many(batch)
+            encoded = time.perf_counter()
+            graded = key.grade(matrix)
+            encode_time += encoded - started
+            grade_time += time.perf_counter() - encoded
+            total += float(graded.score.sum())
+
+        attempts = len(submissions)
+        self.stdout.write('attempts: %d, questions: %d, options: %d' % (attempts, questions, choices))
+        self.stdout.write('encode: %.3fs (%.0f attempts/s)' % (encode_time, attempts / encode_time))
+        self.stdout.write('grade:  %.3fs (%.0f attempts/s)' % (grade_time, attempts / grade_time))
+        self.stdout.write(self.style.SUCCESS('total:  %.3fs (%.0f attempts/s), mean score %.2f' % (
+            encode_time + grade_time, attempts / (encode_time + grade_time), total / attempts)))
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from core.models import User
+
+EMAIL = 'bench-login-%d@example.com'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the login endpoint under concurrent load and report logins/sec per core.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--logins', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users afterwards.')
+
+    def handle(self, *args, **options):
+        password = options['password']
+        hasher = get_hasher('default')
+        cores = settings.LOGIN_HASH_WORKERS or os.cpu_count() or 1
+
+        # hashing alone on one core, the ceiling for a single worker thread
+        encoded = make_password(password)
+        started = time.perf_counter()
+        checks = 0
+        while time.perf_counter() - started < 1:
+            check_password(password, encoded)
+            checks += 1
+        hash_rate = checks / (time.perf_counter() - started)
+
+        # every user shares one hash, so setting them up costs a single hashing
+        emails = [EMAIL % i for i in range(options['users'])]
+        existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        User.objects.bulk_create(
+            [User(email=email, password=encoded) for email in emails if email not in existing],
+            batch_size=1000)
+        User.objects.filter(email__in=emails).update(password=encoded)
+
+        latencies = []
+        statuses = Counter()
+        lock = threading.Lock()
+        remaining = iter(range(options['logins']))
+
+        def worker():
+            client = Client(SERVER_NAME='localhost')
+            try:
+                while True:
+                    with lock:
+                        i = next(remaining, None)
+                    if i is None:
+                        return
+                    sent = time.perf_counter()
+                    response = client.post(
+                        '/v1/api/users/login/',
+                        {'email': emails[i % len(emails)], 'password': password},
+                        content_type='application/json')
+                    elapsed = time.perf_counter() - sent
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[response.status_code] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        if not options['keep']:
+            User.objects.filter(email__in=emails).delete()
+
+        rate = len(latencies) / seconds
+        latencies = np.array(latencies) * 1000
+        self.stdout.write('hasher: %s, hashing threads: %d, client threads: %d' % (
+            hasher.algorithm, cores, options['concurrency']))
+        self.stdout.write('hashing alone: %.1f checks/s on one core' % hash_rate)
+        self.stdout.write('responses: %s' % dict(statuses))
+        self.stdout.write('latency: p50 %.1fms, p95 %.1fms, max %.1fms' % (
+            np.percentile(latencies, 50), np.percentile(latencies, 95), latencies.max()))
+        self.stdout.write(self.style.SUCCESS('logins: %d in %.2fs, %.1f/s, %.1f/s per core' % (
+            len(latencies), seconds, rate, rate / cores)))
@@ -0,0 +1,88 @@
+import gzip
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.models import DIFFICULTY_LEVEL, Questions
+from core.api.pagination import SmallPagination
+from core.api.renderers import MessagePackRenderer, ORJSONRenderer
+from core.api.serializers import QuestionsSerializer
+
+RENDERERS = (
+    ('drf json', JSONRenderer()),
+    ('orjson', ORJSONRenderer()),
+    ('msgpack', MessagePackRenderer()),
+)
+
+WORDS = ('which', 'of', 'the', 'following', 'is', 'a', 'correct', 'value', 'for', 'given',
+         'reaction', 'equation', 'when', 'angle', 'force', 'energy', 'cell', 'matrix', 'x', 'y')
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '?'
+
+
+def synthetic_questions(rng, count, choices):
+    # shaped like QuestionsSerializer output
+    return [{
+        '_id': 1000 + q,
+        'description': sentence(rng, rng.randint(12, 40)),
+        'options': [{
+            '_id': 4000 + q * choices + c,
+            'description': sentence(rng, rng.randint(1, 8)),
+            'attachment': None,
+            'is_correct': c == 0,
+        } for c in range(choices)],
+        'attachment': rng.choice((None, 'https://bucket.s3.amazonaws.com/image/questions/%d.png' % q)),
+        'topic': 'TP%04d' % rng.randint(0, 200),
+        'difficulty_level': rng.choice(DIFFICULTY_LEVEL)[0],
+        'marks_allotted': rng.choice((1, 2, 4)),
+    } for q in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Compare encode time and payload size of the API renderers on question list pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--from-db', action='store_true', help='Serialize stored questions instead of synthetic ones.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def page(self, rng, size, options):
+        if options['from_db']:
+            queryset = QuestionsSerializer.setup_eager_loading(Questions.objects.order_by('pk')[:size])
+            questions = QuestionsSerializer(queryset, many=True).data
+        else:
+            questions = synthetic_questions(rng, size, options['options'])
+        data = {}
+        data['data'] = {
+            'questions': questions
+        }
+        data['message'] = "Fetched questions successfully."
+        paginator = SmallPagination()
+        paginator.offset, paginator.limit, paginator.count = 0, max(size, 1), len(questions)
+        return paginator.get_paginated_response(data)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        repeat = options['repeat']
+
+        for size in options['page_sizes']:
+            data = self.page(rng, size, options)
+            self.stdout.write('page of %d questions:' % len(data['data']['questions']))
+            baseline = None
+            for name, renderer in RENDERERS:
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    content = renderer.render(data)
+                elapsed = (time.perf_counter() - started) / repeat
+                baseline = baseline or elapsed
+                self.stdout.write('  %-9s %9.1fus  %8d bytes  %7d gzipped  %5.1fx' % (
+                    name, elapsed * 1e6, len(content), len(gzip.compress(content, 6)), baseline / elapsed))
+
+        self.stdout.write(self.style.SUCCESS('Benchmarked %d renderers over %d runs per page.' % (
+            len(RENDERERS), repeat)))
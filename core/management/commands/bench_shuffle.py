@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+import orjson
+from django.core.management.base import BaseCommand
+
+from core.api.utils.shuffle import PaperLayout, candidate_seed
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-candidate paper shuffling on a synthetic paper (no database access).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=10000)
+        parser.add_argument('--questions', type=int, default=100)
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        questions, choices, candidates = options['questions'], options['options'], options['candidates']
+
+        # shaped like the serialized paper snapshot
+        examination = {
+            'id': 1,
+            'shuffle': True,
+            'questions': [
+                {
+                    '_id': q + 1,
+                    'question': 'Question %d' % (q + 1),
+                    'options': [
+                        {'_id': q * choices + c + 1, 'option': 'Option %d' % c}
+                        for c in range(choices)
+                    ],
+                }
+                for q in range(questions)
+            ],
+        }
+        layout = PaperLayout.from_paper(examination)
+        answers = [
+            {str(q + 1): [int(c)] for q, c in enumerate(row)}
+            for row in rng.integers(0, choices, size=(candidates, questions))
+        ]
+
+        order_time = render_time = translate_time = 0.0
+        orders = set()
+        for candidate, positions in enumerate(answers, start=1):
+            started = time.perf_counter()
+            ordering = layout.order(candidate_seed(examination['id'], candidate))
+            ordered = time.perf_counter()
+            orjson.dumps(layout.shuffled(examination, ordering))
+            rendered = time.perf_counter()
+            layout.option_ids_for(ordering, positions)
+            order_time += ordered - started
+            render_time += rendered - ordered
+            translate_time += time.perf_counter() - rendered
+            orders.add(ordering.questions.tobytes())
+
+        self.stdout.write('candidates: %d, questions: %d, options: %d' % (candidates, questions, choices))
+        self.stdout.write('order:     %.1fus per candidate' % (order_time / candidates * 1e6))
+        self.stdout.write('render:    %.1fus per paper' % (render_time / candidates * 1e6))
+        self.stdout.write('translate: %.1fus per attempt (%.2fus per answer)' % (
+            translate_time / candidates * 1e6, translate_time / candidates / questions * 1e6))
+        self.stdout.write(self.style.SUCCESS('distinct question orders: %d of %d, nothing stored' % (
+            len(orders), candidates)))
@@ -0,0 +1,121 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Topics, Questions, QuestionOptions, Examination
+from core.api.utils.seeding import seed
+
+# tables the hot lookups must reach through an index
+CHECKED_TABLES = ('core_questions', 'core_question_options', 'core_topics', 'core_examination_questions')
+
+
+class Rollback(Exception):
+    pass
+
+
+def plan_scans(plan, scans=None):
+    # (node type, relation, index) of every scan in an EXPLAIN (FORMAT JSON) plan
+    if scans is None:
+        scans = []
+    if 'Relation Name' in plan or 'Index Name' in plan:
+        scans.append((plan['Node Type'], plan.get('Relation Name'), plan.get('Index Name')))
+    for child in plan.get('Plans', ()):
+        plan_scans(child, scans)
+    return scans
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def hot_queries(sample):
+    """
+    The query shapes of the endpoints, as (label, queryset) pairs, on ids
+    picked from the seeded data.
+    """
+    question_ids = sample['question_ids']
+    yield ('questions of a topic and level (search, listing)',
+           Questions.objects.filter(topic_id=sample['topic'], difficulty_level='LVL2').order_by('pk')[:11])
+    yield ('topic questions after a keyset cursor',
+           Questions.objects.filter(topic_id=sample['topic'], pk__gt=question_ids[0]).order_by('pk')[:11])
+    yield ('options prefetched for a page of questions',
+           QuestionOptions.objects.filter(for_question_id__in=question_ids[:10]).order_by('pk'))
+    yield ('answer key of an examination (grading)',
+           QuestionOptions.objects.filter(for_question_id__in=question_ids).order_by(
+               'for_question_id', 'pk').values_list('for_question_id', 'pk', 'is_correct'))
+    yield ('topics of a subject',
+           Topics.objects.filter(subject_id=sample['subject']).select_related('subject').order_by('_id')[:11])
+    yield ('questions of an examination paper',
+           Questions.objects.filter(examination=sample['examination']).order_by('pk'))
+    yield ('examinations a question is on (snapshot invalidation)',
+           Examination.objects.filter(questions=question_ids[0]).values_list('pk', flat=True))
+
+
+class Command(BaseCommand):
+    help = ('Seed a large synthetic question bank in a rolled back transaction and check with EXPLAIN '
+            'that the hot lookups use indexes (PostgreSQL only). Fails on sequential scans.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subjects', type=int, default=50)
+        parser.add_argument('--topics', type=int, default=5000)
+        parser.add_argument('--questions', type=int, default=100000)
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--examinations', type=int, default=200)
+        parser.add_argument('--paper-size', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def seed(self, options):
+        rows = seed(
+            prefix='Z', subjects=options['subjects'], topics=options['topics'], questions=options['questions'],
+            options=options['options'], users=0, examinations=options['examinations'],
+            paper_size=options['paper_size'], seed=options['seed'])
+        with connection.cursor() as cursor:
+            for table in CHECKED_TABLES:
+                cursor.execute('ANALYZE %s' % connection.ops.quote_name(table))
+        examination = rows['examinations'][0]
+        return {
+            'subject': rows['subjects'][0].pk,
+            'topic': rows['topics'][0].pk,
+            'examination': examination.pk,
+            'question_ids': sorted(examination.questions.values_list('pk', flat=True)),
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are checked on PostgreSQL, not %s.' % connection.vendor)
+
+        failures = []
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                sample = self.seed(options)
+                self.stdout.write('Seeded %d questions in %.1fs.' % (
+                    options['questions'], time.perf_counter() - started))
+
+                for label, queryset in hot_queries(sample):
+                    scans = plan_scans(explain(queryset))
+                    sequential = [
+                        relation for node, relation, _ in scans
+                        if node == 'Seq Scan' and relation in CHECKED_TABLES]
+                    used = ', '.join('%s %s' % (node, index or relation) for node, relation, index in scans)
+                    if sequential:
+                        failures.append(label)
+                        self.stdout.write(self.style.ERROR('FAIL %s: %s' % (label, used)))
+                    else:
+                        self.stdout.write('ok   %s: %s' % (label, used))
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError('%d of the hot lookups scan a table sequentially: %s' % (
+                len(failures), '; '.join(failures)))
+        self.stdout.write(self.style.SUCCESS('All hot lookups use indexes.'))
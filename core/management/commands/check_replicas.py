@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from core.models import Subject, Topics, Questions, Examination
+from core.routers import replication_lag
+
+COUNTED = (Subject, Topics, Questions, Examination)
+
+
+class Command(BaseCommand):
+    help = 'Check that every read replica answers, how far it trails the primary and that its row counts match.'
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured, set DATABASE_REPLICA_URLS.')
+        expected = {model: model.objects.using(DEFAULT_DB_ALIAS).count() for model in COUNTED}
+        failed = False
+        for alias in settings.DATABASE_REPLICAS:
+            connection = connections[alias]
+            try:
+                lag = None
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        lag = replication_lag(cursor)
+                counts = {model: model.objects.using(alias).count() for model in COUNTED}
+            except DatabaseError as e:
+                failed = True
+                self.stdout.write(self.style.ERROR('%s: unavailable (%s)' % (alias, str(e).strip())))
+                continue
+            differing = ['%s %d/%d' % (model._meta.verbose_name_plural, counts[model], expected[model])
+                         for model in COUNTED if counts[model] != expected[model]]
+            line = '%s: %s, lag %s' % (alias, connection.vendor, 'n/a' if lag is None else '%.1fs' % lag)
+            if differing or (lag is not None and lag > settings.REPLICA_MAX_LAG):
+                failed = True
+                self.stdout.write(self.style.WARNING('%s, behind: %s' % (line, ', '.join(differing) or 'lag')))
+            else:
+                self.stdout.write(self.style.SUCCESS('%s, in step' % line))
+        if failed:
+            raise CommandError('Not every replica is usable.')
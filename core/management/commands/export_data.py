@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.api.utils.export import EXPORTS, export
+
+
+class Command(BaseCommand):
+    help = 'Stream users, questions with options or examination results as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+        parser.add_argument('--output', '-o', help='File to write, standard output by default.')
+        parser.add_argument('--topic', help='Only the questions of this topic.')
+        parser.add_argument('--examination', type=int, help='Only the results of this examination.')
+
+    def handle(self, *args, **options):
+        filters = {}
+        if options['topic']:
+            if options['name'] != 'questions':
+                raise CommandError('--topic only applies to questions.')
+            filters['topic'] = options['topic']
+        if options['examination']:
+            if options['name'] != 'results':
+                raise CommandError('--examination only applies to results.')
+            filters['examination'] = options['examination']
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for block in export(options['name'], options['format'], **filters):
+                out.write(block)
+                written += len(block)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS('Exported %s to %s (%d bytes).' % (
+                options['name'], options['output'], written)))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.api.utils.autosave import replay_logs
+
+
+class Command(BaseCommand):
+    help = 'Write the autosaved answers left in the append logs of workers that stopped without flushing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Also replay logs of workers that still look alive (run after stopping them).')
+
+    def handle(self, *args, **options):
+        if not settings.AUTOSAVE_LOG_DIR:
+            raise CommandError('AUTOSAVE_LOG_DIR is not set, autosaves are only buffered in memory.')
+        written = replay_logs(settings.AUTOSAVE_LOG_DIR, only_orphans=not options['all'])
+        self.stdout.write(self.style.SUCCESS('Wrote autosaved answers of %d attempts.' % written))
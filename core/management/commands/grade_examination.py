@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Examination
+from core.api.utils.grading import grade_examination
+
+
+class Command(BaseCommand):
+    help = 'Grade the submitted attempts of an examination in vectorized batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('examination_id', type=int)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--regrade', action='store_true', help='Grade already graded attempts again.')
+
+    def handle(self, *args, **options):
+        try:
+            examination = Examination.objects.get(pk=options['examination_id'])
+        except Examination.DoesNotExist:
+            raise CommandError('Examination %s does not exist.' % options['examination_id'])
+
+        started = time.perf_counter()
+        graded = grade_examination(examination, batch_size=options['batch_size'], regrade=options['regrade'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS('Graded %d attempts in %.2fs (%.0f attempts/s).' % (
+            graded, elapsed, graded / elapsed if elapsed else 0)))
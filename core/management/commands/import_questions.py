@@ -0,0 +1,65 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.api.utils.importer import QuestionImporter, READERS, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Stream questions and their options from a CSV or JSONL file into the question bank.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--skip', type=int, default=0, help='Rows to skip before importing.')
+        parser.add_argument(
+            '--checkpoint',
+            help='JSON file updated after every batch; with --resume the import continues from it.')
+        parser.add_argument('--resume', action='store_true')
+        parser.add_argument('--errors', help='Write per-row errors to this JSONL file.')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError('Unknown format %r, use --format.' % file_format)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        skip = options['skip']
+        checkpoint = options['checkpoint']
+        if options['resume']:
+            if not checkpoint:
+                raise CommandError('--resume needs --checkpoint.')
+            if os.path.exists(checkpoint):
+                with open(checkpoint) as f:
+                    skip = json.load(f)['checkpoint']
+
+        def on_batch(report):
+            if checkpoint:
+                with open(checkpoint, 'w') as f:
+                    json.dump({'path': path, 'checkpoint': report.rows}, f)
+            if options['verbosity'] > 1:
+                self.stdout.write('%d rows, %d imported, %d failed, %.0f questions/s' % (
+                    report.rows, report.imported, report.failed, report.throughput))
+
+        importer = QuestionImporter(
+            batch_size=options['batch_size'], using=options['database'], on_batch=on_batch)
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            report = importer.run(READERS[file_format](stream), skip=skip)
+
+        if options['errors']:
+            with open(options['errors'], 'w') as f:
+                for error in report.errors:
+                    f.write(json.dumps(error) + '\n')
+        else:
+            for error in report.errors:
+                self.stderr.write('row %(row)d: %(errors)s' % error)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %d questions (%d options) from %d rows in %.1fs, %.0f questions/s, %d rows failed.' % (
+                report.imported, report.options, report.rows - skip, report.elapsed,
+                report.throughput, report.failed)))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+
+from core.models import Image
+from core.api.utils.derivatives import generate_derivatives
+from core.api.utils.image import get_storage, hash_stream, image_key
+
+
+class Command(BaseCommand):
+    help = 'Hash images uploaded before content hashing and generate missing derivatives.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist.')
+
+    def handle(self, *args, **options):
+        storage = get_storage()
+        hashed = duplicates = processed = failed = 0
+
+        for image in Image.objects.filter(content_hash__isnull=True).order_by('pk').iterator():
+            try:
+                with storage.open(image_key(image.folder, image.name)) as stream:
+                    image.content_hash = hash_stream(stream)
+                with transaction.atomic():
+                    Image.objects.filter(pk=image.pk).update(content_hash=image.content_hash)
+                hashed += 1
+            except IntegrityError:
+                # an older copy of the same file; both stay referenced as they are
+                duplicates += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write('Image %s: %s' % (image.pk, e))
+
+        images = Image.objects.order_by('pk')
+        if not options['force']:
+            images = images.filter(derivatives__isnull=True)
+        for image in images.iterator():
+            try:
+                generate_derivatives(image)
+                processed += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write('Image %s: %s' % (image.pk, e))
+            if options['verbosity'] > 1:
+                self.stdout.write('%s: %dx%s' % (image.name, image.width or 0, image.height or 0))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Hashed %d images (%d duplicates of older uploads), generated derivatives for %d, %d failed.' % (
+                hashed, duplicates, processed, failed)))
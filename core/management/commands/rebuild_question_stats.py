@@ -0,0 +1,28 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.api.utils.question_stats import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount Questions.attempt_count/correct_count from the graded results, in parallel chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Graded attempts per chunk.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done = []
+
+        def progress(total):
+            done.append(1)
+            if options['verbosity'] > 1:
+                self.stdout.write('%d/%d chunks counted' % (len(done), total))
+
+        updated = rebuild_counters(
+            workers=options['workers'], chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS('Rebuilt counters of %d questions from %d chunks in %.1fs.' % (
+            updated, len(done), time.perf_counter() - started)))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.api.utils.taxonomy import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recount questions and marks per topic and difficulty level and repair the TopicStats rows that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report the drift, fail if there is any.')
+
+    def handle(self, *args, **options):
+        changes = reconcile(dry_run=options['check'])
+        drift = sum(changes.values())
+        summary = '%(inserted)d missing, %(updated)d wrong and %(deleted)d extra rows' % changes
+        if options['check']:
+            if drift:
+                raise CommandError('TopicStats has drifted: %s.' % summary)
+            self.stdout.write(self.style.SUCCESS('TopicStats matches the questions.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Repaired %s.' % summary if drift else 'Nothing to repair.'))
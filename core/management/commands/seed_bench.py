@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from core.api.utils.seeding import BENCH_PASSWORD, bench_email, clear, seed
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert synthetic subjects, topics, questions, options, users and examinations for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='B', help='Letter that marks the seeded rows.')
+        parser.add_argument('--subjects', type=int, default=10)
+        parser.add_argument('--topics', type=int, default=200)
+        parser.add_argument('--questions', type=int, default=10000)
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--examinations', type=int, default=20)
+        parser.add_argument('--paper-size', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help='Remove rows seeded earlier under the prefix first.')
+        parser.add_argument('--clear-only', action='store_true', help='Only remove rows seeded under the prefix.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear'] or options['clear_only']:
+            started = time.perf_counter()
+            deleted = clear(prefix)
+            self.stdout.write('Removed %d rows seeded under %r in %.1fs.' % (
+                deleted, prefix, time.perf_counter() - started))
+            if options['clear_only']:
+                return
+
+        started = time.perf_counter()
+        try:
+            rows = seed(
+                prefix=prefix, subjects=options['subjects'], topics=options['topics'],
+                questions=options['questions'], options=options['options'], users=options['users'],
+                examinations=options['examinations'], paper_size=options['paper_size'],
+                seed=options['seed'], batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(e)
+        except IntegrityError:
+            raise CommandError('Rows are already seeded under %r, pass --clear to replace them.' % prefix)
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded %d subjects, %d topics, %d questions with %d options each, %d users and %d examinations '
+            'in %.1fs.' % (
+                len(rows['subjects']), len(rows['topics']), len(rows['questions']), options['options'],
+                options['users'], len(rows['examinations']), time.perf_counter() - started)))
+        if options['users']:
+            self.stdout.write('Users sign in as %s .. %s with password %r.' % (
+                bench_email(prefix, 0), bench_email(prefix, options['users'] - 1), BENCH_PASSWORD))
@@ -0,0 +1,114 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core import routers
+from core.models import RequestProfile
+from core.api.utils.profiling import Profile, choose_engine
+from core.api.utils.telemetry import (
+    current_timings, end_request, install_serializer_timing, render_started, start_request, telemetry)
+
+# anything else is counted as 'other', clients choose the method
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class TelemetryMiddleware:
+    """
+    Times every request: SQL statements and their time (through an execute
+    wrapper on each connection), serializer.data, rendering and the total.
+    The numbers go into per-view histograms (see core.api.utils.telemetry)
+    and, with TELEMETRY_SERVER_TIMING, a Server-Timing header. Goes first in
+    MIDDLEWARE so the total covers the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TELEMETRY_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_serializer_timing()
+
+    def __call__(self, request):
+        timings, token = start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            end_request(token)
+        total = time.perf_counter() - timings.started
+
+        match = request.resolver_match
+        view = (match.view_name or match.route) if match else 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        telemetry.record(view, method, response.status_code, timings, total)
+        if settings.TELEMETRY_SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns
+        return render_started(response)
+
+
+class ProfilingMiddleware:
+    """
+    Runs a sample of requests (PROFILE_SAMPLE_RATE), and those a staff user
+    sends with the PROFILE_HEADER header, under a profiler. Each profile is
+    written to PROFILE_DIR and listed with its view and duration by a
+    RequestProfile row, see the admin. Everything else passes straight through.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_ENGINE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        engine = choose_engine(request)
+        if engine is None:
+            return self.get_response(request)
+
+        timings = current_timings()
+        queries = timings.db_queries if timings else None
+        profile = Profile(engine)
+        profile.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+
+        match = request.resolver_match
+        view = (match.view_name or match.route) if match else 'unmatched'
+        RequestProfile.objects.create(
+            view=view, method=request.method[:10], path=request.path[:255], status=response.status_code,
+            duration=profile.duration, queries=timings.db_queries - queries if timings else None,
+            engine=engine, file=profile.save(view))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Gives core.routers.ReplicaRouter the request it routes for: its method,
+    the caller (to keep them on the primary for a while after they wrote)
+    and the view, for REPLICA_VIEW_ROUTING. Not used without replicas.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state, token = routers.start_request(request)
+        request.replica_routing = state
+        try:
+            return self.get_response(request)
+        finally:
+            routers.end_request(state, token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routers.route_view(request.replica_routing, request.resolver_match.view_name)
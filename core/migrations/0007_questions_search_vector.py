@@ -0,0 +1,110 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:33
+
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FORWARD_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION core_questions_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(description, ' ')
+                FROM core_question_options
+                WHERE for_question_id = NEW.id
+            ), '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER core_questions_search_vector
+    BEFORE INSERT OR UPDATE OF description ON core_questions
+    FOR EACH ROW EXECUTE PROCEDURE core_questions_search_vector_update()
+    """,
+    # touching description re-runs the trigger above for the affected questions
+    """
+    CREATE OR REPLACE FUNCTION core_question_options_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE core_questions SET description = description
+            WHERE id IN (SELECT DISTINCT for_question_id FROM new_rows);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE core_questions SET description = description
+            WHERE id IN (SELECT DISTINCT for_question_id FROM old_rows);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER core_question_options_search_vector_insert
+    AFTER INSERT ON core_question_options REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_question_options_search_vector_update()
+    """,
+    """
+    CREATE TRIGGER core_question_options_search_vector_update
+    AFTER UPDATE ON core_question_options REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_question_options_search_vector_update()
+    """,
+    """
+    CREATE TRIGGER core_question_options_search_vector_delete
+    AFTER DELETE ON core_question_options REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_question_options_search_vector_update()
+    """,
+    "CREATE INDEX core_questions_search_vector_gin ON core_questions USING gin (search_vector)",
+    "CREATE INDEX core_questions_description_trgm ON core_questions USING gin (description gin_trgm_ops)",
+    "UPDATE core_questions SET description = description",
+]
+
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS core_questions_description_trgm",
+    "DROP INDEX IF EXISTS core_questions_search_vector_gin",
+    "DROP TRIGGER IF EXISTS core_question_options_search_vector_delete ON core_question_options",
+    "DROP TRIGGER IF EXISTS core_question_options_search_vector_update ON core_question_options",
+    "DROP TRIGGER IF EXISTS core_question_options_search_vector_insert ON core_question_options",
+    "DROP FUNCTION IF EXISTS core_question_options_search_vector_update()",
+    "DROP TRIGGER IF EXISTS core_questions_search_vector ON core_questions",
+    "DROP FUNCTION IF EXISTS core_questions_search_vector_update()",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        # other backends fall back to icontains search, see core.api.utils.search
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_auto_20230122_1823'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AlterModelOptions(
+            name='questions',
+            options={'verbose_name_plural': 'Questions'},
+        ),
+        migrations.AddField(
+            model_name='questions',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='questionoptions',
+            name='for_question',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='options', to='core.questions'),
+        ),
+        migrations.RunPython(run_on_postgresql(FORWARD_SQL), run_on_postgresql(BACKWARD_SQL)),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_questions_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examination',
+            name='negative_marking',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='partial_credit',
+            field=models.BooleanField(default=False),
+        ),
+        # the placeholder model had no columns worth keeping
+        migrations.DeleteModel(
+            name='ExaminationResult',
+        ),
+        migrations.CreateModel(
+            name='ExaminationResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.JSONField(blank=True, default=dict)),
+                ('score', models.FloatField(default=0)),
+                ('correct_count', models.IntegerField(default=0)),
+                ('wrong_count', models.IntegerField(default=0)),
+                ('unanswered_count', models.IntegerField(default=0)),
+                ('submitted_at', models.DateTimeField(blank=True, null=True)),
+                ('graded_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='examination_results', to=settings.AUTH_USER_MODEL)),
+                ('examination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='core.examination')),
+            ],
+            options={
+                'verbose_name_plural': 'Examination Results',
+                'db_table': 'core_examination_result',
+                'unique_together': {('examination', 'candidate')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_examination_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questions',
+            name='attempt_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='questions',
+            name='correct_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_question_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(max_length=10)),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('size', models.IntegerField()),
+                ('url', models.URLField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='core.image')),
+            ],
+            options={
+                'verbose_name_plural': 'Image Derivatives',
+                'db_table': 'core_image_derivative',
+                'ordering': ('image', 'format', 'width'),
+                'unique_together': {('image', 'format', 'width')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examinationresult',
+            name='answer_versions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
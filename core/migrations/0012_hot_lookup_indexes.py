@@ -0,0 +1,38 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_examination_result_answer_versions'),
+    ]
+
+    operations = [
+        # the composite indexes first, their leading column makes the
+        # foreign key indexes redundant
+        migrations.AddIndex(
+            model_name='questionoptions',
+            index=models.Index(fields=['for_question', 'id'], include=('is_correct',), name='core_qopt_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questions',
+            index=models.Index(fields=['topic', 'difficulty_level', 'id'], include=('marks_allotted',), name='core_q_topic_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topics',
+            index=models.Index(fields=['subject', '_id'], include=('name',), name='core_topics_subject_idx'),
+        ),
+        migrations.AlterField(
+            model_name='questionoptions',
+            name='for_question',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='options', to='core.questions'),
+        ),
+        migrations.AlterField(
+            model_name='questions',
+            name='topic',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.topics'),
+        ),
+    ]
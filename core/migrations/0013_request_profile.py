@@ -0,0 +1,36 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(max_length=255)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('status', models.IntegerField()),
+                ('duration', models.FloatField()),
+                ('queries', models.IntegerField(blank=True, null=True)),
+                ('engine', models.CharField(max_length=10)),
+                ('file', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Request Profiles',
+                'db_table': 'core_request_profile',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='requestprofile',
+            index=models.Index(fields=['view', '-duration'], name='core_profile_view_idx'),
+        ),
+    ]
@@ -0,0 +1,227 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Questions add to and take from the row of their (topic, difficulty_level);
+# a row whose last question is gone is removed. Bulk inserts and deletes are
+# applied per statement on PostgreSQL, moves per row.
+POSTGRESQL_FORWARD = [
+    """
+    CREATE OR REPLACE FUNCTION core_topic_stats_insert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO core_topic_stats AS s (subject_id, topic_id, difficulty_level, question_count, total_marks)
+        SELECT t.subject_id, q.topic_id, q.difficulty_level, count(*), sum(q.marks_allotted)
+        FROM new_rows q JOIN core_topics t ON t._id = q.topic_id
+        GROUP BY t.subject_id, q.topic_id, q.difficulty_level
+        ORDER BY q.topic_id, q.difficulty_level
+        ON CONFLICT (topic_id, difficulty_level) DO UPDATE SET
+            question_count = s.question_count + EXCLUDED.question_count,
+            total_marks = s.total_marks + EXCLUDED.total_marks;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION core_topic_stats_delete() RETURNS trigger AS $$
+    BEGIN
+        UPDATE core_topic_stats s SET
+            question_count = s.question_count - d.questions,
+            total_marks = s.total_marks - d.marks
+        FROM (
+            SELECT topic_id, difficulty_level, count(*) AS questions, sum(marks_allotted) AS marks
+            FROM old_rows WHERE topic_id IS NOT NULL
+            GROUP BY topic_id, difficulty_level
+        ) d
+        WHERE s.topic_id = d.topic_id AND s.difficulty_level = d.difficulty_level;
+        DELETE FROM core_topic_stats s
+        USING (SELECT DISTINCT topic_id, difficulty_level FROM old_rows) d
+        WHERE s.topic_id = d.topic_id AND s.difficulty_level = d.difficulty_level AND s.question_count <= 0;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION core_topic_stats_move() RETURNS trigger AS $$
+    BEGIN
+        UPDATE core_topic_stats SET
+            question_count = question_count - 1,
+            total_marks = total_marks - OLD.marks_allotted
+        WHERE topic_id = OLD.topic_id AND difficulty_level = OLD.difficulty_level;
+        DELETE FROM core_topic_stats
+        WHERE topic_id = OLD.topic_id AND difficulty_level = OLD.difficulty_level AND question_count <= 0;
+        INSERT INTO core_topic_stats AS s (subject_id, topic_id, difficulty_level, question_count, total_marks)
+        SELECT subject_id, NEW.topic_id, NEW.difficulty_level, 1, NEW.marks_allotted
+        FROM core_topics WHERE _id = NEW.topic_id
+        ON CONFLICT (topic_id, difficulty_level) DO UPDATE SET
+            question_count = s.question_count + 1,
+            total_marks = s.total_marks + EXCLUDED.total_marks;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION core_topic_stats_topic_moved() RETURNS trigger AS $$
+    BEGIN
+        UPDATE core_topic_stats SET subject_id = NEW.subject_id WHERE topic_id = NEW._id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER core_topic_stats_insert
+    AFTER INSERT ON core_questions REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_topic_stats_insert()
+    """,
+    """
+    CREATE TRIGGER core_topic_stats_delete
+    AFTER DELETE ON core_questions REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_topic_stats_delete()
+    """,
+    # not per statement: transition tables rule out the column list, and
+    # without it every counter update of a grading run would fire it
+    """
+    CREATE TRIGGER core_topic_stats_move
+    AFTER UPDATE OF topic_id, difficulty_level, marks_allotted ON core_questions
+    FOR EACH ROW WHEN (
+        OLD.topic_id IS DISTINCT FROM NEW.topic_id OR
+        OLD.difficulty_level IS DISTINCT FROM NEW.difficulty_level OR
+        OLD.marks_allotted IS DISTINCT FROM NEW.marks_allotted
+    )
+    EXECUTE PROCEDURE core_topic_stats_move()
+    """,
+    """
+    CREATE TRIGGER core_topic_stats_topic_moved
+    AFTER UPDATE OF subject_id ON core_topics
+    FOR EACH ROW WHEN (OLD.subject_id IS DISTINCT FROM NEW.subject_id)
+    EXECUTE PROCEDURE core_topic_stats_topic_moved()
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_topic_stats_topic_moved ON core_topics",
+    "DROP TRIGGER IF EXISTS core_topic_stats_move ON core_questions",
+    "DROP TRIGGER IF EXISTS core_topic_stats_delete ON core_questions",
+    "DROP TRIGGER IF EXISTS core_topic_stats_insert ON core_questions",
+    "DROP FUNCTION IF EXISTS core_topic_stats_topic_moved()",
+    "DROP FUNCTION IF EXISTS core_topic_stats_move()",
+    "DROP FUNCTION IF EXISTS core_topic_stats_delete()",
+    "DROP FUNCTION IF EXISTS core_topic_stats_insert()",
+]
+
+# SQLite only has row triggers
+SQLITE_FORWARD = [
+    """
+    CREATE TRIGGER core_topic_stats_insert AFTER INSERT ON core_questions
+    BEGIN
+        INSERT INTO core_topic_stats (subject_id, topic_id, difficulty_level, question_count, total_marks)
+        SELECT subject_id, NEW.topic_id, NEW.difficulty_level, 1, NEW.marks_allotted
+        FROM core_topics WHERE _id = NEW.topic_id
+        ON CONFLICT (topic_id, difficulty_level) DO UPDATE SET
+            question_count = question_count + 1,
+            total_marks = total_marks + excluded.total_marks;
+    END
+    """,
+    """
+    CREATE TRIGGER core_topic_stats_delete AFTER DELETE ON core_questions
+    BEGIN
+        UPDATE core_topic_stats SET
+            question_count = question_count - 1,
+            total_marks = total_marks - OLD.marks_allotted
+        WHERE topic_id = OLD.topic_id AND difficulty_level = OLD.difficulty_level;
+        DELETE FROM core_topic_stats
+        WHERE topic_id = OLD.topic_id AND difficulty_level = OLD.difficulty_level AND question_count <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER core_topic_stats_move AFTER UPDATE OF topic_id, difficulty_level, marks_allotted ON core_questions
+    WHEN OLD.topic_id IS NOT NEW.topic_id OR OLD.difficulty_level IS NOT NEW.difficulty_level
+        OR OLD.marks_allotted IS NOT NEW.marks_allotted
+    BEGIN
+        UPDATE core_topic_stats SET
+            question_count = question_count - 1,
+            total_marks = total_marks - OLD.marks_allotted
+        WHERE topic_id = OLD.topic_id AND difficulty_level = OLD.difficulty_level;
+        DELETE FROM core_topic_stats
+        WHERE topic_id = OLD.topic_id AND difficulty_level = OLD.difficulty_level AND question_count <= 0;
+        INSERT INTO core_topic_stats (subject_id, topic_id, difficulty_level, question_count, total_marks)
+        SELECT subject_id, NEW.topic_id, NEW.difficulty_level, 1, NEW.marks_allotted
+        FROM core_topics WHERE _id = NEW.topic_id
+        ON CONFLICT (topic_id, difficulty_level) DO UPDATE SET
+            question_count = question_count + 1,
+            total_marks = total_marks + excluded.total_marks;
+    END
+    """,
+    """
+    CREATE TRIGGER core_topic_stats_topic_moved AFTER UPDATE OF subject_id ON core_topics
+    WHEN OLD.subject_id IS NOT NEW.subject_id
+    BEGIN
+        UPDATE core_topic_stats SET subject_id = NEW.subject_id WHERE topic_id = NEW._id;
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_topic_stats_topic_moved",
+    "DROP TRIGGER IF EXISTS core_topic_stats_move",
+    "DROP TRIGGER IF EXISTS core_topic_stats_delete",
+    "DROP TRIGGER IF EXISTS core_topic_stats_insert",
+]
+
+BACKFILL_SQL = """
+    INSERT INTO core_topic_stats (subject_id, topic_id, difficulty_level, question_count, total_marks)
+    SELECT t.subject_id, q.topic_id, q.difficulty_level, count(*), sum(q.marks_allotted)
+    FROM core_questions q JOIN core_topics t ON t._id = q.topic_id
+    GROUP BY t.subject_id, q.topic_id, q.difficulty_level
+"""
+
+
+def run_for_vendor(postgresql, sqlite, backfill=False):
+    def run(apps, schema_editor):
+        # elsewhere the table is only filled by reconcile_topic_stats
+        statements = {'postgresql': postgresql, 'sqlite': sqlite}.get(schema_editor.connection.vendor)
+        if statements is None:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+        if backfill:
+            schema_editor.execute(BACKFILL_SQL)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty_level', models.CharField(choices=[('LVL1', 'Very Easy'), ('LVL2', 'Easy'), ('LVL3', 'Normal'), ('LVL4', 'Hard'), ('LVL5', 'Very Hard')], max_length=4)),
+                ('question_count', models.IntegerField(default=0)),
+                ('total_marks', models.IntegerField(default=0)),
+                ('subject', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.subject')),
+                ('topic', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.topics')),
+            ],
+            options={
+                'verbose_name_plural': 'Topic Stats',
+                'db_table': 'core_topic_stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='topicstats',
+            index=models.Index(fields=['subject', 'topic'], name='core_topic_stats_subject_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='topicstats',
+            unique_together={('topic', 'difficulty_level')},
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRESQL_FORWARD, SQLITE_FORWARD, backfill=True),
+            run_for_vendor(POSTGRESQL_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_topic_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examination',
+            name='shuffle',
+            field=models.BooleanField(default=False),
+        ),
+    ]
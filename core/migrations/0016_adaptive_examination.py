@@ -0,0 +1,33 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_examination_shuffle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examination',
+            name='adaptive',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='adaptive_length',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examinationresult',
+            name='ability',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examinationresult',
+            name='ability_se',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
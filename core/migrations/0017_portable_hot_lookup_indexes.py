@@ -0,0 +1,78 @@
+from django.db import migrations, models
+
+
+# the index 0001 gave the subject foreign key (and its varchar_pattern_ops
+# twin on PostgreSQL). Dropped by name: an AlterField would rebuild
+# core_topics on SQLite, which the 0014 topic stats triggers refer to.
+SUBJECT_INDEX = 'core_topics_subject_id_9bffce82'
+
+FORWARD_SQL = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS %s' % SUBJECT_INDEX,
+        'DROP INDEX IF EXISTS %s_like' % SUBJECT_INDEX,
+    ],
+    'sqlite': ['DROP INDEX IF EXISTS %s' % SUBJECT_INDEX],
+    'mysql': ['DROP INDEX %s ON core_topics' % SUBJECT_INDEX],
+}
+
+BACKWARD_SQL = {
+    'postgresql': [
+        'CREATE INDEX %s ON core_topics (subject_id)' % SUBJECT_INDEX,
+        'CREATE INDEX %s_like ON core_topics (subject_id varchar_pattern_ops)' % SUBJECT_INDEX,
+    ],
+    'sqlite': ['CREATE INDEX %s ON core_topics (subject_id)' % SUBJECT_INDEX],
+    'mysql': ['CREATE INDEX %s ON core_topics (subject_id)' % SUBJECT_INDEX],
+}
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_adaptive_examination'),
+    ]
+
+    # the models declare the hot lookup indexes on their key columns only,
+    # INCLUDE being PostgreSQL only (models.W040 elsewhere). The indexes
+    # 0012 built are left as they are: covering on PostgreSQL, plain on the
+    # backends without covering indexes.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(model_name='questionoptions', name='core_qopt_question_idx'),
+                migrations.AddIndex(
+                    model_name='questionoptions',
+                    index=models.Index(fields=['for_question', 'id'], name='core_qopt_question_idx'),
+                ),
+                migrations.RemoveIndex(model_name='questions', name='core_q_topic_level_idx'),
+                migrations.AddIndex(
+                    model_name='questions',
+                    index=models.Index(fields=['topic', 'difficulty_level', 'id'], name='core_q_topic_level_idx'),
+                ),
+                migrations.RemoveIndex(model_name='topics', name='core_topics_subject_idx'),
+                migrations.AddIndex(
+                    model_name='topics',
+                    index=models.Index(fields=['subject', '_id'], name='core_topics_subject_idx'),
+                ),
+            ],
+        ),
+        # core_topics_subject_idx leads with the subject
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='topics',
+                    name='subject',
+                    field=models.ForeignKey(db_index=False, on_delete=models.deletion.CASCADE, to='core.subject'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(run_for_vendor(FORWARD_SQL), run_for_vendor(BACKWARD_SQL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_portable_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examinationresult',
+            name='pending_question',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.db import models
 from django.db.models.signals import pre_save, post_save
 from django.utils.http import urlquote
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.translation import ugettext_lazy as _
 from rest_framework.authtoken.models import Token
 import uuid
@@ -109,6 +110,10 @@ class Image(models.Model):
     url = models.URLField(blank=True)
     name = models.CharField(max_length=255)
     folder = models.CharField(max_length=255)
+    # sha256 of the file, identical uploads resolve to the same image
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    width = models.IntegerField(null=True, blank=True, editable=False)
+    height = models.IntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -116,6 +121,25 @@ class Image(models.Model):
         return self.name
 
 
+class ImageDerivative(models.Model):
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='derivatives')
+    format = models.CharField(max_length=10)
+    width = models.IntegerField()
+    height = models.IntegerField()
+    size = models.IntegerField()
+    url = models.URLField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'core_image_derivative'
+        unique_together = ('image', 'format', 'width')
+        ordering = ('image', 'format', 'width')
+        verbose_name_plural = 'Image Derivatives'
+
+    def __str__(self):
+        return '%s %dx%d.%s' % (self.image, self.width, self.height, self.format)
+
+
 class Subject(models.Model):
     _id = models.CharField(max_length=3, primary_key=True)
     name = models.CharField(max_length=50)
@@ -130,10 +154,16 @@ class Subject(models.Model):
 class Topics(models.Model):
     _id = models.CharField(max_length=6, primary_key=True)
     name = models.CharField(max_length=200, default="Introduction")
-    subject = models.ForeignKey(Subject, on_delete=CASCADE)
+    # indexed by core_topics_subject_idx
+    subject = models.ForeignKey(Subject, on_delete=CASCADE, db_index=False)
 
     class Meta:
         unique_together = [['name', 'subject']]
+        indexes = [
+            # a subject's topics in _id order, see check_query_plans; on
+            # PostgreSQL it includes name (migration 0017)
+            models.Index(fields=['subject', '_id'], name='core_topics_subject_idx'),
+        ]
         verbose_name_plural = 'Topics'
 
     def __str__(self):
@@ -143,13 +173,26 @@ class Topics(models.Model):
 class Questions(models.Model):
     description = models.TextField(blank=True, null=True)
     attachment = models.ForeignKey(Image, on_delete=CASCADE, blank=True, null=True)
-    topic = models.ForeignKey(Topics, on_delete=models.CASCADE, blank=True, null=True)
+    # indexed by core_q_topic_level_idx
+    topic = models.ForeignKey(Topics, on_delete=models.CASCADE, blank=True, null=True, db_index=False)
     difficulty_level = models.CharField(max_length=4, choices=DIFFICULTY_LEVEL)
     marks_allotted = models.IntegerField(default=4)
     correct_answer_probability = models.FloatField(default=0)
+    # running totals over graded attempts, correct_answer_probability is
+    # kept equal to correct_count / attempt_count, see core.api.utils.question_stats
+    attempt_count = models.IntegerField(default=0)
+    correct_count = models.IntegerField(default=0)
+    # maintained by database triggers on PostgreSQL, see core.api.utils.search
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         db_table = "core_questions"
+        indexes = [
+            # search and listing filtered by topic and level in pk order; on
+            # PostgreSQL the marks are included (migration 0017), so
+            # topic/level lookups never touch the table
+            models.Index(fields=['topic', 'difficulty_level', 'id'], name='core_q_topic_level_idx'),
+        ]
         verbose_name_plural = 'Questions'
 
     def __str__(self):
@@ -157,19 +200,54 @@ class Questions(models.Model):
 
 
 class QuestionOptions(models.Model):
-    for_question = models.ForeignKey(Questions, related_name="options", on_delete=models.CASCADE, blank=True, null=True)
+    # indexed by core_qopt_question_idx
+    for_question = models.ForeignKey(Questions, related_name="options", on_delete=models.CASCADE, blank=True, null=True, db_index=False)
     description = models.TextField(blank=True, null=True)
     attachment = models.ForeignKey(Image, on_delete=models.CASCADE, blank=True, null=True)
     is_correct = models.BooleanField(default=False)
 
     class Meta:
         db_table = "core_question_options"
+        indexes = [
+            # options prefetched per question in pk order, and answer keys
+            # read from the index alone (is_correct is included on
+            # PostgreSQL, migration 0017)
+            models.Index(fields=['for_question', 'id'], name='core_qopt_question_idx'),
+        ]
         verbose_name_plural = 'Question Options'
 
     def __str__(self):
         return f"{self.for_question} | {self.description}"
 
 
+class TopicStats(models.Model):
+    """
+    Number of questions and marks available per (subject, topic,
+    difficulty_level), kept by database triggers, see migration 0014 and
+    core.api.utils.taxonomy. Questions without a topic are not counted.
+    """
+    # no constraints, the triggers drop a row once its last question is gone;
+    # indexed by core_topic_stats_subject_idx and the unique constraint
+    subject = models.ForeignKey(Subject, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                related_name='+')
+    topic = models.ForeignKey(Topics, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                              related_name='+')
+    difficulty_level = models.CharField(max_length=4, choices=DIFFICULTY_LEVEL)
+    question_count = models.IntegerField(default=0)
+    total_marks = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "core_topic_stats"
+        unique_together = [['topic', 'difficulty_level']]
+        indexes = [
+            models.Index(fields=['subject', 'topic'], name='core_topic_stats_subject_idx'),
+        ]
+        verbose_name_plural = 'Topic Stats'
+
+    def __str__(self):
+        return f"{self.topic_id} | {self.difficulty_level} | {self.question_count}"
+
+
 class Examination(models.Model):
     exam_name = models.CharField(max_length=255, blank=True, null=True)
     exam_date = models.DateField(blank=True, null=True)
@@ -181,6 +259,20 @@ class Examination(models.Model):
     exam_type = models.CharField(
         max_length=1, choices=EXAM_TYPE, default='P'
     )
+    # fraction of a question's marks deducted for a wrong answer
+    negative_marking = models.FloatField(default=0)
+    # questions with several correct options score the fraction picked,
+    # as long as no wrong option is picked
+    partial_credit = models.BooleanField(default=False)
+    # every candidate gets the questions and options in their own order and
+    # answers with displayed option positions, see core.api.utils.shuffle
+    shuffle = models.BooleanField(default=False)
+    # computerized adaptive test: candidates are asked one question of the
+    # paper at a time, picked for their current ability estimate, until
+    # adaptive_length questions (0 for no limit) or the CAT_STOP_SE
+    # precision, see core.api.utils.adaptive
+    adaptive = models.BooleanField(default=False)
+    adaptive_length = models.IntegerField(default=0)
 
     class Meta:
         db_table = "core_examination"
@@ -188,7 +280,63 @@ class Examination(models.Model):
 
 
 class ExaminationResult(models.Model):
-    pass
+    examination = models.ForeignKey(Examination, related_name='results', on_delete=models.CASCADE)
+    candidate = models.ForeignKey(User, related_name='examination_results', on_delete=models.CASCADE)
+    # {"<question id>": [<option id>, ...]}
+    answers = models.JSONField(default=dict, blank=True)
+    # {"<question id>": <seq>} of the autosave that last set each answer, so
+    # deltas flushed out of order by different workers keep the newest one
+    answer_versions = models.JSONField(default=dict, blank=True)
+    score = models.FloatField(default=0)
+    correct_count = models.IntegerField(default=0)
+    wrong_count = models.IntegerField(default=0)
+    unanswered_count = models.IntegerField(default=0)
+    # ability estimate and its standard error after the last answer of an
+    # adaptive examination
+    ability = models.FloatField(blank=True, null=True)
+    ability_se = models.FloatField(blank=True, null=True)
+    # id of the question being asked, kept so that every worker asks the
+    # same one whatever item parameters it has loaded
+    pending_question = models.IntegerField(blank=True, null=True)
+    submitted_at = models.DateTimeField(blank=True, null=True)
+    graded_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "core_examination_result"
+        unique_together = [['examination', 'candidate']]
+        verbose_name_plural = 'Examination Results'
+
+    def __str__(self):
+        return f"{self.examination_id} | {self.candidate_id} | {self.score}"
+
+
+class RequestProfile(models.Model):
+    """
+    A request run under the profiler, see core.api.utils.profiling. The
+    profile itself is `file` in PROFILE_DIR.
+    """
+    view = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status = models.IntegerField()
+    # seconds, profiling overhead included
+    duration = models.FloatField()
+    queries = models.IntegerField(blank=True, null=True)
+    engine = models.CharField(max_length=10)
+    file = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "core_request_profile"
+        indexes = [
+            models.Index(fields=['view', '-duration'], name='core_profile_view_idx'),
+        ]
+        verbose_name_plural = 'Request Profiles'
+
+    def __str__(self):
+        return f"{self.method} {self.path} | {self.duration:.3f}s"
 
 
 def create_auth_token(sender, instance=None, created=False, **kwargs):
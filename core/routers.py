@@ -0,0 +1,195 @@
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('replica_routing', default=None)
+
+
+class ReplicaHealth:
+    """
+    Which replicas can take reads, per worker process. A replica is checked
+    at most every REPLICA_HEALTH_INTERVAL seconds: it has to accept a
+    connection and, on PostgreSQL, trail the primary by no more than
+    REPLICA_MAX_LAG seconds. One that fails sits out until the next check.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._checked.get(alias)
+        if entry is not None and now - entry[1] < settings.REPLICA_HEALTH_INTERVAL:
+            return entry[0]
+        healthy = self._check(alias)
+        with self._lock:
+            self._checked[alias] = (healthy, now)
+        return healthy
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._checked[alias] = (False, time.monotonic())
+
+    def _check(self, alias):
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+            if connection.vendor != 'postgresql' or settings.REPLICA_MAX_LAG is None:
+                return True
+            with connection.cursor() as cursor:
+                return replication_lag(cursor) <= settings.REPLICA_MAX_LAG
+        except DatabaseError:
+            return False
+
+
+def replication_lag(cursor):
+    # a standby that has replayed everything it received is not behind, no
+    # matter how long ago the primary last wrote; 0 on a primary
+    cursor.execute(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+    return float(cursor.fetchone()[0] or 0)
+
+
+health = ReplicaHealth()
+
+
+def sticky_key(credential):
+    return 'db:sticky:%s' % hashlib.sha256(credential.encode()).hexdigest()[:32]
+
+
+def stick(*credentials):
+    """
+    Read from the primary for REPLICA_STICKY_SECONDS on behalf of these
+    Authorization headers (or session keys).
+    """
+    from core.api.utils.cache import get_cache
+
+    get_cache().set_many({sticky_key(credential): 1 for credential in credentials}, settings.REPLICA_STICKY_SECONDS)
+
+
+class RoutingState:
+    """
+    How one request reads. `replica` is decided on the first read: the alias
+    to read from, or DEFAULT_DB_ALIAS.
+    """
+    __slots__ = ('primary', 'sticky', 'wrote', 'replica')
+
+    def __init__(self, primary, sticky):
+        self.primary = primary
+        # cache key of the caller's stickiness, None for anonymous callers
+        # and for views routed to the replicas explicitly
+        self.sticky = sticky
+        self.wrote = False
+        self.replica = None
+
+    def read_alias(self):
+        if self.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if self.replica is None:
+            self.replica = self._choose()
+        return self.replica
+
+    def _choose(self):
+        from core.api.utils.cache import get_cache
+
+        if self.sticky and get_cache().get(self.sticky):
+            return DEFAULT_DB_ALIAS
+        replicas = list(settings.DATABASE_REPLICAS)
+        random.shuffle(replicas)
+        for alias in replicas:
+            if not health.healthy(alias):
+                continue
+            try:
+                # free while connected; a replica that went away since its
+                # last check fails here rather than in the view
+                connections[alias].ensure_connection()
+            except DatabaseError:
+                health.mark_down(alias)
+                continue
+            return alias
+        return DEFAULT_DB_ALIAS
+
+
+def start_request(request):
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    state = RoutingState(
+        primary=request.method not in SAFE_METHODS,
+        sticky=sticky_key(credential) if credential else None)
+    return state, _state.set(state)
+
+
+def end_request(state, token):
+    _state.reset(token)
+    if state.sticky and (state.wrote or state.primary):
+        from core.api.utils.cache import get_cache
+
+        get_cache().set(state.sticky, 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def route_view(state, view_name):
+    """
+    Apply REPLICA_VIEW_ROUTING: 'primary' keeps every read of the view on the
+    primary, 'replica' sends them to the replicas even for unsafe methods and
+    right after the caller wrote. Writes always go to the primary.
+    """
+    routing = settings.REPLICA_VIEW_ROUTING.get(view_name)
+    if routing == 'primary':
+        state.primary = True
+    elif routing == 'replica':
+        state.primary = False
+        state.sticky = None
+
+
+@contextmanager
+def primary():
+    """
+    Read from the primary inside the block, for reads that must not be
+    behind (such as building cache entries). A no-op outside requests.
+    """
+    state = _state.get()
+    if state is None or state.primary:
+        yield
+        return
+    state.primary = True
+    try:
+        yield
+    finally:
+        state.primary = False
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of safe requests to DATABASE_REPLICAS and everything else
+    to the primary: writes, reads of unsafe requests and inside transactions,
+    reads of a caller who wrote in the last REPLICA_STICKY_SECONDS, and all
+    queries outside a request (management commands, the shell). See
+    ReplicaRoutingMiddleware.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        state = _state.get()
+        return state.read_alias() if state is not None else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
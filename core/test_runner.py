@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Adds the `mirror` database the router tests (core.tests) read through: a
+    second connection to the test database, standing in for a replica that
+    has caught up. Nothing else routes to it.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        settings.DATABASES['mirror'] = dict(settings.DATABASES['default'], TEST={'MIRROR': 'default'})
+        super().setup_test_environment(**kwargs)
@@ -1,3 +1,812 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import boto3
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from core import routers
+from core.checks import check_replica_stickiness, check_response_cache
+from core.models import (
+    Examination, ExaminationResult, Image, User, Subject, Topics, Questions, QuestionOptions
+)
+from core.api.authentication import (
+    StatelessJWTAuthentication, issue_tokens, jwt_enabled, refresh_tokens, revoke_raw_token
+)
+from core.api.utils import image
+from core.api.utils.adaptive import item_banks
+from core.api.utils.cache import bump_counter, get_cache, get_versions
+from core.api.utils.grading import answer_keys, grade_examination
+from core.api.utils.paper import question_index
+from core.api.utils.query_budget import QueryBudgetExceeded, assert_query_budget, query_budget
+from core.api.utils.snapshots import generation_key
+from core.management.commands import check_query_plans
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+def create_taxonomy(subjects=2, topics=3, questions=3, options=4):
+    """
+    Subjects with topics with questions with options, several of each so
+    that a query per row shows up in the counts.
+    """
+    for s in range(subjects):
+        subject = Subject.objects.create(_id='S%02d' % s, name='Subject %d' % s)
+        for t in range(topics):
+            topic = Topics.objects.create(_id='T%d%02d' % (s, t), name='Topic %d' % t, subject=subject)
+            for q in range(questions):
+                question = Questions.objects.create(
+                    description='Question %d' % q, topic=topic, difficulty_level='LVL%d' % (q % 5 + 1))
+                QuestionOptions.objects.bulk_create([
+                    QuestionOptions(for_question=question, description='Option %d' % o, is_correct=o == 0)
+                    for o in range(options)
+                ])
+
+
+class QueryBudgetTests(TestCase):
+    """
+    The list views run as many queries as their @query_budget declares,
+    whatever the number of rows on the page.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'password')
+        for n in range(3):
+            User.objects.create_user('candidate%d@example.com' % n, 'password')
+        create_taxonomy()
+
+    def setUp(self):
+        # a cached response would be served without any query
+        get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_list_views(self):
+        for name, kwargs, queries in (
+            ('subject_list', {}, 3),
+            ('topics_by_subject_id', {'_id': 'S00'}, 2),
+            ('question_list', {}, 3),
+            # the ETag validator's aggregate, then the view's 2
+            ('users', {}, 1 + 2),
+        ):
+            with self.subTest(name), self.assertNumQueries(queries):
+                response = self.client.get(reverse(name, kwargs=kwargs))
+            self.assertEqual(response.status_code, 200)
+
+    def test_cached_list_views(self):
+        self.client.get(reverse('subject_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('subject_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_list_retired_on_commit(self):
+        before = get_versions([Subject])
+        with self.captureOnCommitCallbacks(execute=True):
+            Subject.objects.create(_id='S99', name='Subject 99')
+            # a miss now would read the old rows, it must not be stored under a new version
+            self.assertEqual(get_versions([Subject]), before)
+        self.assertNotEqual(get_versions([Subject]), before)
+        response = self.client.get(reverse('subject_list'))
+        self.assertIn('S99', [subject['_id'] for subject in response.json()['data']['subjects']])
+
+    def test_process_local_cache_warning(self):
+        self.assertEqual([warning.id for warning in check_response_cache(None)], ['core.W001'])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}}):
+            self.assertEqual(check_response_cache(None), [])
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_budget_enforced(self):
+        @query_budget(1)
+        def two_queries():
+            list(Subject.objects.all())
+            list(Topics.objects.all())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            two_queries()
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget(0):
+                list(Subject.objects.all())
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False)
+    def test_budget_logged(self):
+        @query_budget(0)
+        def one_query():
+            return list(Subject.objects.all())
+
+        with self.assertLogs('core.api.utils.query_budget', level='WARNING'):
+            self.assertEqual(len(one_query()), 2)
+
+
+class ImageStorageMixin:
+    """
+    Uploads through the API against a fresh storage backend, with the
+    per-process storage instance reset around every test.
+    """
+    content = b'\x89PNG\r\n\x1a\n' + b'image bytes' * 100
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        image._storage = None
+        self.addCleanup(setattr, image, '_storage', None)
+
+    def upload(self, content=None, folder='questions'):
+        file = SimpleUploadedFile('diagram.png', content or self.content, content_type='image/png')
+        return self.client.post(reverse('upload_file'), {'file': file, 'folder': folder}, format='multipart')
+
+    def start_direct_upload(self, folder='questions'):
+        response = self.client.post(reverse('upload_presign'), {
+            'folder': folder, 'file_name': 'diagram.png', 'content_type': 'image/png'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def confirm(self, token):
+        return self.client.post(reverse('upload_confirm'), {'token': token}, format='json')
+
+    def test_upload(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        uploaded = response.json()['data']['image']
+        self.assertEqual(uploaded['content_hash'], hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(self.stored(image.image_key('questions', uploaded['name'])), self.content)
+        self.assertTrue(uploaded['url'].endswith('/image/questions/%s' % uploaded['name']))
+
+    def test_duplicate_upload(self):
+        first = self.upload().json()['data']['image']
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['data']['duplicate'])
+        self.assertEqual(response.json()['data']['image']['_id'], first['_id'])
+        self.assertEqual(Image.objects.count(), 1)
+
+    def test_invalid_folder(self):
+        response = self.upload(folder='../outside')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Image.objects.count(), 0)
+
+    def test_direct_upload(self):
+        direct = self.start_direct_upload()
+        self.assertEqual(self.confirm(direct['token']).status_code, 409)
+        self.send(direct)
+        response = self.confirm(direct['token'])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['data']['image']['content_hash'], hashlib.sha256(self.content).hexdigest())
+        # confirming again returns the same image
+        self.assertEqual(self.confirm(direct['token']).json()['data']['image'], response.json()['data']['image'])
+
+    def test_duplicate_direct_upload(self):
+        self.upload()
+        direct = self.start_direct_upload()
+        self.send(direct)
+        response = self.confirm(direct['token'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['data']['duplicate'])
+        _, _, _, key, _, _ = image.read_upload_token(direct['token'])
+        self.assertFalse(image.get_storage().exists(key))
+
+    def test_forged_token(self):
+        response = self.confirm(self.start_direct_upload()['token'] + 'x')
+        self.assertEqual(response.status_code, 400)
+
+
+class FileSystemImageStorageTests(ImageStorageMixin, TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(
+            IMAGE_STORAGE_BACKEND='filesystem', IMAGE_STORAGE_ROOT=root, IMAGE_STORAGE_URL='http://localhost:8000/media/')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+
+    def stored(self, key):
+        with open(image.get_storage().path(key), 'rb') as stored:
+            return stored.read()
+
+    def send(self, direct):
+        upload = direct['upload']
+        self.assertEqual(upload['method'], 'PUT')
+        response = self.client.generic('PUT', upload['url'], self.content, content_type='image/png')
+        self.assertEqual(response.status_code, 204)
+
+    def test_direct_upload_forged_token(self):
+        response = self.client.generic('PUT', reverse('upload_direct', kwargs={'token': 'forged'}), self.content,
+                                       content_type='image/png')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(os.listdir(image.get_storage().root), [])
+
+    def test_direct_upload_content_type(self):
+        direct = self.start_direct_upload()
+        response = self.client.generic('PUT', direct['upload']['url'], self.content, content_type='text/html')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(os.listdir(image.get_storage().root), [])
+
+    def test_direct_upload_confirmed(self):
+        direct = self.start_direct_upload()
+        self.send(direct)
+        uploaded = self.confirm(direct['token']).json()['data']['image']
+        # the token cannot replace the file once its hash is stored
+        response = self.client.generic('PUT', direct['upload']['url'], b'other bytes', content_type='image/png')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.stored(image.image_key('questions', uploaded['name'])), self.content)
+
+
+@skipUnless(mock_aws, 'moto is not installed')
+class S3ImageStorageTests(ImageStorageMixin, TestCase):
+    bucket = 'admissione-test'
+
+    def setUp(self):
+        settings = override_settings(
+            IMAGE_STORAGE_BACKEND='s3', AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+            AWS_STORAGE_BUCKET_NAME=self.bucket, AWS_S3_REGION_NAME='us-east-1', AWS_S3_ENDPOINT_URL=None,
+            AWS_BASE_URL='https://%s.s3.amazonaws.com' % self.bucket)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket=self.bucket)
+        super().setUp()
+
+    def stored(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def send(self, direct):
+        # what the browser posts to the presigned URL, less the HTTP round trip
+        upload = direct['upload']
+        self.assertEqual(upload['method'], 'POST')
+        self.assertEqual(upload['fields']['Content-Type'], 'image/png')
+        self.s3.put_object(Bucket=self.bucket, Key=upload['fields']['key'], Body=self.content,
+                           ContentType='image/png')
+
+    def test_content_type(self):
+        uploaded = self.upload().json()['data']['image']
+        stored = self.s3.head_object(Bucket=self.bucket, Key=image.image_key('questions', uploaded['name']))
+        self.assertEqual(stored['ContentType'], 'image/png')
+
+    @override_settings(IMAGE_MULTIPART_THRESHOLD=5 * 1024 * 1024, IMAGE_MULTIPART_CHUNK_SIZE=5 * 1024 * 1024)
+    def test_multipart_upload(self):
+        content = os.urandom(11 * 1024 * 1024)
+        uploaded = self.upload(content).json()['data']['image']
+        key = image.image_key('questions', uploaded['name'])
+        self.assertEqual(self.stored(key), content)
+        # sent in three parts
+        self.assertTrue(self.s3.head_object(Bucket=self.bucket, Key=key)['ETag'].endswith('-3"'))
+
+
+class HotLookupIndexTests(TestCase):
+    """
+    The composite indexes of the hot lookups (see check_query_plans) exist,
+    make the single-column foreign key indexes redundant and are used.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sample = check_query_plans.Command().seed({
+            'subjects': 3, 'topics': 30, 'questions': 600, 'options': 4, 'examinations': 2, 'paper_size': 20,
+            'seed': 0})
+
+    def indexes(self, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return {name: constraint['columns'] for name, constraint in constraints.items()
+                if constraint['index'] and not constraint['unique'] and not constraint['primary_key']}
+
+    def test_indexes(self):
+        for table, name, columns in (
+            ('core_topics', 'core_topics_subject_idx', ['subject_id', '_id']),
+            ('core_questions', 'core_q_topic_level_idx', ['topic_id', 'difficulty_level', 'id']),
+            ('core_question_options', 'core_qopt_question_idx', ['for_question_id', 'id']),
+        ):
+            with self.subTest(table):
+                indexes = self.indexes(table)
+                self.assertEqual(indexes.get(name), columns)
+                self.assertNotIn([columns[0]], indexes.values())
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite')
+    def test_hot_queries_use_indexes(self):
+        for label, queryset in check_query_plans.hot_queries(self.sample):
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                details = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(label):
+                # an index scan reads "SCAN <table> USING [COVERING] INDEX ..."
+                self.assertEqual([
+                    detail for detail in details
+                    if detail.split(' ')[:2] in [['SCAN', table] for table in check_query_plans.CHECKED_TABLES]
+                    and 'USING' not in detail], [], details)
+
+    @skipUnless(connection.vendor == 'postgresql', 'query plans are checked on PostgreSQL')
+    def test_check_query_plans(self):
+        call_command('check_query_plans', subjects=3, topics=300, questions=20000, examinations=2, paper_size=20,
+                     stdout=open(os.devnull, 'w'))
+
+    def test_plan_scans(self):
+        plan = {'Node Type': 'Nested Loop', 'Plans': [
+            {'Node Type': 'Index Scan', 'Relation Name': 'core_questions', 'Index Name': 'core_q_topic_level_idx'},
+            {'Node Type': 'Seq Scan', 'Relation Name': 'core_topics'},
+        ]}
+        self.assertEqual(check_query_plans.plan_scans(plan), [
+            ('Index Scan', 'core_questions', 'core_q_topic_level_idx'),
+            ('Seq Scan', 'core_topics', None),
+        ])
+
+
+@skipUnless('mirror' in settings.DATABASES, 'the mirror database is added by core.test_runner')
+@override_settings(
+    DATABASE_REPLICAS=['mirror'],
+    DATABASE_ROUTERS=['core.routers.ReplicaRouter'],
+    REPLICA_STICKY_SECONDS=5,
+    REPLICA_VIEW_ROUTING={},
+)
+class ReplicaRouterTests(TransactionTestCase):
+    """
+    Routing through the `mirror` alias, a second connection to the test
+    database (see core.test_runner). Transaction tests, so that
+    what the primary connection writes is committed and seen by the mirror.
+    """
+    databases = {'default', 'mirror'}
+
+    def setUp(self):
+        routers.health._checked.clear()
+        self.admin = User.objects.create_superuser('admin@example.com', 'password')
+        self.other = User.objects.create_user('other@example.com', 'password')
+        self.client = self.client_for(self.admin)
+        self.other_client = self.client_for(self.other)
+        # fresh tokens read from the primary for a while, see test_new_token_sticky
+        get_cache().clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.header(issue_tokens(user)['token']))
+        return client
+
+    def header(self, token):
+        return '%s %s' % ('Bearer' if jwt_enabled() else 'Token', token)
+
+    def route(self, request):
+        """
+        Where `request` read from: 'primary', 'mirror' or 'both'.
+        """
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['mirror']) as mirror:
+            response = request()
+        self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+        reads = [name for name, queries in (('primary', primary), ('mirror', mirror))
+                 if any(query['sql'].startswith('SELECT') for query in queries)]
+        return 'both' if len(reads) == 2 else reads[0] if reads else None
+
+    def me(self, client=None):
+        return self.route(lambda: (client or self.client).get(reverse('users_profile')))
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.me(), 'mirror')
+
+    def test_unsafe_requests_stay_on_primary(self):
+        self.assertEqual(self.route(lambda: self.client.post(
+            reverse('subject_create'), {'_id': 'S01', 'name': 'Subject'}, format='json')), 'primary')
+
+    def test_sticky_after_write(self):
+        self.client.post(reverse('subject_create'), {'_id': 'S01', 'name': 'Subject'}, format='json')
+        self.assertEqual(self.me(), 'primary')
+        # other callers are not held back
+        self.assertEqual(self.me(self.other_client), 'mirror')
+
+    def test_sticky_expires(self):
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.client.post(reverse('subject_create'), {'_id': 'S01', 'name': 'Subject'}, format='json')
+        self.assertEqual(self.me(), 'mirror')
+
+    def test_new_token_sticky(self):
+        response = APIClient().post(reverse('register'), {
+            'email': 'new@example.com', 'password': 'Sup3r-secret-pass', 'first_name': 'New', 'middle_name': '',
+            'last_name': 'Candidate', 'contact': '9999999999'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.header(response.data['data']['token']))
+        self.assertEqual(self.me(client), 'primary')
+
+    def test_unhealthy_replica(self):
+        routers.health.mark_down('mirror')
+        self.assertEqual(self.me(), 'primary')
+
+    def test_unreachable_replica(self):
+        def request():
+            with mock.patch.object(connections['mirror'], 'ensure_connection', side_effect=DatabaseError):
+                return self.client.get(reverse('users_profile'))
+
+        self.assertEqual(self.route(request), 'primary')
+        # sits out until its next health check
+        self.assertFalse(routers.health.healthy('mirror'))
+
+    def test_view_routing(self):
+        with override_settings(REPLICA_VIEW_ROUTING={'users_profile': 'primary'}):
+            self.assertEqual(self.me(), 'primary')
+
+    def test_shared_cache_required(self):
+        self.assertEqual([error.id for error in check_replica_stickiness(None)], ['core.E001'])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}}):
+            self.assertEqual(check_replica_stickiness(None), [])
+
+
+class QuestionIndexTests(TestCase):
+    """
+    The in-memory question index follows committed writes only.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_taxonomy(subjects=1, topics=1, questions=1)
+        cls.topic = Topics.objects.get()
+
+    def setUp(self):
+        question_index.load()
+        self.addCleanup(question_index.invalidate)
+
+    def key(self, question):
+        return (question.topic_id, question.difficulty_level, question.marks_allotted)
+
+    def test_applied_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            question = Questions.objects.create(description='New', topic=self.topic, difficulty_level='LVL2')
+            key = self.key(question)
+            self.assertEqual(question_index.size(key), 0)
+        self.assertEqual(question_index.size(key), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            question.delete()
+        self.assertEqual(question_index.size(key), 0)
+
+
+
+class AdaptiveExaminationTests(TestCase):
+    """
+    Taking an adaptive examination one question at a time, through GET (the
+    question asked now) and POST (its answer).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_taxonomy(subjects=1, topics=1, questions=6)
+        cls.candidate = User.objects.create_user('candidate@example.com', 'password')
+        cls.examination = Examination.objects.create(exam_name='Adaptive', adaptive=True, adaptive_length=3)
+        cls.examination.questions.set(Questions.objects.all())
+
+    def setUp(self):
+        get_cache().clear()
+        item_banks.clear()
+        self.addCleanup(item_banks.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(self.candidate)
+        self.url = reverse('exam_adaptive', kwargs={'pk': self.examination.pk})
+
+    def take(self):
+        progress = self.client.get(self.url).data['data']
+        asked = []
+        while not progress['finished']:
+            question = progress['question']
+            asked.append(question['_id'])
+            # asking again gives the same question
+            self.assertEqual(self.client.get(self.url).data['data']['question']['_id'], question['_id'])
+            correct = QuestionOptions.objects.get(for_question=question['_id'], is_correct=True)
+            response = self.client.post(self.url, {'question': question['_id'], 'answer': [correct.pk]}, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            progress = response.data['data']
+        return asked, progress
+
+    def test_flow(self):
+        asked, progress = self.take()
+        self.assertEqual(len(set(asked)), 3)
+        self.assertEqual(progress['answered'], 3)
+        self.assertGreater(progress['ability'], 0)
+        result = ExaminationResult.objects.get(examination=self.examination, candidate=self.candidate)
+        self.assertIsNotNone(result.submitted_at)
+        self.assertEqual(sorted(result.answers), sorted(map(str, asked)))
+        response = self.client.post(self.url, {'question': asked[0], 'answer': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_question(self):
+        question = self.client.get(self.url).data['data']['question']['_id']
+        other = Questions.objects.exclude(pk=question).first()
+        response = self.client.post(self.url, {'question': other.pk, 'answer': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('question', response.data['reason'])
+
+    def test_uncached_paper(self):
+        # the paper is built per request when the cache keeps nothing
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            asked, progress = self.take()
+        self.assertEqual(progress['answered'], 3)
+
+
+class GradingTests(TestCase):
+    """
+    Attempts graded as option bitmasks against the answer key: marks, right,
+    wrong, partly right and unanswered questions, and the question counters.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_taxonomy(subjects=1, topics=1, questions=0)
+        topic = Topics.objects.get()
+        cls.examination = Examination.objects.create(exam_name='Graded', negative_marking=0.25)
+        cls.questions, cls.options = [], []
+        # correct options per question; the third has two, the fourth is never answered
+        for marks, correct in ((4, [0]), (2, [1]), (4, [0, 1]), (2, [2])):
+            question = Questions.objects.create(
+                description='Question', topic=topic, difficulty_level='LVL1', marks_allotted=marks)
+            cls.questions.append(question)
+            cls.options.append([
+                QuestionOptions.objects.create(for_question=question, description='Option %d' % o, is_correct=o in correct)
+                for o in range(3)
+            ])
+        cls.examination.questions.set(cls.questions)
+
+    def setUp(self):
+        answer_keys.clear()
+        self.addCleanup(answer_keys.clear)
+
+    def answers(self, *picked):
+        # (question, option positions) pairs as stored {question id: [option ids]}
+        return {str(self.questions[q].pk): [self.options[q][o].pk for o in positions] for q, positions in picked}
+
+    def grade(self, regrade=False):
+        submitted = timezone.now() - timedelta(hours=1)
+        results = {}
+        for name, answers in (
+            ('right', self.answers((0, [0]), (1, [1]), (2, [0, 1]))),
+            ('mixed', self.answers((0, [1]), (1, [1]), (2, [0]))),
+            ('wrong', self.answers((2, [0, 2]))),
+            ('blank', {}),
+        ):
+            candidate, _ = User.objects.get_or_create(email='%s@example.com' % name)
+            results[name], _ = ExaminationResult.objects.get_or_create(
+                examination=self.examination, candidate=candidate,
+                defaults={'answers': answers, 'submitted_at': submitted})
+        self.assertEqual(grade_examination(self.examination, regrade=regrade), 4)
+        return {
+            name: (result.score, result.correct_count, result.wrong_count, result.unanswered_count)
+            for name, result in ((name, ExaminationResult.objects.get(pk=result.pk)) for name, result in results.items())
+        }
+
+    def test_exact_answers(self):
+        self.assertEqual(self.grade(), {
+            'right': (10, 3, 0, 1),
+            # 2 marks, less a quarter of the 4 + 4 of the wrong ones
+            'mixed': (0, 1, 2, 1),
+            'wrong': (-1, 0, 1, 3),
+            'blank': (0, 0, 0, 4),
+        })
+
+    def test_partial_credit(self):
+        Examination.objects.filter(pk=self.examination.pk).update(partial_credit=True)
+        self.examination.refresh_from_db()
+        self.assertEqual(self.grade(), {
+            'right': (10, 3, 0, 1),
+            # half of the third question, not wrong
+            'mixed': (3, 1, 1, 1),
+            # a wrong option picked loses the credit
+            'wrong': (-1, 0, 1, 3),
+            'blank': (0, 0, 0, 4),
+        })
+
+    def test_question_counters(self):
+        self.grade()
+        # regraded attempts are not counted again
+        self.grade(regrade=True)
+        self.assertEqual(
+            [(question.attempt_count, question.correct_count)
+             for question in Questions.objects.filter(pk__in=[q.pk for q in self.questions]).order_by('pk')],
+            [(2, 1), (2, 2), (3, 1), (0, 0)])
+
+    def test_answer_key_retired(self):
+        key = answer_keys.get(self.examination)
+        self.assertIs(answer_keys.get(self.examination), key)
+        # what another worker's committed change does here
+        bump_counter(generation_key(self.examination.pk))
+        reloaded = answer_keys.get(self.examination)
+        self.assertIsNot(reloaded, key)
+        self.assertIs(answer_keys.get(self.examination), reloaded)
+        # and where the counter is not shared, keys expire
+        # PAPER_SNAPSHOT_TIMEOUT after they were loaded
+        bump_counter(generation_key(self.examination.pk))
+        with override_settings(PAPER_SNAPSHOT_TIMEOUT=0):
+            expired = answer_keys.get(self.examination)
+        self.assertIsNot(answer_keys.get(self.examination), expired)
+
+
+
+@override_settings(SHUFFLE_SECRET='shuffle tests')
+class ShuffledPaperTests(TestCase):
+    """
+    Shuffled papers: every candidate gets their own, stable order and
+    answers with displayed option positions on the paper's version.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_taxonomy(subjects=1, topics=1, questions=6)
+        cls.candidates = [User.objects.create_user('candidate%d@example.com' % n, 'password') for n in range(2)]
+        cls.examination = Examination.objects.create(exam_name='Shuffled', shuffle=True)
+        cls.examination.questions.set(Questions.objects.all())
+
+    def setUp(self):
+        get_cache().clear()
+        self.clients = []
+        for candidate in self.candidates:
+            client = APIClient()
+            client.force_authenticate(candidate)
+            self.clients.append(client)
+
+    def paper(self, client):
+        response = client.get(reverse('exam_paper', kwargs={'pk': self.examination.pk}))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['data']['examination']
+
+    def submit(self, client, answers, version):
+        return client.post(reverse('exam_submit', kwargs={'pk': self.examination.pk}),
+                           {'answers': answers, 'version': version}, format='json')
+
+    def order(self, paper):
+        return [(question['_id'], [option['description'] for option in question['options']])
+                for question in paper['questions']]
+
+    def test_order_per_candidate(self):
+        first = self.order(self.paper(self.clients[0]))
+        self.assertEqual(self.order(self.paper(self.clients[0])), first)
+        # rebuilt from scratch, as in another worker
+        get_cache().clear()
+        self.assertEqual(self.order(self.paper(self.clients[0])), first)
+        other = self.order(self.paper(self.clients[1]))
+        self.assertNotEqual(other, first)
+        # the same questions and options, in another order
+        self.assertEqual(sorted((pk, sorted(options)) for pk, options in other),
+                         sorted((pk, sorted(options)) for pk, options in first))
+
+    def test_positions_map_to_options(self):
+        paper = self.paper(self.clients[0])
+        # the last option shown for every question
+        answers = {str(question['_id']): [len(question['options']) - 1] for question in paper['questions']}
+        shown = {question['_id']: question['options'][-1]['description'] for question in paper['questions']}
+        self.assertEqual(self.submit(self.clients[0], answers, paper['version']).status_code, 202)
+        result = ExaminationResult.objects.get(examination=self.examination, candidate=self.candidates[0])
+        self.assertEqual(
+            {int(question_id): QuestionOptions.objects.get(pk=option_id).description
+             for question_id, (option_id,) in result.answers.items()},
+            shown)
+
+    def test_stale_version(self):
+        paper = self.paper(self.clients[0])
+        question = Questions.objects.get(pk=paper['questions'][0]['_id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionOptions.objects.create(for_question=question, description='Option 4', is_correct=False)
+        answers = {str(question.pk): [0]}
+        response = self.submit(self.clients[0], answers, paper['version'])
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('version', response.data['reason'])
+        current = self.paper(self.clients[0])['version']
+        self.assertNotEqual(current, paper['version'])
+        self.assertEqual(self.submit(self.clients[0], answers, current).status_code, 202)
+
+
+class JWTAuthenticationTests(TestCase):
+    """
+    Access tokens verified from their claims and the cached denylist,
+    whichever AUTH_TOKEN_MODE the views run in.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('candidate@example.com', 'password')
+
+    def setUp(self):
+        get_cache().clear()
+        tokens = override_settings(AUTH_TOKEN_MODE='jwt')
+        tokens.enable()
+        self.addCleanup(tokens.disable)
+
+    def authenticate(self, raw_token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Bearer %s' % raw_token)
+        return StatelessJWTAuthentication().authenticate(request)
+
+    def test_claims_user(self):
+        tokens = issue_tokens(self.user)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(tokens['token'])
+        self.assertEqual((user.id, user.email, user.is_staff), (self.user.pk, self.user.email, False))
+
+    def test_revoked_token(self):
+        revoked, kept = issue_tokens(self.user), issue_tokens(self.user)
+        revoke_raw_token(revoked['token'])
+        with self.assertRaises(InvalidToken):
+            self.authenticate(revoked['token'])
+        self.assertEqual(self.authenticate(kept['token'])[0].id, self.user.pk)
+
+    def test_revoked_user(self):
+        tokens = issue_tokens(self.user)
+        # every token issued so far, access and refresh
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(InvalidToken):
+            self.authenticate(tokens['token'])
+        with self.assertRaises(AuthenticationFailed):
+            refresh_tokens(tokens['refresh'])
+
+    def test_refreshed_token(self):
+        tokens = issue_tokens(self.user)
+        fresh = refresh_tokens(tokens['refresh'])
+        self.assertEqual(self.authenticate(fresh['token'])[0].id, self.user.pk)
+        # a refresh token is spent once used
+        with self.assertRaises(AuthenticationFailed):
+            refresh_tokens(tokens['refresh'])
+        with self.assertRaises(InvalidToken):
+            refresh_tokens(tokens['token'])
+
+    @skipUnless(jwt_enabled(), 'the views authenticate DRF tokens')
+    def test_logout(self):
+        tokens = issue_tokens(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % tokens['token'])
+        self.assertEqual(client.get(reverse('users_profile')).status_code, 200)
+        response = client.post(reverse('logout'), {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get(reverse('users_profile')).status_code, 401)
+        response = APIClient().post(reverse('token-refresh'), {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+@skipUnless(not jwt_enabled(), 'AUTH_TOKEN_MODE is jwt')
+class TokenAuthenticationTests(TestCase):
+    """
+    The default 'token' mode: one stored DRF token per user, deleted on logout.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('candidate@example.com', 'password')
+
+    def setUp(self):
+        get_cache().clear()
+
+    def login(self):
+        response = APIClient().post(reverse('login'), {'email': self.user.email, 'password': 'password'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['data']
+
+    def test_login_logout(self):
+        tokens = self.login()
+        self.assertNotIn('refresh', tokens)
+        self.assertEqual(tokens['token'], Token.objects.get(user=self.user).key)
+        self.assertEqual(self.login()['token'], tokens['token'])
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token %s' % tokens['token'])
+        response = client.get(reverse('users_profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['token'], tokens['token'])
+        self.assertEqual(client.post(reverse('logout')).status_code, 200)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(client.get(reverse('users_profile')).status_code, 401)